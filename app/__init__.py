@@ -3,6 +3,10 @@ from flask_cors import CORS
 import os
 
 def create_app():
+    # Structured, non-blocking logging for every `app.*` logger (LOG_LEVEL, LOG_FORMAT)
+    from app.services import structured_logging
+    structured_logging.configure_logging()
+
     # Create the Flask app
     app = Flask(__name__, static_folder="../static", template_folder="../frontend")
     app.config["ENV"] = os.getenv("FLASK_ENV", "production")  # Defaults to 'production'
@@ -10,13 +14,31 @@ def create_app():
     # Enable CORS
     CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}})
 
+    # Request ids on every log record and in the X-Request-ID response header
+    structured_logging.init_app(app)
+
     # Register Blueprints
     from app.routes.query import query_bp
     from app.routes.static_files import static_bp
     from app.routes.qdrant_routes import qdrant_bp
+    from app.routes.metrics import metrics_bp
 
     app.register_blueprint(query_bp)
     app.register_blueprint(static_bp)
     app.register_blueprint(qdrant_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Start mirroring the query collections in memory (only when LOCAL_INDEX_ENABLED is set)
+    from app.routes.query import FAQ_COLLECTION, DETAILS_COLLECTION
+    from app.services.qdrant_service import warm_local_indexes
+    warm_local_indexes([FAQ_COLLECTION, DETAILS_COLLECTION])
+
+    # Load the embedding model now rather than inside the first query (EMBEDDING_WARMUP)
+    from app.services import embedding_model
+    embedding_model.warm_up()
+
+    # Load the context tokenizer too, which tiktoken fetches on first use
+    from app.services import context_builder
+    context_builder.warm_up()
 
     return app
\ No newline at end of file
@@ -0,0 +1,434 @@
+"""
+Async serving mode.
+
+`/query` and `/query/stream` are served by native async handlers: moderation
+and chat use AsyncOpenAI, search uses the async Qdrant client, Supabase is
+called through its async client and embedding runs off the event loop, so a
+single process keeps hundreds of conversations in flight while they wait on
+the network. Every other route is served by the Flask app through an ASGI
+adapter.
+
+Run with: uvicorn app.asgi:application --workers 2
+"""
+import asyncio
+import json
+import logging
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from app.routes import query as query_routes
+from app.routes.query import (
+    FAQ_COLLECTION, DETAILS_COLLECTION, identity_from_headers, format_hits, cached_retrieval,
+    cache_answer, sse_event, history_store, answer_cache, flagged_categories, top_answer, fallback_answer,
+    deadline_exceeded_error, with_context_stats
+)
+from app.services.embedding_service import agenerate_embedding
+from app.services.embedding_model import is_warming, wait_for_warmup
+from app.services.qdrant_service import asearch_with_fallback
+from app.services.llm_service import aget_llm_response, astream_llm_response
+from app.services.toxicity_checker_service import ToxicityChecker
+from app.services.supabase_logging import AsyncSupabaseLogger
+from app.services.metrics import span, request_timer, current_timer, DEGRADATIONS
+from app.services.deadline import (
+    DeadlineExceeded, current_deadline, deadline_scope, allows, await_result, DEADLINE_LLM_RESERVE, DEADLINE_SYNC_RESERVE
+)
+from app.services.structured_logging import request_context, request_id, REQUEST_ID_HEADER
+
+log = logging.getLogger(__name__)
+
+# Shares the background interaction writer (SUPABASE_LOG_ASYNC) with the Flask routes
+async_logger = AsyncSupabaseLogger(writer=query_routes.logger.writer)
+
+
+class HTTPRequest:
+    """The parts of an ASGI HTTP request the query handlers need."""
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]
+        }
+        self.body = body
+
+    def header(self, name):
+        return self.headers.get(name.lower())
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"null")
+        except ValueError:
+            return None
+
+    def metadata(self):
+        """Request details stored alongside each logged interaction."""
+        client = self.scope.get("client")
+        return {
+            "ip": client[0] if client else None,
+            "user_agent": self.header("User-Agent")
+        }
+
+
+class HeaderView:
+    """Case-insensitive `get` over request headers, like Flask's `request.headers`."""
+
+    def __init__(self, request):
+        self.request = request
+
+    def get(self, name):
+        return self.request.header(name)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def response_headers(request, content_type, extra=()):
+    headers = [(b"content-type", content_type.encode())]
+    if request_id():
+        headers.append((REQUEST_ID_HEADER.lower().encode(), request_id().encode()))
+    origin = request.header("Origin")
+    if origin:
+        # Same policy as flask_cors in create_app: any origin, with credentials
+        headers += [(b"access-control-allow-origin", origin.encode()), (b"access-control-allow-credentials", b"true")]
+    return headers + list(extra)
+
+
+async def send_json(send, request, data, status=200):
+    await send({"type": "http.response.start", "status": status,
+                "headers": response_headers(request, "application/json")})
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+async def aretrieve_context(user_query, use_answer_cache=False):
+    """Async `retrieve_context`."""
+    with span("embedding"):
+        query_vector = await agenerate_embedding(user_query)
+
+    if use_answer_cache:
+        with span("answer_cache"):
+            cached = answer_cache.lookup(query_vector)
+        if cached:
+            return cached_retrieval(query_vector, cached)
+
+    search_results, source_collection = await asearch_with_fallback(
+        query_vector, FAQ_COLLECTION, DETAILS_COLLECTION
+    )
+    relevant_chunks, context, context_stats = format_hits(search_results, source_collection)
+    return {
+        "query_vector": query_vector,
+        "relevant_chunks": relevant_chunks,
+        "context": context,
+        "source": source_collection,
+        "cached_answer": None,
+        "top_answer": top_answer(search_results, source_collection),
+        "context_stats": context_stats
+    }
+
+
+async def amoderate_and_retrieve(user_query, use_answer_cache=False):
+    """Async `moderate_and_retrieve`: retrieval is cancelled as soon as the query is flagged."""
+    retrieval = asyncio.ensure_future(aretrieve_context(user_query, use_answer_cache))
+    with span("moderation_input"):
+        is_toxic, categories = await ToxicityChecker.acheck_toxicity(user_query)
+    if is_toxic:
+        retrieval.cancel()
+        return is_toxic, categories, None
+    try:
+        return is_toxic, categories, await await_result(retrieval, "retrieval")
+    except DeadlineExceeded:
+        DEGRADATIONS.labels("retrieval", "failed").inc()
+        raise
+
+
+async def prepare_query(request):
+    """
+    Shared start of both handlers: identity, history, validation, moderation
+    and retrieval. Returns (error response or None, state dict).
+    """
+    user_id, session_id = identity_from_headers(HeaderView(request))
+    # The sqlite backend blocks on disk (and on other workers' writes); keep it off the loop
+    chat_history = await asyncio.to_thread(history_store.get, session_id)
+    use_answer_cache = not chat_history
+
+    data = request.json()
+    if not data or "user_query" not in data:
+        return ({"error": "Invalid or missing JSON payload."}, 400), None
+
+    user_query = (data.get("user_query") or "").strip()
+    if not user_query:
+        return ({"error": "Query cannot be empty.", "error_code": "EMPTY_QUERY"}, 400), None
+
+    is_toxic, categories, retrieval = await amoderate_and_retrieve(user_query, use_answer_cache)
+    if is_toxic:
+        log.info("Query flagged by moderation.", extra={"categories": flagged_categories(categories)})
+        return ({"answer": "Your query contains inappropriate content and cannot be processed."}, 200), None
+
+    if not retrieval["relevant_chunks"]:
+        return ({"error": "No relevant information found."}, 404), None
+
+    return None, {
+        "user_id": user_id,
+        "session_id": session_id,
+        "chat_history": chat_history,
+        "use_answer_cache": use_answer_cache,
+        "user_query": user_query,
+        "retrieval": retrieval,
+        "metadata": with_context_stats(request.metadata(), retrieval),
+    }
+
+
+async def moderate_reply(state, llm_reply):
+    """Output moderation; caches a clean reply when the answer cache applies."""
+    with span("moderation_output"):
+        is_toxic, categories = await ToxicityChecker.acheck_toxicity(llm_reply, reply=True)
+    if is_toxic:
+        log.warning("Response flagged by moderation.", extra={"categories": flagged_categories(categories)})
+        return "The generated response was flagged as inappropriate. Please try again.", True
+    if state["use_answer_cache"]:
+        cache_answer(state["retrieval"], llm_reply)
+    return llm_reply, False
+
+
+async def session_upkeep(user_id, session_id):
+    with span("session"):
+        return await async_logger.get_or_create_session(user_id=user_id, session_id=session_id)
+
+
+async def agenerate_answer(state, usage):
+    """Async `generate_answer`: (reply, degraded)."""
+    retrieval = state["retrieval"]
+    if not allows(DEADLINE_LLM_RESERVE):
+        return fallback_answer(retrieval), True
+    try:
+        with span("llm"):
+            return await aget_llm_response(
+                query=state["user_query"], context=retrieval["context"], chat_history=state["chat_history"],
+                usage=usage
+            ), False
+    except DeadlineExceeded:
+        return fallback_answer(retrieval), True
+
+
+async def afinish_session(session_task, session_id):
+    """Async `finish_session`; a late session task keeps running in the background."""
+    try:
+        return await await_result(session_task, "session", reserve=DEADLINE_SYNC_RESERVE, cancel=False)
+    except DeadlineExceeded:
+        DEGRADATIONS.labels("session", "background").inc()
+        log.warning("Session upkeep is running late; finishing it in the background.")
+        return session_id
+
+
+# Interactions logged after the response; referenced until done so they are not garbage collected
+background_tasks = set()
+
+
+async def alog_interaction(session_task, **interaction):
+    """Async `log_interaction`: awaited while time is left, otherwise left to a background task."""
+    async def log_interaction():
+        await async_logger.log_interaction(session_id=await session_task, **interaction)
+
+    if session_task.done() and allows(DEADLINE_SYNC_RESERVE):
+        with span("logging"):
+            return await log_interaction()
+
+    DEGRADATIONS.labels("logging", "background").inc()
+
+    async def log_in_background():
+        try:
+            await log_interaction()
+        except Exception as e:
+            log.error("Error logging interaction in the background: %s", e, exc_info=True)
+
+    task = asyncio.ensure_future(log_in_background())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def handle_query(request, send):
+    error, state = await prepare_query(request)
+    if error:
+        return await send_json(send, request, error[0], error[1])
+
+    user_id, user_query, retrieval = state["user_id"], state["user_query"], state["retrieval"]
+    cached_answer = retrieval["cached_answer"]
+    session_task = asyncio.ensure_future(session_upkeep(user_id, state["session_id"]))
+
+    degraded = False
+    if cached_answer is None:
+        llm_usage = {}
+        llm_reply, degraded = await agenerate_answer(state, llm_usage)
+        state["metadata"]["llm_usage"] = llm_usage
+        if degraded:
+            state["metadata"]["degraded"] = "faq_answer"
+    else:
+        llm_reply = cached_answer
+
+    await asyncio.to_thread(history_store.append, state["session_id"], user_query, llm_reply)
+    session_id = await afinish_session(session_task, state["session_id"])
+    logged_reply = llm_reply
+
+    if cached_answer is None and not degraded:
+        llm_reply, _ = await moderate_reply(state, llm_reply)
+
+    # Logged once the answer is final, so the record holds the whole request's timings
+    await alog_interaction(
+        session_task,
+        user_id=user_id,
+        prompt=user_query,
+        response=logged_reply,
+        source_pdf=retrieval["source"],
+        metadata=state["metadata"],
+        timings=current_timer.get().timings()
+    )
+
+    await send_json(send, request, {
+        "user_id": user_id,
+        "session_id": session_id,
+        "query": user_query,
+        "answer": llm_reply,
+        "context": retrieval["relevant_chunks"],
+        "source": retrieval["source"],
+        "cached": cached_answer is not None,
+        "degraded": degraded
+    })
+
+
+async def handle_query_stream(request, send):
+    error, state = await prepare_query(request)
+    if error:
+        return await send_json(send, request, error[0], error[1])
+
+    user_id, user_query, retrieval = state["user_id"], state["user_query"], state["retrieval"]
+    cached_answer = retrieval["cached_answer"]
+    session_task = asyncio.ensure_future(session_upkeep(user_id, state["session_id"]))
+
+    async def emit(event, data):
+        await send({"type": "http.response.body", "body": sse_event(event, data).encode(), "more_body": True})
+
+    await send({"type": "http.response.start", "status": 200, "headers": response_headers(
+        request, "text/event-stream", [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+    )})
+    await emit("meta", {
+        "user_id": user_id,
+        "session_id": state["session_id"],
+        "query": user_query,
+        "context": retrieval["relevant_chunks"],
+        "source": retrieval["source"],
+        "cached": cached_answer is not None
+    })
+
+    completed = {}
+    degraded = False
+    try:
+        if cached_answer is not None:
+            await emit("token", {"delta": cached_answer})
+            llm_reply, flagged = cached_answer, False
+            await asyncio.to_thread(history_store.append, state["session_id"], user_query, llm_reply)
+        elif not allows(DEADLINE_LLM_RESERVE):
+            llm_reply, flagged, degraded = fallback_answer(retrieval), False, True
+            state["metadata"]["degraded"] = "faq_answer"
+            await emit("token", {"delta": llm_reply})
+            await asyncio.to_thread(history_store.append, state["session_id"], user_query, llm_reply)
+        else:
+            parts = []
+            llm_usage = {}
+            deadline = current_deadline.get()
+            try:
+                with span("llm"):
+                    async for delta in astream_llm_response(
+                        query=user_query, context=retrieval["context"], chat_history=state["chat_history"],
+                        usage=llm_usage
+                    ):
+                        parts.append(delta)
+                        await emit("token", {"delta": delta})
+                        if deadline is not None and deadline.expired():
+                            raise DeadlineExceeded("llm")
+            except DeadlineExceeded:
+                if not parts:
+                    raise
+                DEGRADATIONS.labels("llm", "truncated").inc()
+                degraded = True
+                state["metadata"]["degraded"] = "truncated"
+                state["use_answer_cache"] = False
+            llm_reply = "".join(parts).strip()
+            state["metadata"]["llm_usage"] = llm_usage
+            await asyncio.to_thread(history_store.append, state["session_id"], user_query, llm_reply)
+            llm_reply, flagged = await moderate_reply(state, llm_reply)
+
+        session_id = await afinish_session(session_task, state["session_id"])
+        completed.update(response=llm_reply, timings=current_timer.get().timings())
+        await emit("done", {
+            "user_id": user_id, "session_id": session_id, "answer": llm_reply, "flagged": flagged,
+            "degraded": degraded
+        })
+    except DeadlineExceeded as e:
+        await emit("error", deadline_exceeded_error(e))
+    except Exception as e:
+        log.error("Error during streamed query processing: %s", e, exc_info=True)
+        await emit("error", {"error": f"Internal server error: {str(e)}"})
+    await send({"type": "http.response.body", "body": b""})
+
+    # Logged once the client has the whole answer
+    if completed:
+        try:
+            await alog_interaction(
+                session_task,
+                user_id=user_id,
+                prompt=user_query,
+                response=completed["response"],
+                source_pdf=retrieval["source"],
+                metadata=state["metadata"],
+                timings=completed["timings"]
+            )
+        except Exception as e:
+            log.error("Error logging streamed interaction: %s", e, exc_info=True)
+
+ASYNC_ROUTES = {
+    ("POST", "/query"): ("query", handle_query),
+    ("POST", "/query/stream"): ("query_stream", handle_query_stream),
+}
+
+
+def create_asgi_app(flask_app=None):
+    """ASGI application: async query routes, everything else through the Flask app."""
+    wsgi_app = WsgiToAsgi(flask_app or create_app())
+
+    async def application(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await asyncio.to_thread(wait_for_warmup)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        route = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None:
+            return await wsgi_app(scope, receive, send)
+
+        name, handler = route
+        request = HTTPRequest(scope, await read_body(receive))
+        # Servers without lifespan events may route a query before the model is loaded
+        if is_warming():
+            await asyncio.to_thread(wait_for_warmup)
+        with request_context(request.header(REQUEST_ID_HEADER)), deadline_scope():
+            try:
+                with request_timer(name):
+                    await handler(request, send)
+            except DeadlineExceeded as e:
+                await send_json(send, request, deadline_exceeded_error(e), 504)
+            except Exception as e:
+                log.error("Error during query processing: %s", e, exc_info=True)
+                await send_json(send, request, {"error": f"Internal server error: {str(e)}"}, 500)
+
+    return application
+
+
+application = create_asgi_app()
@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.services.metrics import render_metrics, stats_collector
+from app.services.semantic_cache import answer_cache
+from app.services.embedding_cache import query_embedding_cache
+from app.services.toxicity_checker_service import moderation
+from app.services.llm_service import llm_usage
+from app.services.local_index import local_indexes
+import hmac
+import os
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Bearer token a scraper must send; /metrics is not served while it is unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+stats_collector.register("answer_cache", answer_cache.stats)
+stats_collector.register("embedding_cache", query_embedding_cache.stats)
+stats_collector.register("moderation_cache", moderation.cache.stats)
+stats_collector.register("moderation", moderation.stats)
+stats_collector.register("llm_usage", llm_usage.stats)
+stats_collector.register("local_index", local_indexes.stats)
+
+def require_metrics_token():
+    """
+    Error response unless the request sends `Authorization: Bearer <METRICS_TOKEN>`
+    (404 when no token is configured, so internal stats are never public by
+    default); None when it may see them.
+    """
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found."}), 404
+    sent = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(sent.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return jsonify({"error": "Unauthorized."}), 401, {"WWW-Authenticate": "Bearer"}
+    return None
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics: stage and end-to-end latency histograms, retrieval
+    sources (FAQ fallback rate), cache hit/miss counts, moderation decisions
+    and LLM token counts. Requires the METRICS_TOKEN bearer token.
+    """
+    denied = require_metrics_token()
+    if denied:
+        return denied
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
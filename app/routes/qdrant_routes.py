@@ -1,9 +1,8 @@
 from flask import Blueprint, request, jsonify, render_template
 from werkzeug.utils import secure_filename
 import os
-from app.services.pdf_service import extract_qa_from_pdf, chunk_text, extract_text_from_pdf
-from app.services.qdrant_service import upload_qa_to_qdrant, upload_chunks_to_qdrant
-from app.services.embedding_service import embedder  # Ensure this exists and provides embeddings
+import uuid
+from app.services.ingestion_jobs import job_runner, get_job_store, DocumentBusy
 from app.scripts.ingest_manual import insert_manual_override
 from dotenv import load_dotenv
 
@@ -18,52 +17,57 @@ def upload_page():
     """Serves the HTML page for uploading PDFs."""
     return render_template("upload_pdf.html")
 
-@qdrant_bp.route("/upload/qa", methods=["POST"])
-def upload_qa_pdf():
-    """Handles PDF uploads, extracts Q&A pairs, and stores them in Qdrant."""
+def enqueue_upload(kind, default_collection):
+    """Saves the uploaded PDF and queues its ingestion; returns the 202 response."""
     if 'file' not in request.files:
         return jsonify({"error": "No file provided."}), 400
     
     file = request.files['file']
-    collection_name = request.form.get('collection_name', os.getenv('FAQ_COLLECTION'))  # Allow custom collection name
+    collection_name = request.form.get('collection_name', os.getenv(default_collection))  # Allow custom collection name
     
     if file.filename == '':
         return jsonify({"error": "No selected file."}), 400
     
     filename = secure_filename(file.filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    # Saved under a unique name so a re-upload cannot overwrite a file a running job is reading
+    filepath = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
     file.save(filepath)
     
     pdf_id = filename  # Using filename as unique identifier
-    qa_pairs = extract_qa_from_pdf(filepath)
-    
-    upload_qa_to_qdrant(qa_pairs, pdf_id, collection_name, embedder)
+    try:
+        job_id = job_runner.submit(kind, filename, filepath, pdf_id, collection_name)
+    except DocumentBusy as e:
+        # One job per document at a time; the client can follow the active one
+        os.remove(filepath)
+        return jsonify({
+            "error": str(e),
+            "job_id": e.job_id,
+            "status_url": f"{qdrant_bp.url_prefix}/jobs/{e.job_id}"
+        }), 409
     
-    return jsonify({"message": f"Q&A pairs from '{filename}' processed and uploaded to Qdrant collection '{collection_name}'."})
+    return jsonify({
+        "message": f"'{filename}' queued for upload to Qdrant collection '{collection_name}'.",
+        "job_id": job_id,
+        "status_url": f"{qdrant_bp.url_prefix}/jobs/{job_id}"
+    }), 202
+
+@qdrant_bp.route("/upload/qa", methods=["POST"])
+def upload_qa_pdf():
+    """Queues a PDF for Q&A pair extraction and upload to Qdrant."""
+    return enqueue_upload("qa", 'FAQ_COLLECTION')
 
 @qdrant_bp.route("/upload/text", methods=["POST"])
 def upload_text_pdf():
-    """Handles PDF uploads, extracts raw text, splits into chunks, and stores them in Qdrant."""
-    if 'file' not in request.files:
-        return jsonify({"error": "No file provided."}), 400
-    
-    file = request.files['file']
-    collection_name = request.form.get('collection_name', os.getenv('DETAILS_COLLECTION'))  # Allow custom collection name
-    
-    if file.filename == '':
-        return jsonify({"error": "No selected file."}), 400
-    
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
-    
-    pdf_id = filename  # Using filename as unique identifier
-    text = extract_text_from_pdf(filepath)
-    text_chunks = chunk_text(text)
-    
-    upload_chunks_to_qdrant(text_chunks, pdf_id, collection_name, embedder)
-    
-    return jsonify({"message": f"Raw text from '{filename}' processed and uploaded to Qdrant collection '{collection_name}'."})
+    """Queues a PDF for raw text extraction, chunking and upload to Qdrant."""
+    return enqueue_upload("text", 'DETAILS_COLLECTION')
+
+@qdrant_bp.route("/jobs/<job_id>", methods=["GET"])
+def ingestion_job_status(job_id):
+    """Reports an ingestion job's stage, pages processed, point counts, elapsed time and error."""
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job)
 
 @qdrant_bp.post("/seed/manual-override")
 def seed_manual_override():
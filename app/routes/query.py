@@ -1,12 +1,28 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from app.services.qdrant_service import search_with_fallback
 from app.services.embedding_service import generate_embedding
+from app.services.embedding_model import after_warmup
 from app.services.supabase_logging import SupabaseLogger
-from app.services.llm_service import get_llm_response
-from app.services.toxicity_checker_service import ToxicityChecker
+from app.services.llm_service import get_llm_response, stream_llm_response, llm_usage as llm_usage_stats
+from app.services.toxicity_checker_service import ToxicityChecker, moderation
+from app.services import pipeline_service
+from app.services.history_store import create_history_store
+from app.services.semantic_cache import answer_cache
+from app.services.local_index import local_indexes
+from app.services.context_builder import build_context
+from app.services.metrics import span, timed, timed_request, use_timer, current_timer, RETRIEVALS, CONTEXT_TOKENS, DEGRADATIONS
+from app.services.deadline import (
+    DeadlineExceeded, current_deadline, use_deadline, with_deadline, allows, stage_result,
+    DEADLINE_LLM_RESERVE, DEADLINE_SYNC_RESERVE
+)
+from app.services import structured_logging
+from app.services.structured_logging import current_request, use_request_context
+from app.routes.metrics import require_metrics_token
 from dotenv import load_dotenv
 from flask import Blueprint, render_template, current_app
 import uuid
+import json
+import logging
 import os
 
 # os.environ.clear
@@ -15,11 +31,13 @@ load_dotenv()
 
 query_bp = Blueprint('query', __name__)
 
+log = logging.getLogger(__name__)
+
 # Initialize Supabase logger
 logger = SupabaseLogger()
 
-# Initialize a dictionary to store chat history for each session
-chat_histories = {}
+# Bounded chat history per session (in-memory LRU or a store shared between workers)
+history_store = create_history_store()
 
 FAQ_COLLECTION = "faq_vectors"
 DETAILS_COLLECTION = "details_vectors"
@@ -45,35 +63,288 @@ def get_base_urls():
 def index():
     # Call the utility function to get the URLs
     script_base_url, base_url = get_base_urls()
-    print(f"[DEBUG]: script_base_url: {script_base_url}\nbase_url: {base_url}")
+    log.debug("Rendering index (script_base_url=%s, base_url=%s)", script_base_url, base_url)
     return render_template("index.html", script_base_url=script_base_url, base_url=base_url)
 
 @query_bp.route("/debug")
 def debug():
+    # Same internal stats as /metrics, so the same bearer token guards them
+    denied = require_metrics_token()
+    if denied:
+        return denied
     # Call the same utility function to get the URLs
     script_base_url, base_url = get_base_urls()
     return jsonify({
         "ENV": current_app.config.get("ENV"),
         "script_base_url": script_base_url,
-        "base_url": base_url
+        "base_url": base_url,
+        "chat_history": history_store.stats(),
+        "answer_cache": answer_cache.stats(),
+        "local_index": local_indexes.stats(),
+        "llm_usage": llm_usage_stats.stats(),
+        "moderation": moderation.stats(),
+        "logging": structured_logging.stats()
     })
 
+def resolve_identity():
+    """Reads user and session ids from the request headers, generating new ones when missing."""
+    return identity_from_headers(request.headers)
+
+def identity_from_headers(headers):
+    """User and session ids from `X-User-ID` / `X-Session-ID`, generating new ones when missing."""
+    user_id = headers.get("X-User-ID")
+    if user_id in [None, 'null']:
+        user_id = str(uuid.uuid4())
+
+    session_id = headers.get("X-Session-ID")
+    if session_id in [None, 'null']:
+        session_id = str(uuid.uuid4())
+
+    return user_id, session_id
+
+def retrieve_context(user_query, use_answer_cache=False, cancel_event=None):
+    """
+    Embeds the query, searches Qdrant with the FAQ-first fallback and formats the hits.
+
+    With `use_answer_cache`, a semantically matching cached answer is returned
+    instead of searching. Runs as a cancellable pipeline stage: when
+    `cancel_event` is set after the embedding step (e.g. input moderation
+    flagged the query) the search is skipped.
+
+    Returns:
+        dict: `query_vector`, `relevant_chunks` (empty when nothing was found),
+        `context` (the token-budgeted LLM context), `source`, `cached_answer`
+        (None unless the answer cache hit) and `context_stats`.
+        None if the stage was cancelled.
+    """
+    # Generate embedding (vector) for the query
+    with span("embedding"):
+        query_vector = generate_embedding(user_query)
+
+    if cancel_event is not None and cancel_event.is_set():
+        log.debug("Retrieval cancelled before search.")
+        return None
+
+    if use_answer_cache:
+        with span("answer_cache"):
+            cached = answer_cache.lookup(query_vector)
+        if cached:
+            return cached_retrieval(query_vector, cached)
+
+    # Perform search with fallback
+    search_results, source_collection = search_with_fallback(
+        query_vector, FAQ_COLLECTION, DETAILS_COLLECTION
+    )
+
+    relevant_chunks, context, context_stats = format_hits(search_results, source_collection)
+    return {
+        "query_vector": query_vector,
+        "relevant_chunks": relevant_chunks,
+        "context": context,
+        "source": source_collection,
+        "cached_answer": None,
+        "top_answer": top_answer(search_results, source_collection),
+        "context_stats": context_stats
+    }
+
+def cached_retrieval(query_vector, cached):
+    """Retrieval result for an answer-cache hit."""
+    log.debug("Answer cache hit (similarity %.3f).", cached["similarity"])
+    RETRIEVALS.labels("answer_cache").inc()
+    return {
+        "query_vector": query_vector,
+        "relevant_chunks": cached["context"],
+        "context": "\n\n".join(cached["context"]),
+        "source": cached["source"],
+        "cached_answer": cached["answer"],
+        "top_answer": None,
+        "context_stats": None
+    }
+
+def format_hits(search_results, source_collection):
+    """
+    Formats search hits for the client and the LLM.
+
+    Returns:
+        tuple: (scored chunks returned to the client, token-budgeted LLM context, context stats)
+    """
+    relevant_chunks = []
+    for result in search_results or []:
+        if source_collection == FAQ_COLLECTION:
+            question = result.payload.get("question", "No question found")
+            answer = result.payload.get("answer", "No answer found")
+            score = result.score
+            relevant_chunks.append(f"Question: {question}\nAnswer: {answer}\nScore: {score}")
+        elif source_collection == DETAILS_COLLECTION:
+            text = result.payload.get("text", "No text found")
+            score = result.score
+            relevant_chunks.append(f"Text: {text}\nScore: {score}")
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "Formatted %d hits from %s.", len(relevant_chunks), source_collection,
+            extra={"scores": [round(result.score, 4) for result in search_results or []]}
+        )
+
+    # The LLM gets merged, de-duplicated passages packed into the token budget
+    with span("context"):
+        context, context_stats = build_context(search_results or [], baseline="\n\n".join(relevant_chunks))
+    RETRIEVALS.labels(source_collection).inc()
+    CONTEXT_TOKENS.labels("sent").inc(context_stats["tokens"])
+    CONTEXT_TOKENS.labels("saved").inc(max(context_stats["tokens_saved"], 0))
+    return relevant_chunks, context, context_stats
+
+def top_answer(search_results, source_collection):
+    """Answer of the best FAQ hit (the reply when the LLM cannot answer in time), or None."""
+    if source_collection != FAQ_COLLECTION or not search_results:
+        return None
+    return search_results[0].payload.get("answer")
+
+def fallback_answer(retrieval):
+    """
+    The top FAQ answer, returned as-is when the LLM would overrun the
+    deadline. Raises `DeadlineExceeded("llm")` when the context came from
+    the details collection and there is no such answer.
+    """
+    if not retrieval["top_answer"]:
+        DEGRADATIONS.labels("llm", "failed").inc()
+        raise DeadlineExceeded("llm")
+    DEGRADATIONS.labels("llm", "faq_answer").inc()
+    log.warning("Not enough time left for the LLM; answering with the top FAQ answer.")
+    return retrieval["top_answer"]
+
+def generate_answer(user_query, retrieval, chat_history, usage):
+    """
+    LLM reply within the request deadline.
+
+    Returns:
+        tuple: (reply, degraded) where degraded is True when the top FAQ
+        answer was returned because the LLM call would not finish in time.
+    """
+    if not allows(DEADLINE_LLM_RESERVE):
+        return fallback_answer(retrieval), True
+    try:
+        with span("llm"):
+            return get_llm_response(
+                query=user_query, context=retrieval["context"], chat_history=chat_history, usage=usage
+            ), False
+    except DeadlineExceeded:
+        return fallback_answer(retrieval), True
+
+def finish_session(session_stage, session_id):
+    """
+    Session upkeep result. When it has not finished with DEADLINE_SYNC_RESERVE
+    left, the requested session id is used and the stage finishes in the background.
+    """
+    try:
+        return stage_result(session_stage, "session", reserve=DEADLINE_SYNC_RESERVE)
+    except DeadlineExceeded:
+        DEGRADATIONS.labels("session", "background").inc()
+        log.warning("Session upkeep is running late; finishing it in the background.")
+        return session_id
+
+def log_interaction(session_stage, **interaction):
+    """
+    Logs the interaction on the request path while DEADLINE_SYNC_RESERVE is
+    left and session upkeep has finished, otherwise on the pipeline executor
+    once it has.
+    """
+    if session_stage.done() and allows(DEADLINE_SYNC_RESERVE):
+        with span("logging"):
+            logger.log_interaction(session_id=session_stage.result(), **interaction)
+        return
+
+    DEGRADATIONS.labels("logging", "background").inc()
+
+    def log_in_background():
+        try:
+            logger.log_interaction(session_id=session_stage.result(), **interaction)
+        except Exception as e:
+            log.error("Error logging interaction in the background: %s", e, exc_info=True)
+
+    pipeline_service.submit(log_in_background)
+
+def deadline_exceeded_error(e):
+    """Error body for a query that ran out of time (sent with status 504)."""
+    log.warning("Query deadline exceeded during %s.", e.stage)
+    messages = {
+        "retrieval": "The search did not finish in time. Please try again.",
+        "llm": "The answer could not be generated in time. Please try again.",
+    }
+    return {"error": messages.get(e.stage, str(e)), "error_code": e.error_code}
+
+def flagged_categories(categories):
+    """Names of the moderation categories that were flagged."""
+    return sorted(name for name, flagged in (categories or {}).items() if flagged)
+
+def request_metadata(retrieval=None):
+    """Request details stored alongside each logged interaction, with the context stats of `retrieval`."""
+    metadata = {
+        "ip": request.remote_addr,
+        "user_agent": request.headers.get("User-Agent")
+    }
+    return with_context_stats(metadata, retrieval)
+
+def with_context_stats(metadata, retrieval):
+    """Adds the retrieval's context stats (tokens sent and saved) to interaction metadata."""
+    if retrieval and retrieval.get("context_stats"):
+        metadata["context"] = retrieval["context_stats"]
+    return metadata
+
+def moderate_and_retrieve(user_query, use_answer_cache=False):
+    """
+    Runs input moderation and embed-plus-search concurrently.
+
+    Moderation runs on the calling thread while retrieval runs on the pipeline
+    executor; retrieval is cancelled as soon as the query is flagged.
+
+    Returns:
+        tuple: (is_toxic, categories, retrieval) where retrieval is the
+        `retrieve_context` result, or None when the query was flagged.
+
+    Raises:
+        DeadlineExceeded: retrieval did not finish within the request deadline.
+    """
+    retrieval = pipeline_service.submit(retrieve_context, user_query, use_answer_cache, cancellable=True)
+
+    with span("moderation_input"):
+        is_toxic, categories = ToxicityChecker.check_toxicity(user_query)
+    if is_toxic:
+        retrieval.cancel()
+        return is_toxic, categories, None
+
+    try:
+        return is_toxic, categories, stage_result(retrieval, "retrieval")
+    except DeadlineExceeded:
+        retrieval.cancel()
+        DEGRADATIONS.labels("retrieval", "failed").inc()
+        raise
+
+def cache_answer(retrieval, llm_reply):
+    """Stores a freshly generated, moderated answer in the semantic answer cache."""
+    answer_cache.store(retrieval["query_vector"], {
+        "answer": llm_reply,
+        "context": retrieval["relevant_chunks"],
+        "source": retrieval["source"]
+    })
+
+def sse_event(event, data):
+    """Formats a single Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @query_bp.route("/query", methods=["POST"])
+@timed_request("query")
+@after_warmup
+@with_deadline
 def query_handler():
     try:
         # Retrieve user ID and session ID from headers or generate new ones
-        user_id = request.headers.get("X-User-ID")
-        if user_id in [None, 'null']:
-            user_id = str(uuid.uuid4())
-
-        session_id = request.headers.get("X-Session-ID")
-        if session_id in [None, 'null']:
-            session_id = str(uuid.uuid4())
+        user_id, session_id = resolve_identity()
 
-        print(f"[DEBUG]: user_id: {user_id} \n session_id: {session_id}")
-
-        # Retrieve or initialize chat history for the session
-        chat_history = chat_histories.get(session_id, "")
+        # Retrieve or initialize chat history for the session (sent as prior chat turns)
+        chat_history = history_store.get(session_id)
+        # Cached answers are only valid for questions asked without prior context
+        use_answer_cache = not chat_history
 
         # Extract user query from the JSON payload
         data = request.json
@@ -84,80 +355,242 @@ def query_handler():
         if not user_query.strip():
             return jsonify({"error": "Query cannot be empty.", "error_code": "EMPTY_QUERY"}), 400
         
-        # Check for toxic content
-        is_toxic, categories = ToxicityChecker.check_toxicity(user_query)
+        # Check for toxic content while the query is embedded and searched
+        is_toxic, categories, retrieval = moderate_and_retrieve(user_query, use_answer_cache)
         if is_toxic:
-            print(f"[DEBUG] Query flagged as toxic: {categories}")
+            log.info("Query flagged by moderation.", extra={"categories": flagged_categories(categories)})
             return jsonify({"answer": "Your query contains inappropriate content and cannot be processed."})
 
-        # Generate embedding (vector) for the query
-        query_vector = generate_embedding(user_query)
-
-        # Perform search with fallback
-        search_results, source_collection = search_with_fallback(
-            query_vector, FAQ_COLLECTION, DETAILS_COLLECTION
-        )
+        relevant_chunks = retrieval["relevant_chunks"]
+        source_collection = retrieval["source"]
+        cached_answer = retrieval["cached_answer"]
 
         # If no results found
-        if not search_results:
+        if not relevant_chunks:
             return jsonify({"error": "No relevant information found."}), 404
 
-        # Format the results
-        relevant_chunks = []
-        for result in search_results:
-            if source_collection == FAQ_COLLECTION:
-                question = result.payload.get("question", "No question found")
-                answer = result.payload.get("answer", "No answer found")
-                score = result.score
-                print("[DEBUG] FAQ question: ", question, "\nFAQ Answer: ", answer)
-                relevant_chunks.append(f"Question: {question}\nAnswer: {answer}\nScore: {score}")
-            elif source_collection == DETAILS_COLLECTION:
-                text = result.payload.get("text", "No text found")
-                print("[DEBUG] Details Results:", text)
-                score = result.score
-                relevant_chunks.append(f"Text: {text}\nScore: {score}")
-
-        # Combine the chunks for context
-        context = "\n\n".join(relevant_chunks)
-
-        # Get LLM response with chat history
-        llm_reply = get_llm_response(query=user_query, context=context, chat_history=chat_history)
+        # Ensure session exists, overlapping with the LLM call
+        session_stage = pipeline_service.submit(
+            timed, "session", logger.get_or_create_session, user_id=user_id, session_id=session_id
+        )
+
+        # Get LLM response with chat history (unless an equivalent question was answered recently)
+        metadata = request_metadata(retrieval)
+        degraded = False
+        if cached_answer is None:
+            llm_usage = {}
+            llm_reply, degraded = generate_answer(user_query, retrieval, chat_history, llm_usage)
+            metadata["llm_usage"] = llm_usage
+            if degraded:
+                metadata["degraded"] = "faq_answer"
+        else:
+            llm_reply = cached_answer
 
         # Update chat history
-        chat_history += f"User: {user_query}\nAssistant: {llm_reply}\n"
-        chat_histories[session_id] = chat_history
+        history_store.append(session_id, user_query, llm_reply)
+
+        session_id = finish_session(session_stage, session_id)
+        logged_reply = llm_reply
 
-        # Ensure session exists
-        session_id=logger.get_or_create_session(user_id=user_id, session_id=session_id)
+        # check llm reply for toxicity (cached and FAQ answers are not generated)
+        if cached_answer is None and not degraded:
+            with span("moderation_output"):
+                is_toxic, categories = ToxicityChecker.check_toxicity(llm_reply, reply=True)
+            if is_toxic:
+                log.warning("Response flagged by moderation.", extra={"categories": flagged_categories(categories)})
+                llm_reply = "The generated response was flagged as inappropriate. Please try again."
+            elif use_answer_cache:
+                cache_answer(retrieval, llm_reply)
 
-        # Log the interaction
-        logger.log_interaction(
+        # Logged once the answer is final, so the record holds the whole request's timings
+        log_interaction(
+            session_stage,
             user_id=user_id,
-            session_id=session_id,
             prompt=user_query,
-            response=llm_reply,
+            response=logged_reply,
             source_pdf=source_collection,
-            metadata={
-                "ip": request.remote_addr,
-                "user_agent": request.headers.get("User-Agent")
-            }
+            metadata=metadata,
+            timings=current_timer.get().timings()
         )
 
-        # check llm reply for toxicity
-        is_toxic, categories = ToxicityChecker.check_toxicity(llm_reply)
-        if is_toxic:
-            print(f"[DEBUG] Response flagged as toxic: {categories}")
-            llm_reply = "The generated response was flagged as inappropriate. Please try again."
-
         return jsonify({
             "user_id": user_id,
             "session_id": session_id,
             "query": user_query,
             "answer": llm_reply,
             "context": relevant_chunks,
-            "source": source_collection
+            "source": source_collection,
+            "cached": cached_answer is not None,
+            "degraded": degraded
         })
 
+    except DeadlineExceeded as e:
+        return jsonify(deadline_exceeded_error(e)), 504
     except Exception as e:
-        current_app.logger.error("Error during query processing: %s", str(e), exc_info=True)
+        log.error("Error during query processing: %s", e, exc_info=True)
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@query_bp.route("/query/stream", methods=["POST"])
+@timed_request("query_stream")
+@after_warmup
+@with_deadline
+def query_stream_handler():
+    """
+    Streaming variant of `/query` using Server-Sent Events.
+
+    Events, in order:
+      - `meta`:  user/session ids plus retrieval metadata (`source`, `context`)
+      - `token`: one per LLM text delta (`{"delta": ...}`)
+      - `done`:  final answer after output moderation, with the session id to keep
+      - `error`: sent instead of the remaining events if generation fails
+
+    When the deadline leaves too little time for the LLM, the top FAQ answer
+    is sent as a single token; when it runs out mid-stream, the reply ends
+    there. Either way `done` has `degraded` set. Interaction logging runs once
+    the response has been closed.
+    """
+    try:
+        user_id, session_id = resolve_identity()
+
+        chat_history = history_store.get(session_id)
+        use_answer_cache = not chat_history
+
+        data = request.json
+        if not data or "user_query" not in data:
+            return jsonify({"error": "Invalid or missing JSON payload."}), 400
+
+        user_query = data.get("user_query", "").strip()
+        if not user_query:
+            return jsonify({"error": "Query cannot be empty.", "error_code": "EMPTY_QUERY"}), 400
+
+        is_toxic, categories, retrieval = moderate_and_retrieve(user_query, use_answer_cache)
+        if is_toxic:
+            log.info("Query flagged by moderation.", extra={"categories": flagged_categories(categories)})
+            return jsonify({"answer": "Your query contains inappropriate content and cannot be processed."})
+
+        relevant_chunks = retrieval["relevant_chunks"]
+        source_collection = retrieval["source"]
+        cached_answer = retrieval["cached_answer"]
+        if not relevant_chunks:
+            return jsonify({"error": "No relevant information found."}), 404
+
+        metadata = request_metadata(retrieval)
+    except DeadlineExceeded as e:
+        return jsonify(deadline_exceeded_error(e)), 504
+    except Exception as e:
+        log.error("Error during query processing: %s", e, exc_info=True)
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    # The generator and close callback run after this handler has returned
+    timer = current_timer.get()
+    timer.defer_finish()
+    log_context = current_request.get()
+    deadline = current_deadline.get()
+    # Filled in by the generator once the reply is complete, read by the close callback
+    completed = {}
+
+    def generate():
+        with use_timer(timer), use_request_context(log_context), use_deadline(deadline):
+            yield from stream_events()
+
+    def stream_events():
+        # Session upkeep does not depend on the reply, so it overlaps with generation
+        session_stage = pipeline_service.submit(
+            timed, "session", logger.get_or_create_session, user_id=user_id, session_id=session_id
+        )
+
+        yield sse_event("meta", {
+            "user_id": user_id,
+            "session_id": session_id,
+            "query": user_query,
+            "context": relevant_chunks,
+            "source": source_collection,
+            "cached": cached_answer is not None
+        })
+
+        degraded = False
+        try:
+            if cached_answer is not None:
+                # Cached answers were moderated before being cached
+                yield sse_event("token", {"delta": cached_answer})
+                llm_reply, flagged = cached_answer, False
+                history_store.append(session_id, user_query, llm_reply)
+            elif not allows(DEADLINE_LLM_RESERVE):
+                # FAQ answers are curated, so they skip output moderation
+                llm_reply, flagged, degraded = fallback_answer(retrieval), False, True
+                metadata["degraded"] = "faq_answer"
+                yield sse_event("token", {"delta": llm_reply})
+                history_store.append(session_id, user_query, llm_reply)
+            else:
+                parts = []
+                llm_usage = {}
+                try:
+                    with span("llm"):
+                        for delta in stream_llm_response(
+                            query=user_query, context=retrieval["context"], chat_history=chat_history, usage=llm_usage
+                        ):
+                            parts.append(delta)
+                            yield sse_event("token", {"delta": delta})
+                            if deadline is not None and deadline.expired():
+                                raise DeadlineExceeded("llm")
+                except DeadlineExceeded:
+                    if not parts:
+                        raise
+                    # The client already has part of the reply; end it there
+                    DEGRADATIONS.labels("llm", "truncated").inc()
+                    degraded = True
+                    metadata["degraded"] = "truncated"
+                llm_reply = "".join(parts).strip()
+                metadata["llm_usage"] = llm_usage
+
+                history_store.append(session_id, user_query, llm_reply)
+
+                # Output moderation runs on the complete reply, after the last token
+                with span("moderation_output"):
+                    flagged, categories = ToxicityChecker.check_toxicity(llm_reply, reply=True)
+                if flagged:
+                    log.warning("Response flagged by moderation.", extra={"categories": flagged_categories(categories)})
+                    llm_reply = "The generated response was flagged as inappropriate. Please try again."
+                elif use_answer_cache and not degraded:
+                    cache_answer(retrieval, llm_reply)
+
+            active_session_id = finish_session(session_stage, session_id)
+            completed.update(session_stage=session_stage, response=llm_reply, timings=timer.timings())
+
+            yield sse_event("done", {
+                "user_id": user_id,
+                "session_id": active_session_id,
+                "answer": llm_reply,
+                "flagged": flagged,
+                "degraded": degraded
+            })
+        except DeadlineExceeded as e:
+            yield sse_event("error", deadline_exceeded_error(e))
+        except Exception as e:
+            log.error("Error during streamed query processing: %s", e, exc_info=True)
+            yield sse_event("error", {"error": f"Internal server error: {str(e)}"})
+
+    def log_after_close():
+        # Observes streams that ended early too (finished already when completed)
+        timer.finish()
+        if not completed:
+            return
+        try:
+            with use_request_context(log_context), use_deadline(deadline):
+                log_interaction(
+                    completed["session_stage"],
+                    user_id=user_id,
+                    prompt=user_query,
+                    response=completed["response"],
+                    source_pdf=source_collection,
+                    metadata=metadata,
+                    timings=completed["timings"]
+                )
+        except Exception as e:
+            log.error("Error logging streamed interaction: %s", e, exc_info=True)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Stop reverse proxies from buffering the stream
+    response.call_on_close(log_after_close)
+    return response
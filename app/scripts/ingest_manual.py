@@ -2,6 +2,7 @@ from qdrant_client.http.models import PointStruct
 import uuid
 from app.services.embedding_service import generate_embedding  # or use embedder.encode()
 from app.services.qdrant_service import client
+from app.services.semantic_cache import answer_cache
 
 def insert_manual_override(collection_name):
     manual_fallback_entry = {
@@ -25,4 +26,5 @@ def insert_manual_override(collection_name):
     )
 
     client.upsert(collection_name=collection_name, points=[point])
+    answer_cache.invalidate()
     print("[✅] Manual override inserted.")
\ No newline at end of file
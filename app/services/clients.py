@@ -0,0 +1,403 @@
+"""
+Shared upstream API clients.
+
+One pooled, keep-alive client per upstream (OpenAI, Qdrant, Supabase) and per
+process, created on first use with explicit connect/read timeouts, bounded
+retries with jittered exponential backoff, and a connection pool sized to the
+worker's concurrency. A process forked from one that already holds clients
+(e.g. gunicorn --preload) builds its own instead of sharing the parent's
+sockets.
+"""
+import os
+import random
+import threading
+import time
+import asyncio
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+# Base and cap, in seconds, of the exponential backoff between retries
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.25))
+HTTP_RETRY_MAX_BACKOFF = float(os.getenv("HTTP_RETRY_MAX_BACKOFF", 4))
+# Connections per upstream: enough for every query-pipeline and search thread at once
+HTTP_POOL_SIZE = int(os.getenv(
+    "HTTP_POOL_SIZE",
+    int(os.getenv("PIPELINE_MAX_WORKERS", 16)) + int(os.getenv("SEARCH_MAX_WORKERS", 16))
+))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+
+
+def http_timeout():
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def http_limits():
+    return httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class RetryPolicy:
+    """
+    Which failed requests are retried, and how long to wait before each retry.
+
+    A request that never reached the server (connect errors, pool timeouts)
+    is always safe to retry. Read errors and 429/502/503/504 responses are
+    only retried for idempotent methods.
+    """
+
+    RETRY_STATUSES = {429, 502, 503, 504}
+    CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(self, max_retries=HTTP_MAX_RETRIES, backoff=HTTP_RETRY_BACKOFF,
+                 max_backoff=HTTP_RETRY_MAX_BACKOFF, idempotent_methods=IDEMPOTENT_METHODS):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idempotent_methods = idempotent_methods
+
+    def delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, or the server's Retry-After when it asks for longer."""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
+
+    def _idempotent(self, request):
+        return self.idempotent_methods is None or request.method in self.idempotent_methods
+
+    def retry_error(self, request, error, attempt):
+        if attempt >= self.max_retries or not isinstance(error, httpx.TransportError):
+            return False
+        return isinstance(error, self.CONNECT_ERRORS) or self._idempotent(request)
+
+    def retry_response(self, request, response, attempt):
+        return (
+            attempt < self.max_retries
+            and response.status_code in self.RETRY_STATUSES
+            and self._idempotent(request)
+        )
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Retries requests sent through `transport` according to `policy`."""
+
+    def __init__(self, transport, policy):
+        self.transport = transport
+        self.policy = policy
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except Exception as e:
+                if not self.policy.retry_error(request, e, attempt):
+                    raise
+                time.sleep(self.policy.delay(attempt))
+            else:
+                if not self.policy.retry_response(request, response, attempt):
+                    return response
+                delay = self.policy.delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async `RetryTransport`."""
+
+    def __init__(self, transport, policy):
+        self.transport = transport
+        self.policy = policy
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception as e:
+                if not self.policy.retry_error(request, e, attempt):
+                    raise
+                await asyncio.sleep(self.policy.delay(attempt))
+            else:
+                if not self.policy.retry_response(request, response, attempt):
+                    return response
+                delay = self.policy.delay(attempt, response)
+                await response.aclose()
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ClientRegistry:
+    """
+    Holds one client per upstream name, built by its registered factory on
+    first use. Clients built by another process (before a fork) are dropped,
+    never closed: their sockets still belong to the parent.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    def get(self, name):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+            client = self._clients.get(name)
+            if client is None:
+                client = self._clients[name] = self._factories[name]()
+            return client
+
+    def reset(self):
+        """Drops every client; the next `get` builds a fresh one."""
+        with self._lock:
+            self._clients = {}
+
+
+class LazyClient:
+    """
+    Module-level stand-in for a registry client: attribute access is forwarded
+    to the current process's client, so modules can keep a `client` global
+    that survives forks.
+    """
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+
+registry = ClientRegistry()
+
+
+def _openai():
+    from openai import OpenAI, DefaultHttpxClient
+
+    # OpenAI retries connection errors, 408/409/429 and 5xx itself, with jittered backoff
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=http_timeout(),
+        max_retries=HTTP_MAX_RETRIES,
+        http_client=DefaultHttpxClient(limits=http_limits()),
+    )
+
+
+def _async_openai():
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=http_timeout(),
+        max_retries=HTTP_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(limits=http_limits()),
+    )
+
+
+class QdrantRetryPolicy(RetryPolicy):
+    """
+    `RetryPolicy` for the Qdrant REST API, where searches are POSTs. Reads
+    (searches, scrolls, counts) and point upserts (deterministic ids) are
+    safe to repeat; collection and index management and filtered deletes
+    are not: a create retried after a read timeout would fail with "already
+    exists" although the first attempt succeeded.
+    """
+
+    READ_ENDPOINTS = (
+        "/points/search", "/points/search/batch", "/points/query", "/points/query/batch",
+        "/points/recommend", "/points/recommend/batch", "/points/scroll", "/points/count",
+    )
+
+    def _idempotent(self, request):
+        path = request.url.path.rstrip("/")
+        if request.method in ("GET", "HEAD"):
+            return True
+        if request.method == "POST":
+            return path.endswith(self.READ_ENDPOINTS)
+        return request.method == "PUT" and path.endswith("/points")
+
+
+QDRANT_RETRY_POLICY = QdrantRetryPolicy()
+
+
+def qdrant_retry_middleware(policy=QDRANT_RETRY_POLICY):
+    """qdrant_client REST middleware applying `policy`."""
+    from qdrant_client.http.exceptions import ResponseHandlingException
+
+    def middleware(request, call_next):
+        attempt = 0
+        while True:
+            try:
+                response = call_next(request)
+            except ResponseHandlingException as e:
+                if not policy.retry_error(request, e.source, attempt):
+                    raise
+                time.sleep(policy.delay(attempt))
+            else:
+                if not policy.retry_response(request, response, attempt):
+                    return response
+                delay = policy.delay(attempt, response)
+                # Hand the connection back to the pool before retrying
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+    return middleware
+
+
+def async_qdrant_retry_middleware(policy=QDRANT_RETRY_POLICY):
+    """Async `qdrant_retry_middleware`."""
+    from qdrant_client.http.exceptions import ResponseHandlingException
+
+    async def middleware(request, call_next):
+        attempt = 0
+        while True:
+            try:
+                response = await call_next(request)
+            except ResponseHandlingException as e:
+                if not policy.retry_error(request, e.source, attempt):
+                    raise
+                await asyncio.sleep(policy.delay(attempt))
+            else:
+                if not policy.retry_response(request, response, attempt):
+                    return response
+                delay = policy.delay(attempt, response)
+                await response.aclose()
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    return middleware
+
+
+def _qdrant_kwargs():
+    return {
+        "url": os.getenv("QDRANT_URL"),
+        "api_key": os.getenv("QD_API_TOKEN"),
+        # qdrant_client takes a single timeout in whole seconds
+        "timeout": int(HTTP_READ_TIMEOUT),
+        "limits": http_limits(),
+    }
+
+
+def _qdrant():
+    from qdrant_client import QdrantClient
+
+    client = QdrantClient(**_qdrant_kwargs())
+    client.http.client.add_middleware(qdrant_retry_middleware())
+    return client
+
+
+def _async_qdrant():
+    from qdrant_client import AsyncQdrantClient
+
+    client = AsyncQdrantClient(**_qdrant_kwargs())
+    client.http.client.add_middleware(async_qdrant_retry_middleware())
+    return client
+
+
+def supabase_credentials():
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("Supabase URL and API key must be set in environment variables.")
+    return url, key
+
+
+def _supabase():
+    from supabase import Client, ClientOptions
+
+    class PooledClient(Client):
+        # PostgREST requests go through a pooled, retrying HTTP client
+        def _init_postgrest_client(self, rest_url, headers, schema, timeout, verify=True, proxy=None):
+            postgrest = super()._init_postgrest_client(rest_url, headers, schema, timeout, verify, proxy)
+            postgrest.session.close()
+            postgrest.session = httpx.Client(
+                base_url=rest_url,
+                headers=headers,
+                timeout=timeout,
+                follow_redirects=True,
+                transport=RetryTransport(httpx.HTTPTransport(limits=http_limits(), http2=True), RetryPolicy()),
+            )
+            return postgrest
+
+    url, key = supabase_credentials()
+    return PooledClient(url, key, ClientOptions(postgrest_client_timeout=http_timeout()))
+
+
+def _async_supabase():
+    from supabase import AsyncClient, AsyncClientOptions
+
+    class PooledAsyncClient(AsyncClient):
+        def _init_postgrest_client(self, rest_url, headers, schema, timeout, verify=True, proxy=None):
+            postgrest = super()._init_postgrest_client(rest_url, headers, schema, timeout, verify, proxy)
+            postgrest.session = httpx.AsyncClient(
+                base_url=rest_url,
+                headers=headers,
+                timeout=timeout,
+                follow_redirects=True,
+                transport=AsyncRetryTransport(
+                    httpx.AsyncHTTPTransport(limits=http_limits(), http2=True), RetryPolicy()
+                ),
+            )
+            return postgrest
+
+    url, key = supabase_credentials()
+    return PooledAsyncClient(url, key, AsyncClientOptions(postgrest_client_timeout=http_timeout()))
+
+
+registry.register("openai", _openai)
+registry.register("async_openai", _async_openai)
+registry.register("qdrant", _qdrant)
+registry.register("async_qdrant", _async_qdrant)
+registry.register("supabase", _supabase)
+registry.register("async_supabase", _async_supabase)
+
+
+def openai_client():
+    return registry.get("openai")
+
+
+def async_openai_client():
+    return registry.get("async_openai")
+
+
+def qdrant_client():
+    return registry.get("qdrant")
+
+
+def async_qdrant_client():
+    return registry.get("async_qdrant")
+
+
+def supabase_client():
+    return registry.get("supabase")
+
+
+def async_supabase_client():
+    return registry.get("async_supabase")
@@ -0,0 +1,104 @@
+import os
+from qdrant_client.http import models
+
+
+class CollectionProfile:
+    """
+    Performance settings for a Qdrant collection: index build and search
+    parameters, int8 scalar quantization, on-disk storage and payload indexes.
+
+    `None` leaves the corresponding setting at Qdrant's default.
+    """
+
+    def __init__(self, name, hnsw_m=None, hnsw_ef_construct=None, hnsw_ef=None,
+                 quantization=False, quantile=0.99, quantization_always_ram=True,
+                 rescore=True, oversampling=2.0, on_disk_vectors=None, on_disk_payload=None,
+                 payload_indexes=("pdf_id", "source")):
+        self.name = name
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.hnsw_ef = hnsw_ef
+        self.quantization = quantization
+        self.quantile = quantile
+        self.quantization_always_ram = quantization_always_ram
+        self.rescore = rescore
+        self.oversampling = oversampling
+        self.on_disk_vectors = on_disk_vectors
+        self.on_disk_payload = on_disk_payload
+        self.payload_indexes = tuple(payload_indexes)
+
+    def hnsw_config(self):
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self):
+        if not self.quantization:
+            return None
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=self.quantile,
+                always_ram=self.quantization_always_ram,
+            )
+        )
+
+    def create_collection_kwargs(self, vector_size):
+        """Keyword arguments for `client.create_collection`."""
+        return {
+            "vectors_config": models.VectorParams(
+                size=vector_size, distance=models.Distance.COSINE, on_disk=self.on_disk_vectors
+            ),
+            "hnsw_config": self.hnsw_config(),
+            "quantization_config": self.quantization_config(),
+            "on_disk_payload": self.on_disk_payload,
+        }
+
+    def search_params(self):
+        """`SearchParams` for `client.search`, or None to use the collection defaults."""
+        quantization = (
+            models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+            if self.quantization else None
+        )
+        if self.hnsw_ef is None and quantization is None:
+            return None
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+
+PROFILES = {
+    # Qdrant defaults plus the payload indexes ingestion filters on
+    "default": CollectionProfile("default"),
+    # Small, hot collections (FAQ): denser graph and wider search, everything in RAM
+    "low_latency": CollectionProfile(
+        "low_latency", hnsw_m=32, hnsw_ef_construct=200, hnsw_ef=128,
+        on_disk_vectors=False, on_disk_payload=False,
+    ),
+    # Large collections (details): int8 vectors in RAM, rescored against the
+    # full-precision originals kept on disk together with the payloads
+    "low_memory": CollectionProfile(
+        "low_memory", hnsw_m=16, hnsw_ef_construct=100, hnsw_ef=64,
+        quantization=True, oversampling=2.0, on_disk_vectors=True, on_disk_payload=True,
+    ),
+}
+
+
+def parse_profile_assignments(value):
+    """Parses `collection=profile,collection=profile` into a dict."""
+    assignments = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            collection_name, profile_name = item.split("=", 1)
+            assignments[collection_name.strip()] = profile_name.strip()
+    return assignments
+
+
+DEFAULT_PROFILE = os.getenv("QDRANT_DEFAULT_PROFILE", "default")
+COLLECTION_PROFILES = parse_profile_assignments(os.getenv("QDRANT_COLLECTION_PROFILES"))
+
+
+def get_profile(collection_name):
+    """Returns the profile configured for `collection_name` (see QDRANT_COLLECTION_PROFILES)."""
+    name = COLLECTION_PROFILES.get(collection_name, DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown Qdrant collection profile: {name}")
+    return PROFILES[name]
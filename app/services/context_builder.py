@@ -0,0 +1,221 @@
+import logging
+import os
+import re
+import threading
+
+log = logging.getLogger(__name__)
+
+# Token budget for the retrieved context in each prompt; 0 sends every
+# distinct passage (only duplicates and overlaps are removed)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+# Word-shingle Jaccard similarity above which a passage counts as a near-duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.85))
+# Shortest shared run of words for two chunks of one document to be merged
+CONTEXT_MIN_OVERLAP_WORDS = int(os.getenv("CONTEXT_MIN_OVERLAP_WORDS", 20))
+# Tokenizer of the answering model (gpt-4o-mini uses o200k_base)
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+
+# Copy of the tiktoken cache shipped with the app (filled by fetch_tokenizer.py);
+# used when TIKTOKEN_CACHE_DIR is not set, so workers never download the encoding
+BUNDLED_TOKENIZER_CACHE = os.path.join(os.path.dirname(__file__), "..", "..", "tiktoken_cache")
+
+SHINGLE_SIZE = 3
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def load_encoding():
+    """Loads the tiktoken encoding, blocking (it may be downloaded); None when unavailable."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            if "TIKTOKEN_CACHE_DIR" not in os.environ and os.path.isdir(BUNDLED_TOKENIZER_CACHE):
+                os.environ["TIKTOKEN_CACHE_DIR"] = os.path.abspath(BUNDLED_TOKENIZER_CACHE)
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+            except Exception as e:
+                log.warning("Tokenizer '%s' unavailable (%s); estimating tokens.", CONTEXT_TOKENIZER, e)
+            _encoding_loaded = True
+    return _encoding
+
+
+def get_encoding():
+    """
+    Returns the tiktoken encoding, or None until it has loaded (or when it is
+    unavailable). Never waits: requests estimate tokens while `warm_up` loads it.
+    """
+    if not _encoding_loaded:
+        warm_up()
+        return None
+    return _encoding
+
+
+def warm_up():
+    """Loads the tokenizer on a background thread, once per process."""
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started or _encoding_loaded:
+            return
+        _warmup_started = True
+    threading.Thread(target=load_encoding, name="tokenizer-warmup", daemon=True).start()
+
+
+def _reset_after_fork():
+    # A fork during the warm-up leaves the locks held by a thread the child
+    # does not have; the child starts its own warm-up on first use
+    global _encoding_lock, _warmup_lock, _warmup_started
+    _encoding_lock = threading.Lock()
+    _warmup_lock = threading.Lock()
+    if not _encoding_loaded:
+        _warmup_started = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def passage_from_hit(hit):
+    """Turns a search hit (ScoredPoint) into a passage dict."""
+    payload = hit.payload or {}
+    if "question" in payload:
+        text = f"Question: {payload.get('question')}\nAnswer: {payload.get('answer', '')}"
+    else:
+        text = payload.get("text", "")
+    return {"pdf_id": payload.get("pdf_id"), "text": text, "score": hit.score}
+
+
+def _overlap(first, second, min_overlap):
+    """Number of words at the end of `first` that start `second` (0 if fewer than `min_overlap`)."""
+    if not second:
+        return 0
+    for start in range(max(0, len(first) - len(second)), len(first) - min_overlap + 1):
+        if first[start] == second[0] and first[start:] == second[:len(first) - start]:
+            return len(first) - start
+    return 0
+
+
+def _contains(words, other):
+    """Whether `other` appears as a contiguous run inside `words`."""
+    size = len(other)
+    return any(words[i:i + size] == other for i in range(len(words) - size + 1) if words[i] == other[0])
+
+
+def merge_overlapping(passages, min_overlap=CONTEXT_MIN_OVERLAP_WORDS):
+    """
+    Merges passages from the same document whose words overlap end-to-start
+    (neighbouring chunks share `chunk_text`'s overlap) and drops passages
+    contained in another one. A merged passage keeps the better score.
+    """
+    merged = [dict(passage, words=passage["text"].split()) for passage in passages]
+    changed = True
+    while changed:
+        changed = False
+        for i, first in enumerate(merged):
+            for j, second in enumerate(merged):
+                if i == j or first["pdf_id"] is None or first["pdf_id"] != second["pdf_id"]:
+                    continue
+                if second["words"] and _contains(first["words"], second["words"]):
+                    words = first["words"]
+                else:
+                    overlap = _overlap(first["words"], second["words"], min_overlap)
+                    if not overlap:
+                        continue
+                    words = first["words"] + second["words"][overlap:]
+                first.update(words=words, text=" ".join(words), score=max(first["score"], second["score"]))
+                del merged[j]
+                changed = True
+                break
+            if changed:
+                break
+    for passage in merged:
+        del passage["words"]
+    return merged
+
+
+def _shingles(text):
+    # Case and punctuation differences do not make a passage new
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(passages, threshold=CONTEXT_DEDUP_THRESHOLD):
+    """Keeps the best-scoring passage of every group of near-identical passages."""
+    kept = []
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        shingles = _shingles(passage["text"])
+        if any(len(shingles & other) / len(shingles | other) >= threshold for _, other in kept):
+            continue
+        kept.append((passage, shingles))
+    return [passage for passage, _ in kept]
+
+
+def pack_passages(passages, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Adds passages in order of relevance while they fit in `token_budget`
+    (every passage when it is 0). When not even the best passage fits, it is
+    truncated to the budget.
+    """
+    if not token_budget:
+        return [passage["text"] for passage in sorted(passages, key=lambda p: p["score"], reverse=True)]
+    separator_tokens = count_tokens("\n\n")
+    packed, used = [], 0
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        tokens = count_tokens(passage["text"]) + (separator_tokens if packed else 0)
+        if used + tokens <= token_budget:
+            packed.append(passage["text"])
+            used += tokens
+    if not packed and passages:
+        best = max(passages, key=lambda p: p["score"])
+        packed.append(truncate_to_tokens(best["text"], token_budget))
+    return packed
+
+
+def build_context(hits, token_budget=CONTEXT_TOKEN_BUDGET, baseline=None):
+    """
+    Builds the LLM context from search hits: overlapping chunks of one document
+    are merged, near-duplicates dropped, and the rest packed by relevance into
+    `token_budget` tokens (all of them when it is 0). Scores are not included.
+
+    Args:
+        hits (list): Search results (`ScoredPoint`s).
+        baseline (str): The context as it would have been sent unprocessed,
+            used to report the tokens saved.
+
+    Returns:
+        tuple: (context string, stats dict with `passages`, `packed`, `tokens`, `tokens_saved`)
+    """
+    passages = [passage_from_hit(hit) for hit in hits]
+    passages = drop_near_duplicates(merge_overlapping(passages))
+    packed = pack_passages(passages, token_budget)
+    context = "\n\n".join(packed)
+
+    tokens = count_tokens(context)
+    stats = {"passages": len(hits), "packed": len(packed), "tokens": tokens, "tokens_saved": 0}
+    if baseline is not None:
+        stats["tokens_saved"] = count_tokens(baseline) - tokens
+    log.debug(
+        "Context: %d hits -> %d passages, %d tokens (%d saved).",
+        stats["passages"], stats["packed"], tokens, stats["tokens_saved"]
+    )
+    return context, stats
@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Time budget of one query, in seconds; 0 (the default) disables deadlines
+QUERY_DEADLINE = float(os.getenv("QUERY_DEADLINE", 0))
+# Least time left for an LLM call to be attempted; with less, the top FAQ answer is returned
+DEADLINE_LLM_RESERVE = float(os.getenv("DEADLINE_LLM_RESERVE", 3))
+# Time kept back from the LLM call for output moderation and the response
+DEADLINE_OUTPUT_RESERVE = float(os.getenv("DEADLINE_OUTPUT_RESERVE", 0.5))
+# Least time left for session upkeep and logging to stay on the request path
+DEADLINE_SYNC_RESERVE = float(os.getenv("DEADLINE_SYNC_RESERVE", 1))
+# Shortest timeout given to an upstream call, even with the budget spent
+MIN_CALL_TIMEOUT = 0.1
+
+# Deadline of the request being served; copied into pipeline and search
+# threads with the rest of the context, and into asyncio tasks automatically
+current_deadline = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """A stage could not finish within the request's deadline."""
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded during {stage}.")
+        self.stage = stage
+        self.error_code = f"{stage.upper()}_TIMEOUT"
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+    def allows(self, seconds):
+        """Whether at least `seconds` are left."""
+        return self.remaining() >= seconds
+
+    def timeout(self, reserve=0.0):
+        """Timeout for a call that must leave `reserve` seconds of the budget."""
+        return max(self.remaining() - reserve, MIN_CALL_TIMEOUT)
+
+
+@contextmanager
+def deadline_scope(seconds=None):
+    """Makes a new `Deadline` current for the enclosed block (none when `seconds` is 0)."""
+    seconds = QUERY_DEADLINE if seconds is None else seconds
+    deadline = Deadline(seconds) if seconds > 0 else None
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+@contextmanager
+def use_deadline(deadline):
+    """Makes an existing deadline current again (e.g. inside a streaming generator)."""
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def with_deadline(handler):
+    """Decorator running a request handler under a new `Deadline` of QUERY_DEADLINE seconds."""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with deadline_scope():
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+def allows(seconds):
+    """Whether the current request has at least `seconds` left (always, without a deadline)."""
+    deadline = current_deadline.get()
+    return deadline is None or deadline.allows(seconds)
+
+
+def bounded(client, reserve=0.0):
+    """
+    An OpenAI client whose calls end with the current deadline (less
+    `reserve`). Retries are off: a retry after a timed-out attempt would
+    overrun the deadline anyway.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return client
+    return client.with_options(timeout=deadline.timeout(reserve), max_retries=0)
+
+
+def stage_result(stage, name, reserve=0.0):
+    """
+    Result of a pipeline stage, waiting at most until `reserve` seconds
+    before the deadline. Raises `DeadlineExceeded(name)` instead of waiting
+    longer; the stage is left to finish (or stop at its next checkpoint).
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return stage.result()
+    try:
+        return stage.result(timeout=max(deadline.remaining() - reserve, 0.0))
+    except FutureTimeoutError:
+        raise DeadlineExceeded(name) from None
+
+
+async def await_result(task, name, reserve=0.0, cancel=True):
+    """Async `stage_result` for an asyncio task; with `cancel=False` the task keeps running."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return await task
+    try:
+        return await asyncio.wait_for(
+            task if cancel else asyncio.shield(task), max(deadline.remaining() - reserve, 0.0)
+        )
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(name) from None
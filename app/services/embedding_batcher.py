@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent encode requests into batched forward passes.
+
+    The first waiting request opens a window of `window_ms` milliseconds; every
+    request arriving within it (up to `max_batch_size`) is encoded in the same
+    `encode` call and each caller receives its own vector. Requests that time
+    out before their batch starts are dropped from it.
+    """
+
+    def __init__(self, encode, window_ms=2.0, max_batch_size=32):
+        """
+        Args:
+            encode (callable): Encodes a list of texts into a sequence of vectors.
+            window_ms (float): How long to wait for more requests once one has arrived.
+            max_batch_size (int): Upper bound on texts per forward pass.
+        """
+        self._encode = encode
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, text):
+        """Queues `text` for encoding and returns a Future resolving to its vector."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        """Encodes one text through the batcher; raises TimeoutError after `timeout` seconds."""
+        future = self.submit(text)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+    def _ensure_worker(self):
+        # Started on first use so each (forked) worker process gets its own thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [
+                (text, future) for text, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                vectors = self._encode([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+from app.services.cache_utils import TTLCache
+from app.services.embedding_model import EMBEDDING_MODEL_KEY
+
+log = logging.getLogger(__name__)
+
+# Query-path cache. all-MiniLM-L6-v2 is uncased, so queries differing only in
+# case or whitespace share one entry.
+query_embedding_cache = TTLCache(
+    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 24 * 3600)),
+)
+
+
+def normalize_query(text):
+    """Cache key for a query: lower-cased with whitespace collapsed."""
+    return " ".join(text.split()).lower()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent embedding cache for ingestion, keyed by (model name, SHA-256 of the text).
+
+    Vectors are stored as raw float32 (or float16) bytes in a SQLite file, so
+    re-ingesting a mostly unchanged document only encodes the new chunks.
+    """
+
+    def __init__(self, path="embedding_store.sqlite3", dtype="float32"):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, dtype TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model_name, hashes, batch=500):
+        """Returns {text_hash: float32 vector} for the hashes present in the store."""
+        found = {}
+        conn = self._connect()
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), batch):
+            part = unique[start:start + batch]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT text_hash, dtype, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model_name, *part]
+            ).fetchall()
+            for key, dtype, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        return found
+
+    def put_many(self, model_name, items):
+        """Stores (text_hash, vector) pairs."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dtype, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (model_name, key, self.dtype.name, np.asarray(vector, dtype=self.dtype).tobytes())
+                    for key, vector in items
+                ]
+            )
+
+    def stats(self):
+        count = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"vectors": count, "hits": self.hits, "misses": self.misses, "dtype": self.dtype.name}
+
+
+_embedding_store = None
+_embedding_store_lock = threading.Lock()
+
+
+def get_embedding_store():
+    """Returns the process-wide embedding store, opening it on first use."""
+    global _embedding_store
+    with _embedding_store_lock:
+        if _embedding_store is None:
+            _embedding_store = EmbeddingStore(
+                path=os.getenv("EMBEDDING_STORE_PATH", "embedding_store.sqlite3"),
+                dtype=os.getenv("EMBEDDING_STORE_DTYPE", "float32"),
+            )
+        return _embedding_store
+
+
+def encode_with_store(texts, embedder, model_name=EMBEDDING_MODEL_KEY, store=None):
+    """
+    Encodes `texts` through the persistent embedding store: only texts whose
+    vectors are not stored yet are sent to `embedder.encode`, in one batch.
+
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), dim), in input order.
+    """
+    store = store or get_embedding_store()
+    hashes = [text_hash(text) for text in texts]
+    found = store.get_many(model_name, hashes)
+
+    missing = {}
+    for key, text in zip(hashes, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    store.hits += len(texts) - len(missing)
+    store.misses += len(missing)
+
+    if missing:
+        encoded = embedder.encode(list(missing.values()))
+        new_vectors = list(zip(missing.keys(), encoded))
+        store.put_many(model_name, new_vectors)
+        # Round through the stored dtype so cached and fresh vectors match exactly
+        found.update(
+            (key, np.asarray(vector, dtype=store.dtype).astype(np.float32)) for key, vector in new_vectors
+        )
+
+    log.debug("Embedding store: %d cached, %d encoded.", len(texts) - len(missing), len(missing))
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[key] for key in hashes])
@@ -0,0 +1,166 @@
+import functools
+import logging
+import os
+import threading
+from importlib.util import find_spec
+
+log = logging.getLogger(__name__)
+
+
+def resolve_backend(backend):
+    """Returns the backend to run: `onnx` falls back to `torch` when its extra is not installed."""
+    if backend == "onnx" and (find_spec("onnxruntime") is None or find_spec("optimum") is None):
+        log.error(
+            "EMBEDDING_BACKEND=onnx needs onnxruntime and optimum "
+            "(pip install -r requirements-onnx.txt); falling back to torch."
+        )
+        return "torch"
+    return backend
+
+
+# Model used for every embedding
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# `torch` (default) or `onnx` for the int8-quantized ONNX Runtime CPU backend
+EMBEDDING_BACKEND = resolve_backend(os.getenv("EMBEDDING_BACKEND", "torch").lower())
+# Quantized export shipped with all-MiniLM-L6-v2 (avx2 / avx512 / arm64 variants exist)
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx2.onnx")
+# Identifies the vectors a backend produces; quantized vectors must not mix with full-precision ones
+EMBEDDING_MODEL_KEY = (
+    f"{EMBEDDING_MODEL_NAME}:onnx:{EMBEDDING_ONNX_FILE}" if EMBEDDING_BACKEND == "onnx" else EMBEDDING_MODEL_NAME
+)
+# Load the model in the background as soon as the app is created, so the
+# first query does not pay for it inside its deadline
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+
+_model = None
+_model_lock = threading.Lock()
+# Set while a warm-up started by `warm_up` is still loading
+_warming = None
+
+
+def _thread_setting(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def load_model():
+    """Builds the SentenceTransformer for the configured backend."""
+    from sentence_transformers import SentenceTransformer
+
+    intra_op_threads = _thread_setting("EMBEDDING_INTRA_OP_THREADS")
+    inter_op_threads = _thread_setting("EMBEDDING_INTER_OP_THREADS")
+
+    if EMBEDDING_BACKEND == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if intra_op_threads:
+            session_options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            session_options.inter_op_num_threads = inter_op_threads
+
+        log.info("Loading %s with ONNX Runtime (%s).", EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_FILE)
+        return SentenceTransformer(
+            EMBEDDING_MODEL_NAME,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": EMBEDDING_ONNX_FILE,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options,
+            },
+        )
+
+    if EMBEDDING_BACKEND != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+
+    if intra_op_threads or inter_op_threads:
+        import torch
+
+        if intra_op_threads:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads:
+            torch.set_num_interop_threads(inter_op_threads)
+
+    log.info("Loading %s with PyTorch.", EMBEDDING_MODEL_NAME)
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def get_embedder():
+    """Returns the process-wide embedding model, loading it on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_model()
+    return _model
+
+
+def warm_up():
+    """Starts loading the model on a background thread (once, when EMBEDDING_WARMUP is set)."""
+    global _warming
+    with _model_lock:
+        if not EMBEDDING_WARMUP or _model is not None or _warming is not None:
+            return
+        _warming = threading.Event()
+        done = _warming
+
+    def load():
+        global _warming
+        try:
+            get_embedder()
+        except Exception as e:
+            log.warning("Could not warm up the embedding model: %s", e)
+        finally:
+            _warming = None
+            done.set()
+
+    threading.Thread(target=load, name="embedding-warmup", daemon=True).start()
+
+
+def is_warming():
+    return _warming is not None
+
+
+def wait_for_warmup():
+    """Blocks until a warm-up in progress has finished (returns at once otherwise)."""
+    warming = _warming
+    if warming is not None:
+        warming.wait()
+
+
+def after_warmup(handler):
+    """Decorator holding a request handler until the model warm-up is over, before its deadline starts."""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        wait_for_warmup()
+        return handler(*args, **kwargs)
+    return wrapper
+
+
+def _reset_after_fork():
+    # A fork (gunicorn --preload) during a warm-up leaves the lock held by a
+    # thread the child does not have; the child starts its own warm-up
+    global _model_lock, _warming
+    _model_lock = threading.Lock()
+    if _warming is not None:
+        _warming = None
+        warm_up()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class LazyEmbedder:
+    """
+    Module-level stand-in for the embedding model.
+
+    Importing it costs nothing; the model is loaded once per process by the
+    first `encode` (or any other attribute access) and shared by every caller.
+    """
+
+    def encode(self, *args, **kwargs):
+        return get_embedder().encode(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(get_embedder(), name)
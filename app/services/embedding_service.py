@@ -1,10 +1,114 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
+from app.services.embedding_cache import query_embedding_cache, normalize_query
+from app.services.embedding_model import LazyEmbedder
+from app.services.embedding_batcher import MicroBatcher
 
 # Load environment variables
 load_dotenv()
 
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+# Shared, lazily loaded model: importing this module does not load any weights
+embedder = LazyEmbedder()
+
+# Concurrent query embeddings are encoded together in one forward pass
+EMBEDDING_MICRO_BATCHING = os.getenv("EMBEDDING_MICRO_BATCHING", "true").lower() == "true"
+EMBEDDING_BATCH_TIMEOUT = float(os.getenv("EMBEDDING_BATCH_TIMEOUT", 10))
+
+# Runs encodes for the async serving path when micro-batching is off
+embedding_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EMBEDDING_THREADS", 4)), thread_name_prefix="embedding"
+)
+
+query_batcher = MicroBatcher(
+    encode=lambda texts: embedder.encode(texts),
+    window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 2)),
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 32)),
+)
+
+def embed_text(text):
+    """Embeds a text without caching it (micro-batched with concurrent queries when enabled)."""
+    if EMBEDDING_MICRO_BATCHING:
+        return query_batcher.encode(text, timeout=EMBEDDING_BATCH_TIMEOUT)
+    return embedder.encode([text])[0]
+
+async def aembed_text(text):
+    """
+    Async `embed_text`: the event loop never runs the model. Waits on the
+    micro-batcher's future, or runs the encode on `embedding_executor`.
+    """
+    if EMBEDDING_MICRO_BATCHING:
+        future = query_batcher.submit(text)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), EMBEDDING_BATCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise
+    loop = asyncio.get_running_loop()
+    return (await loop.run_in_executor(embedding_executor, embedder.encode, [text]))[0]
+
+# Query embeddings being computed, by cache key: concurrent callers for the
+# same query (input moderation and retrieval run side by side) wait for the
+# first one's vector instead of encoding it again
+_pending = {}
+_pending_lock = threading.Lock()
+
+def _claim(key):
+    """Returns (future, owner): the caller computes the vector if it is the owner, else waits on `future`."""
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future, False
+        future = _pending[key] = Future()
+        # A running future cannot be cancelled by a waiter that gives up
+        future.set_running_or_notify_cancel()
+        return future, True
+
+def _settle(key, future, vector=None, error=None):
+    with _pending_lock:
+        _pending.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(vector)
 
 def generate_embedding(query):
-    return embedder.encode([query])[0].tolist()
\ No newline at end of file
+    """
+    Embeds a query, reusing the vector of a previously seen (normalized) query
+    or of a concurrent call for the same query.
+    """
+    key = normalize_query(query)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+    future, owner = _claim(key)
+    if not owner:
+        return future.result(timeout=EMBEDDING_BATCH_TIMEOUT)
+    try:
+        vector = embed_text(query).tolist()
+    except Exception as e:
+        _settle(key, future, error=e)
+        raise
+    query_embedding_cache.set(key, vector)
+    _settle(key, future, vector)
+    return vector
+
+async def agenerate_embedding(query):
+    """Async `generate_embedding`."""
+    key = normalize_query(query)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+    future, owner = _claim(key)
+    if not owner:
+        return await asyncio.wait_for(asyncio.wrap_future(future), EMBEDDING_BATCH_TIMEOUT)
+    try:
+        vector = (await aembed_text(query)).tolist()
+    except BaseException as e:
+        _settle(key, future, error=e if isinstance(e, Exception) else RuntimeError("Embedding cancelled."))
+        raise
+    query_embedding_cache.set(key, vector)
+    _settle(key, future, vector)
+    return vector
@@ -0,0 +1,257 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def turn_size(turn):
+    """Approximate memory footprint of one turn, in bytes of UTF-8 text."""
+    return len(turn["user"].encode("utf-8")) + len(turn["assistant"].encode("utf-8"))
+
+
+class InMemoryHistoryStore:
+    """
+    Per-worker chat history store: LRU over sessions with a TTL, an optional
+    cap on the number of turns kept per session (0 keeps every turn) and a cap
+    on the total bytes held.
+    """
+
+    def __init__(self, max_sessions=5000, ttl=6 * 3600, max_turns=0, max_bytes=50 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        # session_id -> {"turns": [...], "bytes": int, "expires_at": float}
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evicted_sessions = 0
+        self.expired_sessions = 0
+        self.trimmed_turns = 0
+
+    def get(self, session_id):
+        """Returns a copy of the session's turns, oldest first (empty if unknown or expired)."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if entry["expires_at"] <= time.monotonic():
+                self._remove(session_id)
+                self.expired_sessions += 1
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(entry["turns"])
+
+    def append(self, session_id, user_message, assistant_message):
+        """Adds a turn to the session, then applies the per-session and global caps."""
+        turn = {"user": user_message, "assistant": assistant_message}
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = {"turns": [], "bytes": 0}
+                self._sessions[session_id] = entry
+            entry["turns"].append(turn)
+            entry["bytes"] += turn_size(turn)
+            entry["expires_at"] = time.monotonic() + self.ttl
+            self._bytes += turn_size(turn)
+            self._sessions.move_to_end(session_id)
+
+            while self.max_turns and len(entry["turns"]) > self.max_turns:
+                dropped = entry["turns"].pop(0)
+                entry["bytes"] -= turn_size(dropped)
+                self._bytes -= turn_size(dropped)
+                self.trimmed_turns += 1
+
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                oldest = next(iter(self._sessions))
+                if oldest == session_id and len(self._sessions) == 1:
+                    # A single session over the byte cap loses its oldest turns instead
+                    dropped = entry["turns"].pop(0)
+                    entry["bytes"] -= turn_size(dropped)
+                    self._bytes -= turn_size(dropped)
+                    self.trimmed_turns += 1
+                    if not entry["turns"]:
+                        self._remove(session_id)
+                    continue
+                self._remove(oldest)
+                self.evicted_sessions += 1
+
+    def clear(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evicted_sessions": self.evicted_sessions,
+            "expired_sessions": self.expired_sessions,
+            "trimmed_turns": self.trimmed_turns,
+        }
+
+
+class SQLiteHistoryStore:
+    """
+    Chat history store backed by a local SQLite file, shared by every worker
+    process on the host so a user bounced between workers keeps their context.
+
+    Applies the same TTL, optional per-session turn cap and total byte cap as the
+    in-memory store; eviction counters are per process.
+    """
+
+    def __init__(self, path="chat_history.sqlite3", ttl=6 * 3600, max_turns=0,
+                 max_bytes=200 * 1024 * 1024, cleanup_every=100):
+        self.path = path
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.cleanup_every = cleanup_every
+        self._appends = 0
+        self._appends_lock = threading.Lock()
+        self._local = threading.local()
+        self.evicted_sessions = 0
+        self.expired_sessions = 0
+        self.trimmed_turns = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                "turn TEXT NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        conn = self._connect()
+        row = conn.execute("SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return []
+        if row[0] + self.ttl <= time.time():
+            with conn:
+                self._remove(conn, session_id)
+            self.expired_sessions += 1
+            return []
+        rows = conn.execute("SELECT turn FROM turns WHERE session_id = ? ORDER BY id", (session_id,)).fetchall()
+        return [json.loads(turn) for (turn,) in rows]
+
+    def append(self, session_id, user_message, assistant_message):
+        turn = {"user": user_message, "assistant": assistant_message}
+        size = turn_size(turn)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO turns (session_id, turn, bytes) VALUES (?, ?, ?)",
+                (session_id, json.dumps(turn), size)
+            )
+            if self.max_turns:
+                trimmed = conn.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_turns)
+                ).rowcount
+                self.trimmed_turns += max(trimmed, 0)
+            conn.execute(
+                "INSERT INTO sessions (session_id, updated_at, bytes) VALUES (?, ?, "
+                "(SELECT COALESCE(SUM(bytes), 0) FROM turns WHERE session_id = ?)) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at, bytes = excluded.bytes",
+                (session_id, time.time(), session_id)
+            )
+
+        # Appends come from several request threads
+        with self._appends_lock:
+            self._appends += 1
+            due = self._appends % self.cleanup_every == 0
+        if due:
+            self.cleanup()
+
+    def cleanup(self):
+        """Drops expired sessions, then least recently updated sessions while over the byte cap."""
+        conn = self._connect()
+        with conn:
+            expired = conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at <= ?", (time.time() - self.ttl,)
+            ).fetchall()
+            for (session_id,) in expired:
+                self._remove(conn, session_id)
+            self.expired_sessions += len(expired)
+
+            total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM sessions").fetchone()[0]
+            for session_id, size in conn.execute(
+                "SELECT session_id, bytes FROM sessions ORDER BY updated_at"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._remove(conn, session_id)
+                total -= size
+                self.evicted_sessions += 1
+
+    def clear(self, session_id):
+        conn = self._connect()
+        with conn:
+            self._remove(conn, session_id)
+
+    @staticmethod
+    def _remove(conn, session_id):
+        conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self):
+        sessions, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evicted_sessions": self.evicted_sessions,
+            "expired_sessions": self.expired_sessions,
+            "trimmed_turns": self.trimmed_turns,
+        }
+
+
+def create_history_store():
+    """Builds the history store selected by CHAT_HISTORY_BACKEND (`memory` or `sqlite`)."""
+    backend = os.getenv("CHAT_HISTORY_BACKEND", "memory").lower()
+    ttl = float(os.getenv("CHAT_HISTORY_TTL", 6 * 3600))
+    max_turns = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 0))
+
+    if backend == "sqlite":
+        return SQLiteHistoryStore(
+            path=os.getenv("CHAT_HISTORY_PATH", "chat_history.sqlite3"),
+            ttl=ttl,
+            max_turns=max_turns,
+            max_bytes=int(os.getenv("CHAT_HISTORY_MAX_BYTES", 200 * 1024 * 1024)),
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown CHAT_HISTORY_BACKEND: {backend}")
+
+    return InMemoryHistoryStore(
+        max_sessions=int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", 5000)),
+        ttl=ttl,
+        max_turns=max_turns,
+        max_bytes=int(os.getenv("CHAT_HISTORY_MAX_BYTES", 50 * 1024 * 1024)),
+    )
@@ -0,0 +1,272 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+log = logging.getLogger(__name__)
+
+# Processes running ingestion jobs, per web worker
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", 1))
+# Niceness added to job processes so chat traffic keeps priority on the CPU
+INGEST_JOB_NICE = int(os.getenv("INGEST_JOB_NICE", 10))
+
+
+class DocumentBusy(Exception):
+    """An ingestion job for the same document is already queued or running."""
+
+    def __init__(self, pdf_id, job_id):
+        super().__init__(f"'{pdf_id}' is already being ingested (job {job_id}).")
+        self.pdf_id = pdf_id
+        self.job_id = job_id
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestionJobStore:
+    """
+    Ingestion job records in a local SQLite file.
+
+    Shared by the web workers (any of them can answer a status request) and
+    the job processes that report progress into it. At most one job per
+    `pdf_id` is queued or running at a time, so two uploads of a document
+    cannot interleave their deletes and upserts. Each active job records the
+    process responsible for it (the submitting web worker while queued, the
+    job process while running); jobs whose process is gone are marked failed
+    when the store is opened.
+    """
+
+    FIELDS = (
+        "id", "kind", "filename", "pdf_id", "collection_name", "status", "stage",
+        "pages_processed", "points_upserted", "points_unchanged", "points_deleted",
+        "error", "created_at", "started_at", "finished_at",
+    )
+
+    def __init__(self, path="ingestion_jobs.sqlite3"):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, filename TEXT NOT NULL, filepath TEXT NOT NULL, "
+                "pdf_id TEXT NOT NULL, collection_name TEXT, status TEXT NOT NULL, stage TEXT NOT NULL, "
+                "pages_processed INTEGER NOT NULL DEFAULT 0, points_upserted INTEGER NOT NULL DEFAULT 0, "
+                "points_unchanged INTEGER NOT NULL DEFAULT 0, points_deleted INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, pid INTEGER)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "pid" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN pid INTEGER")
+        self.fail_stale_jobs()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_document ON jobs (pdf_id) "
+                "WHERE status IN ('queued', 'running')"
+            )
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def create(self, kind, filename, filepath, pdf_id, collection_name):
+        """Records a queued job and returns its id; raises `DocumentBusy` if `pdf_id` has an active job."""
+        job_id = str(uuid.uuid4())
+        for attempt in range(2):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT INTO jobs (id, kind, filename, filepath, pdf_id, collection_name, status, stage, "
+                        "created_at, pid) VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', ?, ?)",
+                        (job_id, kind, filename, filepath, pdf_id, collection_name, time.time(), os.getpid())
+                    )
+                return job_id
+            except sqlite3.IntegrityError:
+                # The active job may belong to a worker that died since the store was opened
+                if attempt or not self.fail_stale_jobs():
+                    active = self._connect().execute(
+                        "SELECT id FROM jobs WHERE pdf_id = ? AND status IN ('queued', 'running')", (pdf_id,)
+                    ).fetchone()
+                    raise DocumentBusy(pdf_id, active[0] if active else None) from None
+
+    def fail_stale_jobs(self):
+        """Marks queued or running jobs whose process no longer exists as failed; returns how many."""
+        conn = self._connect()
+        active = conn.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        stale = [job_id for job_id, pid in active if pid is None or not _process_alive(pid)]
+        if stale:
+            with conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, finished_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'running')",
+                    [("Interrupted: the process handling the job stopped.", time.time(), job_id) for job_id in stale]
+                )
+            log.warning("Marked %d interrupted ingestion job(s) as failed.", len(stale))
+        return len(stale)
+
+    def update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id, include_filepath=False):
+        """Returns the job as a dict with `elapsed` seconds, or None if unknown."""
+        columns = self.FIELDS + (("filepath",) if include_filepath else ())
+        row = self._connect().execute(
+            f"SELECT {', '.join(columns)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        if job["started_at"] is not None:
+            job["elapsed"] = round((job["finished_at"] or time.time()) - job["started_at"], 3)
+        else:
+            job["elapsed"] = 0.0
+        return job
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store(path=None):
+    """Returns the process-wide job store, opening it on first use."""
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = IngestionJobStore(path=path or os.getenv("INGEST_JOB_DB_PATH", "ingestion_jobs.sqlite3"))
+        return _job_store
+
+
+def run_ingestion_job(job_id, store_path=None):
+    """
+    Runs one queued job: streams the PDF into Qdrant, recording the stage,
+    pages processed and point counts as it goes. Executed in a job process.
+    """
+    # Imported here so web workers never load the ingestion stack for a status request
+    from app.services.embedding_service import embedder
+    from app.services.pdf_service import iter_pdf_pages, iter_qa_pairs, iter_words, iter_chunks, prefetch
+    from app.services.qdrant_service import upload_qa_to_qdrant, upload_chunks_to_qdrant, INGEST_BATCH_SIZE
+
+    store = get_job_store(store_path)
+    job = store.get(job_id, include_filepath=True)
+    pages_processed = 0
+
+    def counted_pages():
+        nonlocal pages_processed
+        for text in iter_pdf_pages(job["filepath"]):
+            pages_processed += 1
+            yield text
+
+    def progress(stage, counts):
+        store.update(
+            job_id,
+            stage=stage,
+            pages_processed=pages_processed,
+            points_upserted=counts["upserted"],
+            points_unchanged=counts["unchanged"],
+            points_deleted=counts["deleted"],
+        )
+
+    store.update(job_id, status="running", stage="extracting", started_at=time.time(), pid=os.getpid())
+    try:
+        if job["kind"] == "qa":
+            items = prefetch(iter_qa_pairs(counted_pages()), max_buffered=2 * INGEST_BATCH_SIZE)
+            counts = upload_qa_to_qdrant(items, job["pdf_id"], job["collection_name"], embedder, progress=progress)
+        else:
+            items = prefetch(iter_chunks(iter_words(counted_pages())), max_buffered=2 * INGEST_BATCH_SIZE)
+            counts = upload_chunks_to_qdrant(items, job["pdf_id"], job["collection_name"], embedder, progress=progress)
+    except Exception as e:
+        log.error("Ingestion job %s failed: %s", job_id, e)
+        store.update(
+            job_id, status="failed", stage="failed", pages_processed=pages_processed,
+            error=str(e), finished_at=time.time()
+        )
+        return
+    finally:
+        try:
+            os.remove(job["filepath"])
+        except OSError:
+            pass
+
+    progress("done", counts)
+    store.update(job_id, status="succeeded", finished_at=time.time())
+    log.info("Ingestion job %s finished.", job_id, extra={"counts": counts})
+
+
+def _lower_priority():
+    try:
+        os.nice(INGEST_JOB_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+class IngestionJobRunner:
+    """
+    Runs ingestion jobs on a small process pool, off the request path.
+
+    Jobs run in separate (spawned, lower-priority) processes with their own
+    embedding model, so a long ingestion neither blocks an HTTP worker nor
+    competes with query threads for the web process's GIL.
+    """
+
+    def __init__(self, max_workers=INGEST_JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self, replace=False):
+        # Created on first use, and again after a fork, so each web worker owns its pool
+        with self._lock:
+            if replace or self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_lower_priority,
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, kind, filename, filepath, pdf_id, collection_name):
+        """Queues a job for the saved upload at `filepath` and returns its id (raises `DocumentBusy`)."""
+        store = get_job_store()
+        job_id = store.create(kind, filename, filepath, pdf_id, collection_name)
+        try:
+            future = self._get_executor().submit(run_ingestion_job, job_id, store.path)
+        except BrokenProcessPool:
+            # A job process died (e.g. out of memory); start a fresh pool
+            future = self._get_executor(replace=True).submit(run_ingestion_job, job_id, store.path)
+
+        def record_crash(future):
+            # run_ingestion_job records its own errors; this catches a dead job process
+            # (which never reached its own cleanup of the upload)
+            error = future.exception()
+            if error is not None:
+                store.update(job_id, status="failed", stage="failed", error=str(error), finished_at=time.time())
+                try:
+                    os.remove(filepath)
+                except OSError:
+                    pass
+
+        future.add_done_callback(record_crash)
+        return job_id
+
+
+job_runner = IngestionJobRunner()
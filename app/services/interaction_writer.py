@@ -0,0 +1,236 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds after which another process's claim on spooled rows is ignored,
+# even if that process is still alive (an insert takes far less)
+SPOOL_CLAIM_TIMEOUT = 300
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class InteractionWriter:
+    """
+    Writes interaction rows to Supabase from a background thread.
+
+    Rows are put on a bounded in-process queue and bulk-inserted by a flusher
+    thread once `batch_size` rows are waiting or `flush_interval` seconds have
+    passed. Batches that cannot be inserted (Supabase unreachable, queue full)
+    go to a local SQLite spool and are replayed once inserts succeed again.
+    Pending rows are flushed when the process exits.
+
+    Every worker on the host shares the spool file. A worker claims the rows
+    it replays (`claimed_by` = its pid) in the same transaction that selects
+    them, so two workers never insert the same row; claims of dead processes
+    are released.
+    """
+
+    def __init__(self, insert_rows, spool_path="interaction_spool.sqlite3", max_queue_size=1000,
+                 batch_size=50, flush_interval=2.0, max_attempts=5):
+        """
+        Args:
+            insert_rows (callable): Inserts a list of row dicts in one request; raises on failure.
+            spool_path (str): SQLite file used to keep rows while Supabase is unreachable.
+            max_queue_size (int): Rows held in memory before new rows are spooled to disk.
+            batch_size (int): Rows per bulk insert.
+            flush_interval (float): Maximum seconds a row waits in memory before a flush.
+            max_attempts (int): Replay attempts for a spooled row before it is dropped.
+        """
+        self.insert_rows = insert_rows
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._init_spool()
+
+        self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, row):
+        """Queues a row for the next batch. Spools it to disk if the queue is full."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            log.warning("Interaction queue full; spooling row to disk.")
+            self._spool([row])
+
+    def flush(self):
+        """Inserts everything currently queued, then replays the spool if Supabase is reachable."""
+        with self._flush_lock:
+            inserted_live = False
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    break
+                if not self._insert(batch):
+                    self._spool(batch)
+                    # Supabase is down: spool the rest without waiting on more failing requests
+                    self._spool(self._drain(self._queue.qsize()))
+                    return
+                inserted_live = True
+            self._replay_spool(isolate_failures=inserted_live)
+
+    def close(self):
+        """Stops the flusher thread and flushes pending rows. Safe to call more than once."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            self._stop.wait(timeout=min(self.flush_interval, 0.1))
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if self._queue.qsize() >= self.batch_size or due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    log.error("Interaction flusher failed: %s", e)
+                last_flush = time.monotonic()
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _insert(self, rows):
+        try:
+            self.insert_rows(rows)
+            return True
+        except Exception as e:
+            log.error("Bulk insert of %d interactions failed: %s", len(rows), e)
+            return False
+
+    def _connect(self):
+        return sqlite3.connect(self.spool_path, timeout=5)
+
+    def _init_spool(self):
+        with self._spool_lock, self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "claimed_by INTEGER, claimed_at REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(spool)")}
+            for column, kind in (("claimed_by", "INTEGER"), ("claimed_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE spool ADD COLUMN {column} {kind}")
+
+    def _spool(self, rows):
+        if not rows:
+            return
+        with self._spool_lock, self._connect() as conn:
+            conn.executemany("INSERT INTO spool (row) VALUES (?)", [(json.dumps(row),) for row in rows])
+        log.info("Spooled %d interactions to %s.", len(rows), self.spool_path)
+
+    def _replay_spool(self, isolate_failures):
+        """
+        Replays spooled rows in batches.
+
+        A failed replay batch is only retried row by row when `isolate_failures`
+        is set, i.e. a live insert just succeeded, so an outage never counts
+        against spooled rows. Rows that keep failing on their own are dropped.
+        """
+        last_id = 0
+        while True:
+            spooled = self._claim_spooled(last_id)
+            if not spooled:
+                return
+            last_id = spooled[-1][0]
+
+            if self._insert([json.loads(row) for _, row in spooled]):
+                self._delete_spooled([row_id for row_id, _ in spooled])
+                continue
+            if not isolate_failures:
+                self._release([row_id for row_id, _ in spooled])
+                return
+
+            # The batch failed even though live inserts work: isolate the bad rows
+            done, failed = [], []
+            for row_id, row in spooled:
+                (done if self._insert([json.loads(row)]) else failed).append(row_id)
+            self._delete_spooled(done)
+            self._mark_failed(failed)
+            if not done:
+                return
+
+    def _claim_spooled(self, after_id):
+        """
+        Claims the next batch of unclaimed rows for this process and returns
+        them. Claims held by dead processes, expired claims and this process's
+        own leftovers (only one replay runs per process) are released first.
+        """
+        pid, now = os.getpid(), time.time()
+        with self._spool_lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            claims = conn.execute("SELECT DISTINCT claimed_by FROM spool WHERE claimed_by IS NOT NULL").fetchall()
+            stale = [owner for (owner,) in claims if owner == pid or not _process_alive(owner)]
+            conn.executemany(
+                "UPDATE spool SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?", [(owner,) for owner in stale]
+            )
+            conn.execute(
+                "UPDATE spool SET claimed_by = NULL, claimed_at = NULL WHERE claimed_at <= ?",
+                (now - SPOOL_CLAIM_TIMEOUT,)
+            )
+            spooled = conn.execute(
+                "SELECT id, row FROM spool WHERE id > ? AND claimed_by IS NULL ORDER BY id LIMIT ?",
+                (after_id, self.batch_size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE spool SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                [(pid, now, row_id) for row_id, _ in spooled]
+            )
+        return spooled
+
+    def _release(self, ids):
+        if not ids:
+            return
+        with self._spool_lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE spool SET claimed_by = NULL, claimed_at = NULL WHERE id = ?", [(row_id,) for row_id in ids]
+            )
+
+    def _delete_spooled(self, ids):
+        if not ids:
+            return
+        with self._spool_lock, self._connect() as conn:
+            conn.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def _mark_failed(self, ids):
+        if not ids:
+            return
+        with self._spool_lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE spool SET attempts = attempts + 1, claimed_by = NULL, claimed_at = NULL WHERE id = ?",
+                [(row_id,) for row_id in ids]
+            )
+            dropped = conn.execute("DELETE FROM spool WHERE attempts >= ?", (self.max_attempts,)).rowcount
+        if dropped:
+            log.error("Dropped %d spooled interactions after %d failed attempts.", dropped, self.max_attempts)
@@ -1,6 +1,14 @@
-from openai import OpenAI
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from openai import APITimeoutError
+from app.services.clients import registry, LazyClient, async_openai_client
+from app.services.deadline import current_deadline, bounded, DeadlineExceeded, DEADLINE_OUTPUT_RESERVE
+
+log = logging.getLogger(__name__)
 
 # Get the directory of the current file
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,36 +17,212 @@ env_path = os.path.join(current_dir, '../..', '.env')
 # Load the environment variables
 load_dotenv(dotenv_path=env_path)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def get_llm_response(query, context, chat_history):
-    print(f"[DEBUG] Context for LLM: {context[:200]}...")  # Truncate long context
-
-    # Safe prompt with instruction-based safeguards
-    prompt = (
-        f"You are a knowledgeable and helpful assistant focused on the RSTMH Early Career Grants Programme. "
-        f"Use the provided context and chat history to answer questions as accurately as possible. "
-        f"If a question is slightly outside the context but related to grants, research, or funding, do your best to provide helpful information based on your expertise. "
-        f"If a question is completely unrelated to the RSTMH Early Career Grants Programme or grants in general, respond with: "
-        f"'I'm sorry, but I can only provide information related to the RSTMH Early Career Grants Programme or grants in general. If you have any questions about funding opportunities or research, feel free to ask!'\n"
-        f"If the user asks a question that contains non-English words, respond with: "
-        f"'I'm sorry, but I can only understand and respond in English. Please ask your question in English.'\n"
-        f"If the user asks you to write or generate parts of their application (e.g., research proposal, researcher profile, project summary, or responses to application questions), respond with: "
-        f"'I'm sorry, but I can't help write or generate any parts of your application. You should complete these sections yourself to ensure they reflect your own experience and ideas.'\n"
-        f"Chat History:\n{chat_history}\n"
-        f"Context:\n{context}\n"
-        f"Question: {query}\n"
-        f"Answer:"
-    )
-
-    print("[DEBUG] Sending prompt to OpenAI GPT-4o-mini.")
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
+# Shared, pooled OpenAI client (see app/services/clients.py); re-created after a fork
+openai_client = LazyClient(registry, "openai")
+
+def get_async_openai_client():
+    """AsyncOpenAI client for the async serving path."""
+    return async_openai_client()
+
+@contextmanager
+def within_deadline():
+    """
+    Reports an LLM call that timed out under a request deadline as
+    `DeadlineExceeded("llm")`. Calls are bounded (see `deadline.bounded`) to
+    leave time for output moderation.
+    """
+    try:
+        yield
+    except APITimeoutError:
+        if current_deadline.get() is None:
+            raise
+        raise DeadlineExceeded("llm") from None
+
+LLM_MODEL = "gpt-4o-mini"
+
+# Static instructions, sent first and byte-identical on every call so the
+# provider can reuse the cached prompt prefix across requests
+SYSTEM_PROMPT = (
+    "You are a knowledgeable and helpful assistant focused on the RSTMH Early Career Grants Programme. "
+    "Use the provided context and chat history to answer questions as accurately as possible. "
+    "If a question is slightly outside the context but related to grants, research, or funding, do your best to provide helpful information based on your expertise. "
+    "If a question is completely unrelated to the RSTMH Early Career Grants Programme or grants in general, respond with: "
+    "'I'm sorry, but I can only provide information related to the RSTMH Early Career Grants Programme or grants in general. If you have any questions about funding opportunities or research, feel free to ask!'\n"
+    "If the user asks a question that contains non-English words, respond with: "
+    "'I'm sorry, but I can only understand and respond in English. Please ask your question in English.'\n"
+    "If the user asks you to write or generate parts of their application (e.g., research proposal, researcher profile, project summary, or responses to application questions), respond with: "
+    "'I'm sorry, but I can't help write or generate any parts of your application. You should complete these sections yourself to ensure they reflect your own experience and ideas.'\n"
+    "Each user message ends with the context retrieved for it, followed by the question to answer."
+)
+
+def build_messages(query, context, chat_history):
+    """
+    Builds the chat messages sent to the LLM, most stable content first:
+    the static system prompt, prior turns as user/assistant messages, then
+    this request's context and question.
+
+    Args:
+        chat_history (list or str): Turns (`{"user": ..., "assistant": ...}`),
+            or an already formatted history string.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    history_text = ""
+    if isinstance(chat_history, str):
+        history_text = f"Chat History:\n{chat_history}\n" if chat_history else ""
+    else:
+        for turn in chat_history or []:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+    messages.append({
+        "role": "user",
+        "content": f"{history_text}Context:\n{context}\n\nQuestion: {query}"
+    })
+    return messages
+
+
+class LLMUsageTracker:
+    """Accumulates token usage and latency of LLM calls in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency = 0.0
+
+    def record(self, usage, latency, first_token_latency=None):
+        """Records one call from the API `usage` object; returns the per-call numbers."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "latency": round(latency, 3),
+        }
+        if first_token_latency is not None:
+            entry["first_token_latency"] = round(first_token_latency, 3)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += entry["prompt_tokens"]
+            self.cached_tokens += entry["cached_tokens"]
+            self.completion_tokens += entry["completion_tokens"]
+            self.latency += latency
+        log.debug("LLM usage.", extra={"usage": entry})
+        return entry
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "mean_latency": self.latency / self.calls if self.calls else 0.0,
+        }
+
+
+llm_usage = LLMUsageTracker()
+
+def get_llm_response(query, context, chat_history, usage=None):
+    """
+    Returns the LLM reply for a query. When `usage` is a dict, it is filled
+    with the call's token counts (prompt, cached, completion) and latency.
+    """
+    messages = build_messages(query, context, chat_history)
+
+    log.debug("Sending %d messages to %s.", len(messages), LLM_MODEL)
+    started = time.perf_counter()
+    with within_deadline():
+        response = bounded(openai_client, DEADLINE_OUTPUT_RESERVE).chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages
+        )
+    entry = llm_usage.record(response.usage, time.perf_counter() - started)
+    if usage is not None:
+        usage.update(entry)
 
     llm_reply = response.choices[0].message.content.strip()
-    print(f"[DEBUG] LLM Reply: {llm_reply}")
+    log.debug("LLM reply: %d chars.", len(llm_reply))
+
+    return llm_reply
+
+def stream_llm_response(query, context, chat_history, usage=None):
+    """
+    Streams the LLM reply for a query, yielding text deltas as they arrive.
+
+    Uses the same messages as `get_llm_response`; callers are responsible for
+    joining the deltas into the final reply. `usage` is filled as in
+    `get_llm_response`, plus the time to the first token, once the stream ends.
+    """
+    messages = build_messages(query, context, chat_history)
+
+    log.debug("Streaming %d messages from %s.", len(messages), LLM_MODEL)
+    started = time.perf_counter()
+    first_token_latency = None
+    with within_deadline():
+        stream = bounded(openai_client, DEADLINE_OUTPUT_RESERVE).chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        for chunk in stream:
+            if chunk.usage is not None:
+                # Sent in a final chunk without choices
+                entry = llm_usage.record(chunk.usage, time.perf_counter() - started, first_token_latency)
+                if usage is not None:
+                    usage.update(entry)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - started
+                yield delta
+
+async def aget_llm_response(query, context, chat_history, usage=None):
+    """Async `get_llm_response` using AsyncOpenAI."""
+    messages = build_messages(query, context, chat_history)
+
+    started = time.perf_counter()
+    with within_deadline():
+        response = await bounded(get_async_openai_client(), DEADLINE_OUTPUT_RESERVE).chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages
+        )
+    entry = llm_usage.record(response.usage, time.perf_counter() - started)
+    if usage is not None:
+        usage.update(entry)
+
+    llm_reply = response.choices[0].message.content.strip()
+    log.debug("LLM reply: %d chars.", len(llm_reply))
+    return llm_reply
+
+async def astream_llm_response(query, context, chat_history, usage=None):
+    """Async `stream_llm_response`: an async generator of text deltas."""
+    messages = build_messages(query, context, chat_history)
+
+    started = time.perf_counter()
+    first_token_latency = None
+    with within_deadline():
+        stream = await bounded(get_async_openai_client(), DEADLINE_OUTPUT_RESERVE).chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
 
-    return llm_reply
\ No newline at end of file
+        async for chunk in stream:
+            if chunk.usage is not None:
+                entry = llm_usage.record(chunk.usage, time.perf_counter() - started, first_token_latency)
+                if usage is not None:
+                    usage.update(entry)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - started
+                yield delta
@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+from qdrant_client.http import models
+from app.services.semantic_cache import answer_cache
+
+log = logging.getLogger(__name__)
+
+
+class LocalVectorIndex:
+    """
+    In-memory mirror of one Qdrant collection for exact cosine search.
+
+    Vectors are L2-normalised into a float32 (or float16) matrix, so a search
+    is one matrix-vector product followed by an `argpartition` top-k. Results
+    are `ScoredPoint`s, like `client.search` returns.
+    """
+
+    # Rows upcast at a time when the matrix is stored as float16
+    BLOCK_ROWS = 8192
+
+    def __init__(self, collection_name, ids, vectors, payloads, dtype="float32"):
+        self.collection_name = collection_name
+        self.ids = list(ids)
+        self.payloads = list(payloads)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(self.ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.vectors = (vectors / norms).astype(np.dtype(dtype))
+
+    @classmethod
+    def from_qdrant(cls, client, collection_name, dtype="float32", page_size=1000):
+        """Loads every point of `collection_name` (vectors and payloads) via scroll."""
+        ids, vectors, payloads = [], [], []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for point in points:
+                ids.append(point.id)
+                vectors.append(point.vector)
+                payloads.append(point.payload)
+            if offset is None:
+                break
+        return cls(collection_name, ids, vectors, payloads, dtype=dtype)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, limit=3):
+        """Returns the `limit` most similar points, highest cosine score first."""
+        if not self.ids:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self._scores(query)
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            models.ScoredPoint(id=self.ids[i], version=0, score=float(scores[i]), payload=self.payloads[i])
+            for i in top
+        ]
+
+    def _scores(self, query):
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+        # float16 has no BLAS path; upcast a block at a time to keep memory flat
+        return np.concatenate([
+            self.vectors[start:start + self.BLOCK_ROWS].astype(np.float32) @ query
+            for start in range(0, len(self.vectors), self.BLOCK_ROWS)
+        ])
+
+
+class LocalIndexManager:
+    """
+    Keeps `LocalVectorIndex` mirrors of small collections for one process.
+
+    A collection is loaded in the background on first use (or by `warm`); until
+    it is ready, or when it holds more than `max_points` points, `search`
+    returns None and the caller queries Qdrant. Ingestion touches the semantic
+    cache marker file; when its mtime changes every mirror is dropped and
+    reloaded, so workers never keep serving a superseded collection.
+    """
+
+    def __init__(self, enabled=False, max_points=20000, dtype="float32",
+                 generation_path="semantic_cache.generation", check_interval=1.0, retry_interval=30.0):
+        self.enabled = enabled
+        self.max_points = max_points
+        self.dtype = dtype
+        self.generation_path = generation_path
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._indexes = {}  # collection name -> LocalVectorIndex, or None when too large
+        self._loading = set()
+        self._failed_at = {}
+        self._generation = self._read_generation()
+        self._checked_at = time.monotonic()
+        self.local_searches = 0
+        self.remote_searches = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def search(self, client, collection_name, query_vector, limit):
+        """Searches the local mirror; returns None when the caller must search Qdrant."""
+        if not self.enabled:
+            return None
+        self._sync_generation(client)
+        index = self._indexes.get(collection_name)
+        if index is None:
+            if collection_name not in self._indexes:
+                self._load_in_background(client, collection_name)
+            self.remote_searches += 1
+            return None
+        self.local_searches += 1
+        return index.search(query_vector, limit)
+
+    def warm(self, client, collection_names):
+        """Starts loading mirrors for `collection_names` (e.g. at startup)."""
+        if self.enabled:
+            for name in collection_names:
+                self._load_in_background(client, name)
+
+    def load(self, client, collection_name):
+        """Loads (or reloads) one mirror synchronously; returns it, or None if not mirrored."""
+        generation = self._generation
+        try:
+            count = client.count(collection_name=collection_name, exact=True).count
+            if count > self.max_points:
+                log.info("'%s' has %d points; searching it remotely.", collection_name, count)
+                index = None
+            else:
+                index = LocalVectorIndex.from_qdrant(client, collection_name, dtype=self.dtype)
+                log.info("Mirrored '%s' locally (%d points).", collection_name, len(index))
+        except Exception as e:
+            log.warning("Could not mirror '%s': %s", collection_name, e)
+            with self._lock:
+                self._loading.discard(collection_name)
+                self._failed_at[collection_name] = time.monotonic()
+            return None
+
+        with self._lock:
+            self._loading.discard(collection_name)
+            # A reload triggered meanwhile supersedes this snapshot
+            if generation == self._generation:
+                self._indexes[collection_name] = index
+        return index
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "collections": {
+                name: len(index) if index is not None else "remote" for name, index in self._indexes.items()
+            },
+            "local_searches": self.local_searches,
+            "remote_searches": self.remote_searches,
+        }
+
+    def _load_in_background(self, client, collection_name):
+        with self._lock:
+            if collection_name in self._loading:
+                return
+            # Do not hammer Qdrant while a collection cannot be loaded
+            if time.monotonic() - self._failed_at.get(collection_name, -self.retry_interval) < self.retry_interval:
+                return
+            self._loading.add(collection_name)
+        threading.Thread(
+            target=self.load, args=(client, collection_name), name="local-index-load", daemon=True
+        ).start()
+
+    def _after_fork(self):
+        # Loader threads do not survive a fork (e.g. gunicorn --preload); let the child load again
+        self._lock = threading.Lock()
+        self._loading = set()
+
+    def _read_generation(self):
+        try:
+            return os.stat(self.generation_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _sync_generation(self, client):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        generation = self._read_generation()
+        if generation == self._generation:
+            return
+        with self._lock:
+            self._generation = generation
+            stale = list(self._indexes)
+            self._indexes.clear()
+        log.info("Collections changed; reloading local mirrors.")
+        self.warm(client, stale)
+
+
+local_indexes = LocalIndexManager(
+    enabled=os.getenv("LOCAL_INDEX_ENABLED", "false").lower() == "true",
+    max_points=int(os.getenv("LOCAL_INDEX_MAX_POINTS", 20000)),
+    dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"),
+    # Touched by every ingestion that changes a collection (see SemanticAnswerCache.invalidate)
+    generation_path=answer_cache.generation_path,
+)
@@ -0,0 +1,216 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily
+
+# Stage latencies range from sub-millisecond cache lookups to multi-second LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Duration of one stage of a query (moderation, embedding, search, LLM, ...).",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "End-to-end duration of a query, until the answer is complete.",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+RETRIEVALS = Counter(
+    "chatbot_retrievals", "Queries by where their context came from (details_vectors = FAQ fallback).",
+    ["source"]
+)
+CONTEXT_TOKENS = Counter(
+    "chatbot_context_tokens", "Tokens of retrieved context sent to the LLM, and tokens saved by merging and de-duplicating.",
+    ["kind"]
+)
+DEGRADATIONS = Counter(
+    "chatbot_degraded", "Stages cut short to meet the request deadline, by what was done instead.",
+    ["stage", "action"]
+)
+
+# Timer of the request being served; copied into pipeline and search threads
+# with the rest of the context, and into asyncio tasks automatically
+current_timer = ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """
+    Per-stage durations of one request. Stages may run on several threads at
+    once; a stage recorded more than once (e.g. two searches of one
+    collection) accumulates.
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.answered_at = None
+        # Set by handlers whose response outlives them (streams); they finish the timer themselves
+        self.finish_deferred = False
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def finish(self):
+        """Marks the answer as complete and observes the end-to-end latency (once)."""
+        with self._lock:
+            if self.answered_at is None:
+                latency = self.elapsed()
+                self.answered_at = self.started_at + timedelta(seconds=latency)
+                REQUEST_SECONDS.labels(self.route).observe(latency)
+            return self.answered_at
+
+    def defer_finish(self):
+        """Leaves `finish` to the caller, for a response that is still being sent when the handler returns."""
+        self.finish_deferred = True
+
+    def timings(self):
+        """Timing fields for the interaction record (see `build_interaction_row`)."""
+        answered_at = self.finish()
+        with self._lock:
+            stages = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        return {
+            "question_asked_at": self.started_at,
+            "bot_answered_at": answered_at,
+            "stages_ms": stages,
+        }
+
+
+@contextmanager
+def request_timer(route):
+    """
+    Makes a new `RequestTimer` current for the enclosed block and finishes it
+    on exit, so every request (errors and rejections included) is observed
+    once, unless the handler deferred that to the end of its response.
+    """
+    timer = RequestTimer(route)
+    token = current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        current_timer.reset(token)
+        if not timer.finish_deferred:
+            timer.finish()
+
+
+@contextmanager
+def use_timer(timer):
+    """Makes an existing timer current again (e.g. inside a streaming generator)."""
+    token = current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        current_timer.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`, in the histogram and the current request's timer."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        timer = current_timer.get()
+        if timer is not None:
+            timer.record(stage, seconds)
+
+
+def timed(stage, fn, *args, **kwargs):
+    """Calls `fn` inside `span(stage)`; for stages submitted to an executor."""
+    with span(stage):
+        return fn(*args, **kwargs)
+
+
+def timed_request(route):
+    """Decorator running a request handler under a new `RequestTimer`."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            with request_timer(route):
+                return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StatsCollector:
+    """
+    Exports the in-process counters services already keep (`stats()` dicts)
+    at scrape time: cache hits and misses, moderation decisions, token counts.
+    """
+
+    def __init__(self):
+        self._sources = {}
+
+    def register(self, name, stats):
+        self._sources[name] = stats
+
+    def _stats(self, name):
+        stats = self._sources.get(name)
+        return stats() if stats else {}
+
+    def collect(self):
+        hits = CounterMetricFamily("chatbot_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("chatbot_cache_misses", "Cache misses.", labels=["cache"])
+        for name in ("answer_cache", "embedding_cache", "moderation_cache"):
+            stats = self._stats(name)
+            if stats:
+                hits.add_metric([name], stats.get("hits", 0))
+                misses.add_metric([name], stats.get("misses", 0))
+        yield hits
+        yield misses
+
+        moderation = self._stats("moderation")
+        if moderation:
+            decisions = CounterMetricFamily(
+                "chatbot_moderation_decisions", "Moderation verdicts by who decided.", labels=["decided_by"]
+            )
+            for decided_by in ("cached", "local_benign", "local_flagged", "remote"):
+                decisions.add_metric([decided_by], moderation.get(decided_by, 0))
+            yield decisions
+
+        llm = self._stats("llm_usage")
+        if llm:
+            tokens = CounterMetricFamily("chatbot_llm_tokens", "LLM tokens used.", labels=["kind"])
+            for kind in ("prompt", "cached", "completion"):
+                tokens.add_metric([kind], llm.get(f"{kind}_tokens", 0))
+            yield tokens
+            yield CounterMetricFamily("chatbot_llm_calls", "LLM calls.", value=llm.get("calls", 0))
+
+        local_index = self._stats("local_index")
+        if local_index:
+            searches = CounterMetricFamily(
+                "chatbot_local_index_searches", "Searches answered by the in-memory mirror or Qdrant.",
+                labels=["where"]
+            )
+            searches.add_metric(["local"], local_index.get("local_searches", 0))
+            searches.add_metric(["remote"], local_index.get("remote_searches", 0))
+            yield searches
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def render_metrics():
+    """Prometheus text exposition. With PROMETHEUS_MULTIPROC_DIR set, histograms cover all workers."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # In-process counters are still per worker
+        registry.register(stats_collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,285 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+from app.services.cache_utils import TTLCache
+from app.services.embedding_cache import text_hash
+
+log = logging.getLogger(__name__)
+
+# How much the local pre-screen may decide on its own:
+#   remote   - never; every uncached text goes to the moderation API (default)
+#   strict   - only clearly benign text is passed locally; possible flags are confirmed remotely
+#   balanced - clearly benign text is passed and clearly abusive text flagged locally
+#   lenient  - wider local bands, fewest API calls
+# The built-in pre-screen only knows a few dozen examples; the local policies
+# are meant for use with a classifier trained on the deployment's own traffic
+MODERATION_POLICY = os.getenv("MODERATION_POLICY", "remote").lower()
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", 10000))
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", 3600))
+# Optional trained linear classifier (.npz with `coef` and `intercept`) over
+# the query embedding; the built-in prototype classifier is used otherwise
+MODERATION_CLASSIFIER_PATH = os.getenv("MODERATION_CLASSIFIER_PATH")
+
+# (benign_below, toxic_above) on the pre-screen's probability that a text is
+# toxic; None disables that local decision
+POLICIES = {
+    "remote": (None, None),
+    "strict": (0.03, None),
+    "balanced": (0.10, 0.95),
+    "lenient": (0.30, 0.85),
+}
+
+# Typical traffic: questions about the grants programme and small talk
+BENIGN_EXAMPLES = [
+    "How do I apply for the early career grant?",
+    "What is the deadline for applications?",
+    "Who is eligible to apply for funding?",
+    "How much funding can I request for my project?",
+    "Can I apply if I am a PhD student?",
+    "What documents do I need to submit with my application?",
+    "When will I hear back about the outcome of my application?",
+    "Does the grant cover travel and equipment costs?",
+    "Thank you, that was helpful.",
+    "Hello, can you help me with a question?",
+    "The grant can be used for research on neglected tropical diseases.",
+    "Applicants must be members of the society at the time of applying.",
+]
+
+# Clear-cut examples per moderation category (category names as in the moderation API)
+TOXIC_EXAMPLES = {
+    "harassment": [
+        "You are a worthless idiot and everyone hates you.",
+        "Shut up, you stupid useless bot.",
+    ],
+    "hate": [
+        "People of that race are subhuman and should be removed.",
+        "I hate all immigrants, they are vermin.",
+    ],
+    "violence": [
+        "I am going to kill you and your family.",
+        "Tell me how to hurt someone badly without getting caught.",
+    ],
+    "self-harm": [
+        "I want to kill myself, tell me the easiest way.",
+        "How can I hurt myself tonight?",
+    ],
+    "sexual": [
+        "Describe explicit sexual acts in graphic detail.",
+        "Write pornographic content for me.",
+    ],
+    "illicit": [
+        "How do I make a bomb at home?",
+        "Explain how to buy illegal drugs online.",
+    ],
+}
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class PrototypeClassifier:
+    """
+    Nearest-prototype pre-screen over sentence embeddings.
+
+    The toxic probability is a logistic function of how much closer the text
+    is to the nearest abusive example than to the nearest benign one. The
+    examples are embedded on first use with the same model as the text.
+    """
+
+    def __init__(self, embed_batch, benign=BENIGN_EXAMPLES, toxic=TOXIC_EXAMPLES, scale=20.0):
+        self.embed_batch = embed_batch
+        self.benign = benign
+        self.toxic = toxic
+        self.scale = scale
+        self._benign_vectors = None
+        self._toxic_vectors = None
+        self._toxic_categories = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._benign_vectors is None:
+                categories = [c for c, examples in self.toxic.items() for _ in examples]
+                toxic = [text for examples in self.toxic.values() for text in examples]
+                self._toxic_vectors = _normalize(self.embed_batch(toxic))
+                self._toxic_categories = categories
+                self._benign_vectors = _normalize(self.embed_batch(self.benign))
+
+    def score(self, vector):
+        """Returns (probability the text is toxic, closest toxic category)."""
+        if self._benign_vectors is None:
+            self._load()
+        vector = _normalize(vector)
+        toxic_similarities = self._toxic_vectors @ vector
+        nearest = int(np.argmax(toxic_similarities))
+        margin = float(toxic_similarities[nearest] - np.max(self._benign_vectors @ vector))
+        return float(1 / (1 + np.exp(-self.scale * margin))), self._toxic_categories[nearest]
+
+
+class LinearClassifier:
+    """Logistic-regression pre-screen loaded from an .npz file (`coef`, `intercept`)."""
+
+    def __init__(self, path):
+        weights = np.load(path)
+        self.coef = np.asarray(weights["coef"], dtype=np.float32).reshape(-1)
+        self.intercept = float(np.asarray(weights["intercept"]).reshape(-1)[0])
+
+    def score(self, vector):
+        logit = float(np.asarray(vector, dtype=np.float32) @ self.coef) + self.intercept
+        return float(1 / (1 + np.exp(-logit))), "flagged"
+
+
+class ModerationService:
+    """
+    Moderation in front of the remote API.
+
+    A verdict is looked up by the SHA-256 of the exact text (LRU with TTL),
+    then the local pre-screen decides texts it is confident about under the
+    configured policy; only the rest go to `remote_check`. Remote errors fail
+    open, as `ToxicityChecker` always has, and are not cached.
+
+    Args:
+        remote_check: `content -> (flagged, categories)`, may raise.
+        embed: `content -> vector` for the local pre-screen.
+        embed_reply: `embed` for model replies (`check(..., reply=True)`),
+            e.g. one that bypasses the query embedding cache; defaults to `embed`.
+        classifier: Object with `score(vector) -> (toxic probability, category)`.
+        retry_interval: Seconds the pre-screen stays off after it fails
+            (e.g. the embedding model cannot be loaded).
+    """
+
+    def __init__(self, remote_check, embed, classifier, policy=MODERATION_POLICY, cache=None,
+                 aremote_check=None, aembed=None, benign_below=None, toxic_above=None, retry_interval=60.0,
+                 embed_reply=None, aembed_reply=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown MODERATION_POLICY: {policy}")
+        self.remote_check = remote_check
+        self.aremote_check = aremote_check
+        self.embed = embed
+        self.aembed = aembed
+        self.embed_reply = embed_reply or embed
+        self.aembed_reply = aembed_reply or aembed
+        self.classifier = classifier
+        self.policy = policy
+        default_benign, default_toxic = POLICIES[policy]
+        self.benign_below = default_benign if benign_below is None else benign_below
+        self.toxic_above = default_toxic if toxic_above is None else toxic_above
+        if policy == "remote":
+            self.benign_below = self.toxic_above = None
+        self.cache = cache if cache is not None else TTLCache(
+            max_entries=MODERATION_CACHE_SIZE, ttl=MODERATION_CACHE_TTL
+        )
+        self.retry_interval = retry_interval
+        self._prescreen_failed_at = None
+        self._counter_lock = threading.Lock()
+        self.cached = 0
+        self.local_benign = 0
+        self.local_flagged = 0
+        self.remote = 0
+        self.remote_errors = 0
+        self.prescreen_errors = 0
+
+    def _count(self, counter):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _prescreen_enabled(self):
+        if self.benign_below is None and self.toxic_above is None:
+            return False
+        failed_at = self._prescreen_failed_at
+        return failed_at is None or time.monotonic() - failed_at >= self.retry_interval
+
+    def _local_verdict(self, vector):
+        """(flagged, categories) when the pre-screen is confident, else None."""
+        probability, category = self.classifier.score(vector)
+        if self.benign_below is not None and probability <= self.benign_below:
+            self._count("local_benign")
+            return False, {}
+        if self.toxic_above is not None and probability >= self.toxic_above:
+            self._count("local_flagged")
+            return True, {category: True, "local_prescreen": True}
+        return None
+
+    def _prescreen_failed(self, e):
+        log.warning("Moderation pre-screen unavailable (%s); using the moderation API.", e)
+        self._prescreen_failed_at = time.monotonic()
+        self._count("prescreen_errors")
+
+    def check(self, content, reply=False):
+        """
+        Returns (is_toxic, categories), like `ToxicityChecker.check_toxicity`.
+        `reply` marks a model reply, embedded with `embed_reply`.
+        """
+        key = text_hash(content)
+        verdict = self.cache.get(key)
+        if verdict is not None:
+            self._count("cached")
+            return verdict
+
+        if self._prescreen_enabled():
+            try:
+                embed = self.embed_reply if reply else self.embed
+                verdict = self._local_verdict(embed(content))
+            except Exception as e:
+                self._prescreen_failed(e)
+        if verdict is None:
+            try:
+                verdict = self.remote_check(content)
+            except Exception as e:
+                log.error("Error checking toxicity: %s", e)
+                self._count("remote_errors")
+                return False, {}
+            self._count("remote")
+        self.cache.set(key, verdict)
+        return verdict
+
+    async def acheck(self, content, reply=False):
+        """Async `check`, using `aembed` (`aembed_reply`) and `aremote_check`."""
+        key = text_hash(content)
+        verdict = self.cache.get(key)
+        if verdict is not None:
+            self._count("cached")
+            return verdict
+
+        if self._prescreen_enabled():
+            try:
+                aembed = self.aembed_reply if reply else self.aembed
+                verdict = self._local_verdict(await aembed(content))
+            except Exception as e:
+                self._prescreen_failed(e)
+        if verdict is None:
+            try:
+                verdict = await self.aremote_check(content)
+            except Exception as e:
+                log.error("Error checking toxicity: %s", e)
+                self._count("remote_errors")
+                return False, {}
+            self._count("remote")
+        self.cache.set(key, verdict)
+        return verdict
+
+    def stats(self):
+        decided = self.cached + self.local_benign + self.local_flagged + self.remote
+        return {
+            "policy": self.policy,
+            "cached": self.cached,
+            "local_benign": self.local_benign,
+            "local_flagged": self.local_flagged,
+            "remote": self.remote,
+            "remote_errors": self.remote_errors,
+            "prescreen_errors": self.prescreen_errors,
+            "remote_ratio": self.remote / decided if decided else 0.0,
+            "cache": self.cache.stats(),
+        }
+
+
+def load_classifier(embed_batch):
+    """The trained classifier from MODERATION_CLASSIFIER_PATH, or the prototype classifier."""
+    if MODERATION_CLASSIFIER_PATH:
+        return LinearClassifier(MODERATION_CLASSIFIER_PATH)
+    return PrototypeClassifier(embed_batch)
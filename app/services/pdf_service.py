@@ -1,34 +1,83 @@
+import queue
+import threading
+from itertools import islice
 import PyPDF2
 
-def extract_text_from_pdf(pdf_path):
-    """Extracts the full text from a PDF."""
+def iter_pdf_pages(pdf_path):
+    """Yields the text of each page of a PDF, one page at a time."""
     with open(pdf_path, 'rb') as f:
         reader = PyPDF2.PdfReader(f)
-        full_text = ""
         for page in reader.pages:
-            full_text += page.extract_text() or ""
-    return full_text
+            yield page.extract_text() or ""
 
-def extract_qa_from_pdf(pdf_path):
-    """Extracts question-answer pairs from a PDF."""
-    text = extract_text_from_pdf(pdf_path)
-    lines = text.split("\n")
-    qa_pairs = []
+def extract_text_from_pdf(pdf_path):
+    """Extracts the full text from a PDF."""
+    return "".join(iter_pdf_pages(pdf_path))
+
+def iter_lines(pages):
+    """Yields the lines of the concatenated pages, exactly as `"".join(pages).split("\\n")` would."""
+    pending = ""
+    for text in pages:
+        lines = (pending + text).split("\n")
+        pending = lines.pop()
+        yield from lines
+    yield pending
+
+def iter_words(pages):
+    """Yields the words of the concatenated pages, exactly as `"".join(pages).split()` would."""
+    pending = ""
+    for text in pages:
+        if not text:
+            continue
+        text = pending + text
+        words = text.split()
+        # A word touching the end of the page may continue on the next one
+        pending = words.pop() if words and not text[-1].isspace() else ""
+        yield from words
+    if pending:
+        yield pending
+
+def iter_qa_pairs(pages):
+    """Yields question-answer pairs from page texts (see `extract_qa_from_pdf`)."""
     question = None
+    answer = ""
 
-    for line in lines:
+    for line in iter_lines(pages):
         if line.strip().endswith("?"):  # Identify questions
             if question:
-                qa_pairs.append((question, answer.strip()))
+                yield (question, answer.strip())
             question = line.strip()
             answer = ""
         elif question:
             answer += " " + line.strip()
 
     if question and answer.strip():
-        qa_pairs.append((question, answer.strip()))
-    
-    return qa_pairs
+        yield (question, answer.strip())
+
+def extract_qa_from_pdf(pdf_path):
+    """Extracts question-answer pairs from a PDF."""
+    return list(iter_qa_pairs(iter_pdf_pages(pdf_path)))
+
+def iter_chunks(words, max_length=500, overlap=100):
+    """
+    Yields overlapping chunks from a stream of words, holding at most
+    `max_length` words at a time. Produces the same chunks as `chunk_text`.
+    """
+    step = max_length - overlap
+    buffer = []
+    for word in words:
+        buffer.append(word)
+        if len(buffer) == max_length:
+            yield " ".join(buffer)
+            del buffer[:step]
+    # Remaining chunk starts, as range(0, len(words), step) would produce them
+    while buffer:
+        yield " ".join(buffer[:max_length])
+        del buffer[:step]
+
+def iter_pdf_chunks(pdf_path, max_length=500, overlap=100):
+    """Streams a PDF into overlapping text chunks; overlap is carried across page boundaries."""
+    return iter_chunks(iter_words(iter_pdf_pages(pdf_path)), max_length, overlap)
 
 def chunk_text(text, max_length=500, overlap=100):
     """Splits text into overlapping chunks."""
@@ -37,4 +86,54 @@ def chunk_text(text, max_length=500, overlap=100):
         " ".join(words[i:i + max_length])
         for i in range(0, len(words), max_length - overlap)
     ]
-    return chunks
\ No newline at end of file
+    return chunks
+
+def batched(iterable, size):
+    """Yields lists of up to `size` consecutive items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def prefetch(iterable, max_buffered=64):
+    """
+    Runs `iterable` on a background thread, buffering at most `max_buffered`
+    items. The producer blocks while the buffer is full, so a slow consumer
+    (embedding, upserts) applies backpressure to a fast producer (extraction).
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=max_buffered)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        # Gives up once the consumer has stopped, so the thread never blocks forever
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, name="ingestion-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Lets the producer exit if the consumer stops early
+        stop.set()
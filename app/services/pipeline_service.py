@@ -0,0 +1,51 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared pool for overlapping the independent network-bound stages of a query
+# (moderation, embedding + search, session upkeep, logging).
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", 16))
+
+executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="query-pipeline")
+
+
+class PipelineStage:
+    """
+    A stage submitted to the shared pipeline executor.
+
+    The stage function receives a `threading.Event` as its `cancel_event`
+    keyword argument when `cancellable=True`, so multi-step stages can stop
+    between steps once `cancel()` has been called.
+    """
+
+    def __init__(self, fn, *args, cancellable=False, **kwargs):
+        self.cancel_event = threading.Event()
+        if cancellable:
+            kwargs["cancel_event"] = self.cancel_event
+        # Runs in a copy of the caller's context, so the request's timer follows it
+        self.future = executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def result(self, timeout=None):
+        """Blocks until the stage finishes and returns its result (re-raising its exception)."""
+        return self.future.result(timeout=timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        """
+        Cancels the stage: drops it if it has not started yet, otherwise signals
+        it to stop at its next checkpoint. Its result is never read afterwards.
+        """
+        self.cancel_event.set()
+        self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+def submit(fn, *args, cancellable=False, **kwargs):
+    """Starts `fn` on the shared pipeline executor and returns its `PipelineStage`."""
+    return PipelineStage(fn, *args, cancellable=cancellable, **kwargs)
@@ -1,6 +1,18 @@
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from dotenv import load_dotenv
+from app.services.semantic_cache import answer_cache
+from app.services.local_index import local_indexes
+from app.services.collection_profiles import get_profile
+from app.services.embedding_cache import encode_with_store, text_hash
+from app.services.pdf_service import batched
+from app.services.clients import registry, LazyClient, qdrant_client, async_qdrant_client
+from app.services.metrics import span
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import logging
+import threading
+import uuid
 import os
 
 # Get the directory of the current file
@@ -10,12 +22,29 @@ env_path = os.path.join(current_dir, '../..', '.env')
 # Load the environment variables
 load_dotenv(dotenv_path=env_path)
 
-# print(os.getenv('QDRANT_URL'), os.getenv('QD_API_TOKEN'))
+log = logging.getLogger(__name__)
 
-# Initialize Qdrant client
-client = QdrantClient(
-    url=os.getenv('QDRANT_URL'),  # Qdrant URL from environment variables
-    api_key=os.getenv('QD_API_TOKEN')  # Qdrant API Key from environment variables
+# Shared, pooled Qdrant client (see app/services/clients.py); re-created after a fork
+client = LazyClient(registry, "qdrant")
+
+def get_async_client():
+    """AsyncQdrantClient for the async serving path."""
+    return async_qdrant_client()
+
+# Points embedded and upserted per batch during ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+
+# Collections whose profile has been applied by this process; guarded by
+# `_collections_lock`, which also serialises collection creation
+_profiled_collections = set()
+_collections_lock = threading.RLock()
+
+# `sequential` searches details only after an FAQ miss; `concurrent` starts both
+# searches together so a fallback costs one round trip instead of two
+SEARCH_FALLBACK_MODE = os.getenv("SEARCH_FALLBACK_MODE", "sequential").lower()
+# Separate from the query pipeline pool, whose threads wait on these searches
+search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_MAX_WORKERS", 16)), thread_name_prefix="qdrant-search"
 )
 
 def initialize_qdrant_client():
@@ -28,7 +57,7 @@ def initialize_qdrant_client():
     if not QDRANT_URL or not API_KEY:
         raise ValueError("QDRANT_URL and QD_API_TOKEN environment variables must be set.")
 
-    return QdrantClient(QDRANT_URL, api_key=API_KEY)
+    return qdrant_client()
 
 def list_collections():
     """
@@ -54,7 +83,7 @@ def list_collections():
         return collection_details
 
     except Exception as e:
-        print(f"[ERROR] Failed to list collections: {e}")
+        log.error("Failed to list collections: %s", e)
         return []
 
 def print_collections():
@@ -77,48 +106,207 @@ def print_collections():
 def recreate_qdrant_collection(vector_size, collection_name):
     """Deletes and recreates a Qdrant collection."""
     if client.collection_exists(collection_name=collection_name):
-        print(f"[INFO] Deleting existing collection: {collection_name}...")
+        log.info("Deleting existing collection %s.", collection_name)
         client.delete_collection(collection_name=collection_name)
-    print(f"[INFO] Creating new collection: {collection_name}...")
-    client.create_collection(
-        collection_name=collection_name,
-        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE)
-    )
+    create_qdrant_collection(vector_size, collection_name)
 
-def upload_qa_to_qdrant(qa_pairs, pdf_id, collection_name, embedder):
-    """Uploads question-answer pairs as vectors to a Qdrant collection."""
-    questions = [q for q, _ in qa_pairs]
-    embeddings = embedder.encode(questions)
-    recreate_qdrant_collection(len(embeddings[0]), collection_name)
-    points = [
-        models.PointStruct(
-            id=idx,
-            vector=embedding.tolist(),
-            payload={
-                "pdf_id": pdf_id,
-                "question": question,
-                "answer": answer
-            }
+def create_qdrant_collection(vector_size, collection_name):
+    """Creates a collection with its performance profile and payload indexes."""
+    profile = get_profile(collection_name)
+    log.info("Creating collection %s (profile '%s').", collection_name, profile.name)
+    client.create_collection(collection_name=collection_name, **profile.create_collection_kwargs(vector_size))
+    create_payload_indexes(collection_name, profile)
+    with _collections_lock:
+        _profiled_collections.add(collection_name)
+
+def create_payload_indexes(collection_name, profile):
+    """Indexes the payload fields the profile lists as keywords (a no-op when they exist)."""
+    for field_name in profile.payload_indexes:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD
         )
-        for idx, (embedding, (question, answer)) in enumerate(zip(embeddings, qa_pairs))
-    ]
-    client.upsert(collection_name=collection_name, points=points)
-    print(f"[SUCCESS] Uploaded {len(points)} QA pairs to collection '{collection_name}'.")
-
-def upload_chunks_to_qdrant(chunks, pdf_id, collection_name, embedder):
-    """Uploads text chunks as vectors to a Qdrant collection."""
-    embeddings = embedder.encode(chunks)
-    recreate_qdrant_collection(len(embeddings[0]), collection_name)
-    points = [
-        models.PointStruct(
-            id=idx,
-            vector=embedding.tolist(),
-            payload={"text": chunk, "pdf_id": pdf_id}
+
+def apply_collection_profile(collection_name):
+    """
+    Brings an existing collection in line with its profile: updates HNSW,
+    quantization and on-disk settings that differ, and adds missing payload
+    indexes. Qdrant rebuilds the affected indexes in the background.
+    """
+    profile = get_profile(collection_name)
+    config = client.get_collection(collection_name=collection_name).config
+    updates = {}
+
+    hnsw = config.hnsw_config
+    if (profile.hnsw_m is not None and hnsw.m != profile.hnsw_m) or \
+            (profile.hnsw_ef_construct is not None and hnsw.ef_construct != profile.hnsw_ef_construct):
+        updates["hnsw_config"] = profile.hnsw_config()
+    if profile.quantization and config.quantization_config is None:
+        updates["quantization_config"] = profile.quantization_config()
+    if profile.on_disk_vectors is not None and bool(config.params.vectors.on_disk) != profile.on_disk_vectors:
+        updates["vectors_config"] = {"": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)}
+    if profile.on_disk_payload is not None and config.params.on_disk_payload != profile.on_disk_payload:
+        updates["collection_params"] = models.CollectionParamsDiff(on_disk_payload=profile.on_disk_payload)
+
+    if updates:
+        log.info("Applying profile '%s' to %s: %s", profile.name, collection_name, sorted(updates))
+        client.update_collection(collection_name=collection_name, **updates)
+    create_payload_indexes(collection_name, profile)
+    with _collections_lock:
+        _profiled_collections.add(collection_name)
+    return sorted(updates)
+
+def ensure_qdrant_collection(vector_size, collection_name):
+    """
+    Creates a Qdrant collection if it does not exist yet; existing data is left
+    untouched, but the collection's profile is applied once per process.
+
+    Safe to call from several threads (upload workers) and processes
+    (ingestion jobs): threads take turns, and a process that loses the race
+    to create the collection uses the one created by the winner.
+    """
+    with _collections_lock:
+        if client.collection_exists(collection_name=collection_name):
+            if collection_name not in _profiled_collections:
+                apply_collection_profile(collection_name)
+            return False
+        try:
+            create_qdrant_collection(vector_size, collection_name)
+        except Exception:
+            if not client.collection_exists(collection_name=collection_name):
+                raise
+            log.info("Collection %s was created by another process.", collection_name)
+            apply_collection_profile(collection_name)
+            return False
+        return True
+
+def document_point_id(pdf_id, content):
+    """Deterministic point id for a piece of content from a given document."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{pdf_id}:{text_hash(content)}"))
+
+def document_point_ids(collection_name, pdf_id, page_size=1000):
+    """Returns the ids of every point stored for `pdf_id` in the collection."""
+    if not client.collection_exists(collection_name=collection_name):
+        return set()
+
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=models.Filter(must=[
+                models.FieldCondition(key="pdf_id", match=models.MatchValue(value=pdf_id))
+            ]),
+            limit=page_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
         )
-        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings))
-    ]
-    client.upsert(collection_name=collection_name, points=points)
-    print(f"[SUCCESS] Uploaded {len(points)} text chunks to collection '{collection_name}'.")
+        # Ids keep their stored type (points from older uploads used integer ids)
+        ids.update(point.id for point in points)
+        if offset is None:
+            return ids
+
+def delete_document_points(collection_name, pdf_id, point_ids):
+    """Deletes the given points of `pdf_id` with a filtered delete."""
+    client.delete(
+        collection_name=collection_name,
+        points_selector=models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="pdf_id", match=models.MatchValue(value=pdf_id)),
+            models.HasIdCondition(has_id=list(point_ids))
+        ]))
+    )
+
+def sync_document_points(collection_name, pdf_id, items, embedder, batch_size=INGEST_BATCH_SIZE, progress=None):
+    """
+    Makes the collection hold exactly the given points for `pdf_id`.
+
+    Point ids are derived from (`pdf_id`, content hash), so unchanged content
+    keeps its id: only new or changed points are embedded and upserted, then
+    points of this document that are no longer present are deleted. The
+    collection is created if missing and stays queryable throughout.
+
+    `items` may be a generator; it is consumed in batches of `batch_size`, each
+    embedded and upserted before the next is read, so memory is bounded by the
+    batch size (plus the set of point ids) rather than by the document size.
+
+    Args:
+        items (iterable): (text to embed, payload, identifying content) tuples;
+            `pdf_id` and `content_hash` are added to each payload.
+        progress (callable): Optional `progress(stage, counts)` hook, called with
+            stage "upserting" after every batch and "deleting" before stale
+            points are removed.
+
+    Returns:
+        dict: Counts of `upserted`, `deleted` and `unchanged` points.
+    """
+    existing = document_point_ids(collection_name, pdf_id)
+    seen = set()
+    counts = {"upserted": 0, "deleted": 0, "unchanged": 0}
+
+    for batch in batched(items, batch_size):
+        new_points = {}
+        for text, payload, content in batch:
+            point_id = document_point_id(pdf_id, content)
+            if point_id in seen:
+                continue
+            seen.add(point_id)
+            if point_id in existing:
+                counts["unchanged"] += 1
+            else:
+                new_points[point_id] = (text, {**payload, "pdf_id": pdf_id, "content_hash": text_hash(content)})
+
+        if new_points:
+            embeddings = encode_with_store([text for text, _ in new_points.values()], embedder)
+            ensure_qdrant_collection(len(embeddings[0]), collection_name)
+            client.upsert(
+                collection_name=collection_name,
+                points=[
+                    models.PointStruct(id=point_id, vector=embedding.tolist(), payload=payload)
+                    for (point_id, (_, payload)), embedding in zip(new_points.items(), embeddings)
+                ]
+            )
+            counts["upserted"] += len(new_points)
+
+        if progress:
+            progress("upserting", dict(counts))
+
+    stale_ids = existing - seen
+    if stale_ids:
+        if progress:
+            progress("deleting", dict(counts))
+        delete_document_points(collection_name, pdf_id, stale_ids)
+        counts["deleted"] = len(stale_ids)
+
+    if counts["upserted"] or counts["deleted"]:
+        answer_cache.invalidate()
+
+    return counts
+
+def upload_qa_to_qdrant(qa_pairs, pdf_id, collection_name, embedder, progress=None):
+    """Uploads question-answer pairs (any iterable) as vectors to a Qdrant collection, replacing only what changed."""
+    counts = sync_document_points(
+        collection_name,
+        pdf_id,
+        ((question, {"question": question, "answer": answer}, f"{question}\n{answer}") for question, answer in qa_pairs),
+        embedder,
+        progress=progress
+    )
+    log.info("Synced QA pairs to collection '%s'.", collection_name, extra={"pdf_id": pdf_id, "counts": counts})
+    return counts
+
+def upload_chunks_to_qdrant(chunks, pdf_id, collection_name, embedder, progress=None):
+    """Uploads text chunks (any iterable) as vectors to a Qdrant collection, replacing only what changed."""
+    counts = sync_document_points(
+        collection_name,
+        pdf_id,
+        ((chunk, {"text": chunk}, chunk) for chunk in chunks),
+        embedder,
+        progress=progress
+    )
+    log.info("Synced text chunks to collection '%s'.", collection_name, extra={"pdf_id": pdf_id, "counts": counts})
+    return counts
 
 def search_qdrant(query, collection_name, embedder, top_k=3):
     """Searches a Qdrant collection for the most relevant results."""
@@ -126,12 +314,30 @@ def search_qdrant(query, collection_name, embedder, top_k=3):
     results = client.search(
         collection_name=collection_name,
         query_vector=query_vector,
-        limit=top_k
+        limit=top_k,
+        search_params=get_profile(collection_name).search_params()
     )
-    print(f"[DEBUG] Search Results in {collection_name}: {results}")
+    log.debug("%d results from %s.", len(results), collection_name)
+    return results
+
+def search_collection(collection_name, query_vector, limit):
+    """Searches the local mirror of a collection when one is loaded, otherwise Qdrant."""
+    with span(f"search:{collection_name}"):
+        results = local_indexes.search(client, collection_name, query_vector, limit)
+        if results is None:
+            results = client.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=limit,
+                search_params=get_profile(collection_name).search_params()
+            )
     return results
 
-def search_with_fallback(query_vector, faq_collection, details_collection, top_k=3, threshold=0.8):
+def warm_local_indexes(collection_names):
+    """Starts mirroring `collection_names` locally when LOCAL_INDEX_ENABLED is set."""
+    local_indexes.warm(client, [name for name in collection_names if name])
+
+def search_with_fallback(query_vector, faq_collection, details_collection, top_k=3, threshold=0.8, mode=None):
     """
     Searches Qdrant collections with a fallback mechanism.
 
@@ -141,52 +347,96 @@ def search_with_fallback(query_vector, faq_collection, details_collection, top_k
         details_collection (str): The name of the Details collection.
         top_k (int): Number of top results to retrieve.
         threshold (float): Minimum score to consider a result as relevant.
+        mode (str): `sequential` or `concurrent` (default: SEARCH_FALLBACK_MODE).
+            Both return the same results; `concurrent` overlaps the details
+            search with the FAQ search and discards it on an FAQ hit.
 
     Returns:
         tuple: A tuple containing the search results and the source collection name.
     """
+    mode = (mode or SEARCH_FALLBACK_MODE).lower()
+    details_search = None
     try:
-        print(f"[DEBUG] Searching FAQ collection: {faq_collection}")
-        faq_results = client.search(
-            collection_name=faq_collection,
-            query_vector=query_vector,
-            limit=top_k
-        )
-        print(f"[DEBUG] FAQ Results: {faq_results}")
+        if mode == "concurrent":
+            details_search = search_executor.submit(
+                contextvars.copy_context().run, search_collection, details_collection, query_vector, top_k
+            )
+
+        faq_results = search_collection(faq_collection, query_vector, top_k)
 
         # Check if any FAQ result meets the threshold
         # if faq_results and any(result.score >= threshold for result in faq_results):
         if faq_results:
             # Check if any result meets the threshold
             if any(getattr(result, "score", 0) >= threshold for result in faq_results):
-                print("[DEBUG] Relevant FAQ result found.")
                 return faq_results, faq_collection
 
-        print("[INFO] Falling back to Details collection...")
-        details_results = client.search(
-            collection_name=details_collection,
-            query_vector=query_vector,
-            limit=top_k
-        )
-        print(f"[DEBUG] Details Results: {details_results}")
+        log.debug("No FAQ result above %.2f; falling back to %s.", threshold, details_collection)
+        if details_search is not None:
+            details_results = details_search.result()
+            details_search = None
+        else:
+            details_results = search_collection(details_collection, query_vector, top_k)
+
+        return details_results, details_collection
+
+    except Exception as e:
+        log.error("Search with fallback failed: %s", e)
+        raise
+    finally:
+        # An FAQ hit (or error) leaves the details search unused
+        if details_search is not None:
+            details_search.cancel()
+
+async def asearch_collection(collection_name, query_vector, limit):
+    """Async `search_collection`."""
+    with span(f"search:{collection_name}"):
+        results = local_indexes.search(client, collection_name, query_vector, limit)
+        if results is None:
+            results = await get_async_client().search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=limit,
+                search_params=get_profile(collection_name).search_params()
+            )
+    return results
+
+async def asearch_with_fallback(query_vector, faq_collection, details_collection, top_k=3, threshold=0.8, mode=None):
+    """Async `search_with_fallback`, with the same FAQ-first rule and modes."""
+    mode = (mode or SEARCH_FALLBACK_MODE).lower()
+    details_search = None
+    try:
+        if mode == "concurrent":
+            details_search = asyncio.ensure_future(asearch_collection(details_collection, query_vector, top_k))
+
+        faq_results = await asearch_collection(faq_collection, query_vector, top_k)
+        if faq_results and any(getattr(result, "score", 0) >= threshold for result in faq_results):
+            return faq_results, faq_collection
 
+        log.debug("No FAQ result above %.2f; falling back to %s.", threshold, details_collection)
+        if details_search is not None:
+            details_results = await details_search
+            details_search = None
+        else:
+            details_results = await asearch_collection(details_collection, query_vector, top_k)
         return details_results, details_collection
 
     except Exception as e:
-        print(f"[ERROR] Error in search_with_fallback: {str(e)}")
+        log.error("Async search with fallback failed: %s", e)
         raise
+    finally:
+        if details_search is not None:
+            details_search.cancel()
 
 def delete_all_collections():
     """Deletes all collections from Qdrant."""
     try:
         collections = client.get_collections().collections
         if not collections:
-            print("[INFO] No collections found in Qdrant.")
+            log.info("No collections found in Qdrant.")
             return
         for collection in collections:
-            collection_name = collection.name
-            print(f"[INFO] Deleting collection: {collection_name}...")
-            client.delete_collection(collection_name=collection_name)
-            print(f"[SUCCESS] Deleted collection: {collection_name}")
+            client.delete_collection(collection_name=collection.name)
+            log.info("Deleted collection %s.", collection.name)
     except Exception as e:
-        print(f"[ERROR] Failed to delete collections: {str(e)}")
\ No newline at end of file
+        log.error("Failed to delete collections: %s", e)
\ No newline at end of file
@@ -1,9 +1,6 @@
 from app.services.qdrant_service import search_qdrant
 from app.services.pdf_service import chunk_text
-from sentence_transformers import SentenceTransformer
-
-# Initialize embedding model
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+from app.services.embedding_service import embedder
 
 FAQ_COLLECTION = "faq_vectors"
 DETAILS_COLLECTION = "details_vectors"
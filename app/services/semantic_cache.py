@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Caches final answers keyed by query embedding.
+
+    A lookup returns the cached entry of the most similar recent query when its
+    cosine similarity reaches `threshold`. Entries expire after `ttl` seconds
+    and the oldest entry is overwritten once `max_entries` is reached.
+
+    `invalidate()` clears the cache in this process and touches a marker file;
+    other workers on the same host notice the new marker on their next lookup
+    and clear their own copy, so an ingestion in one worker invalidates all.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1000, ttl=3600, enabled=True,
+                 generation_path="semantic_cache.generation"):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.generation_path = generation_path
+        self._lock = threading.Lock()
+        self._vectors = None  # (max_entries, dim) float32, rows L2-normalised
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._entries = [None] * max_entries
+        self._next_slot = 0
+        self._generation = self._read_generation()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, query_vector):
+        """Returns the cached entry for the closest matching query, or None."""
+        if not self.enabled:
+            return None
+        self._sync_generation()
+        query = self._normalise(query_vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            scores[self._expires <= time.monotonic()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {**self._entries[best], "similarity": float(scores[best])}
+
+    def store(self, query_vector, entry):
+        """Caches `entry` (a dict such as answer/context/source) for `query_vector`."""
+        if not self.enabled:
+            return
+        query = self._normalise(query_vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+                self._expires[:] = 0
+            slot = self._next_slot
+            self._vectors[slot] = query
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._entries[slot] = entry
+            self._next_slot = (slot + 1) % self.max_entries
+
+    def invalidate(self):
+        """Drops every cached answer here and signals the other workers to do the same."""
+        self._clear()
+        try:
+            with open(self.generation_path, "w") as marker:
+                marker.write(str(time.time()))
+            self._generation = self._read_generation()
+        except OSError as e:
+            log.warning("Could not write semantic cache marker: %s", e)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": int((self._expires > time.monotonic()).sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    def _clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._entries = [None] * self.max_entries
+            self._next_slot = 0
+            self.invalidations += 1
+
+    def _read_generation(self):
+        try:
+            return os.stat(self.generation_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _sync_generation(self):
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self._clear()
+
+    @staticmethod
+    def _normalise(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", 1000)),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 3600)),
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true",
+    generation_path=os.getenv("SEMANTIC_CACHE_MARKER_PATH", "semantic_cache.generation"),
+)
@@ -0,0 +1,249 @@
+"""
+Structured logging for the `app` package.
+
+Every module logs through `logging.getLogger(__name__)`. `configure_logging`
+gives the `app` logger a queue handler, so a request thread only resolves the
+message and enqueues it; JSON encoding and the write to stdout happen on a
+listener thread. Records are stamped with the current request id, long
+fields are truncated, and DEBUG records are kept for a sample of requests.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# `json` (one object per line) or `text` for local development
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", 500))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Share of requests whose DEBUG records are kept when LOG_LEVEL=DEBUG
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+REQUEST_ID_HEADER = "X-Request-ID"
+# Incoming request ids are echoed in headers and logs; anything else is replaced
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Attributes every LogRecord has; anything else came from `extra=`
+STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "taskName"}
+
+# Request being served; copied into pipeline and search threads with the rest
+# of the context, and into asyncio tasks automatically
+current_request = ContextVar("log_request", default=None)
+
+
+class RequestContext:
+    def __init__(self, request_id=None, sampled=None):
+        if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.sampled = random.random() < LOG_DEBUG_SAMPLE_RATE if sampled is None else sampled
+
+
+@contextmanager
+def request_context(request_id=None):
+    """Makes a new `RequestContext` current for the enclosed block."""
+    context = RequestContext(request_id)
+    token = current_request.set(context)
+    try:
+        yield context
+    finally:
+        current_request.reset(token)
+
+
+@contextmanager
+def use_request_context(context):
+    """Makes an existing request context current again (e.g. inside a streaming generator)."""
+    token = current_request.set(context)
+    try:
+        yield context
+    finally:
+        current_request.reset(token)
+
+
+def request_id():
+    context = current_request.get()
+    return context.request_id if context else None
+
+
+def truncate(value, limit=None):
+    """`value` as a string of at most `limit` characters (plus a length note)."""
+    limit = LOG_MAX_FIELD_CHARS if limit is None else limit
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}... [{len(value)} chars]"
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the request id and drops DEBUG records of requests outside the sample."""
+
+    def filter(self, record):
+        context = current_request.get()
+        record.request_id = context.request_id if context else None
+        return record.levelno >= logging.INFO or context is None or context.sampled
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Enqueues records for a `QueueListener`. The message and traceback are
+    resolved here (their arguments may change once the caller moves on) and
+    truncated; when the queue is full the record is dropped and counted
+    rather than blocking the request.
+    """
+
+    def __init__(self, log_queue, max_field_chars=None):
+        super().__init__(log_queue)
+        self.max_field_chars = LOG_MAX_FIELD_CHARS if max_field_chars is None else max_field_chars
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = truncate(record.getMessage(), self.max_field_chars)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        for key, value in list(vars(record).items()):
+            if key in STANDARD_ATTRS or isinstance(value, (int, float, bool, type(None))):
+                continue
+            if isinstance(value, str):
+                setattr(record, key, truncate(value, self.max_field_chars))
+                continue
+            # Containers are copied (the caller may mutate them) and kept
+            # structured unless they are too long
+            encoded = json.dumps(value, default=str)
+            if len(encoded) > self.max_field_chars:
+                setattr(record, key, truncate(encoded, self.max_field_chars))
+            else:
+                setattr(record, key, json.loads(encoded))
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request id and `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+_handler = None
+_listener = None
+_stream = None
+_configure_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(_stream)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork (gunicorn --preload); the
+    # child gets a fresh queue and thread
+    if _handler is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging(stream=None):
+    """Routes the `app` logger through the queue handler. Safe to call more than once."""
+    global _handler, _stream
+    with _configure_lock:
+        if _handler is not None:
+            return
+        _stream = stream or sys.stdout
+        _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _handler.addFilter(RequestContextFilter())
+        _start_listener()
+
+        app_logger = logging.getLogger("app")
+        app_logger.setLevel(LOG_LEVEL)
+        app_logger.addHandler(_handler)
+        app_logger.propagate = False
+
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def flush():
+    """Waits until every queued record has been written."""
+    if _handler is not None:
+        _handler.queue.join()
+
+
+def stats():
+    return {
+        "level": logging.getLevelName(logging.getLogger("app").level),
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+def init_app(app):
+    """Gives each Flask request a request id (from `X-Request-ID` when sent) and echoes it back."""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_context():
+        g.log_request_token = current_request.set(RequestContext(request.headers.get(REQUEST_ID_HEADER)))
+
+    @app.after_request
+    def add_request_id_header(response):
+        if request_id():
+            response.headers[REQUEST_ID_HEADER] = request_id()
+        return response
+
+    @app.teardown_request
+    def end_request_context(exc):
+        token = g.pop("log_request_token", None)
+        if token is not None:
+            try:
+                current_request.reset(token)
+            except ValueError:
+                # Torn down from another context (e.g. a closed stream)
+                current_request.set(None)
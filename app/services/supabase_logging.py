@@ -1,8 +1,13 @@
+import logging
 import os
+import time
 import uuid
 from datetime import datetime, timedelta, timezone
-from supabase import create_client, Client
+from supabase import Client
 from dotenv import load_dotenv
+from app.services.interaction_writer import InteractionWriter
+from app.services.cache_utils import TTLCache
+from app.services.clients import registry, LazyClient, supabase_credentials
 
 # Load the environment variables
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,130 +16,262 @@ env_path = os.path.join(current_dir, '../..', '.env')
 # Load the environment variables
 load_dotenv(dotenv_path=env_path)
 
-# print(f"[DEBUG]: {os.getenv('SUPABASE_URL')} and {os.getenv('SUPABASE_KEY')}")
+log = logging.getLogger(__name__)
 
+# Sessions older than this are replaced by a new session
+SESSION_MAX_AGE = timedelta(hours=6)
 
-class SupabaseLogger:
-    def __init__(self, supabase_client=None):
+
+def validate_ids(user_id, session_id):
+    if not user_id or not isinstance(user_id, str) or user_id.strip() == "":
+        raise ValueError("Invalid user_id provided")
+    if not session_id or not isinstance(session_id, str) or session_id.strip() == "":
+        raise ValueError("Invalid session_id provided")
+
+
+def build_interaction_row(user_id, session_id, prompt, response, source_pdf=None, section_reference=None, metadata=None,
+                          timings=None):
+    """
+    Builds the `interactions` row.
+
+    `timings` (from `RequestTimer.timings()`) adds the question/answer
+    timestamps, the end-to-end `response_latency` and, under
+    `metadata["timings_ms"]`, the duration of each stage.
+    """
+    data = {
+        "user_id": user_id,
+        "session_id": session_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="microseconds"),
+        "prompt": prompt,
+        "response": response,
+        "source_pdf": source_pdf,
+        "section_reference": section_reference,
+        "metadata": metadata,
+        "is_compliant": True
+    }
+
+    if timings:
+        question_asked_at = timings["question_asked_at"]
+        bot_answered_at = timings["bot_answered_at"]
+        data["question_asked_at"] = question_asked_at.isoformat(timespec="microseconds")
+        data["bot_answered_at"] = bot_answered_at.isoformat(timespec="microseconds")
+        data["response_latency"] = str(bot_answered_at - question_asked_at)
+        data["metadata"] = {**(metadata or {}), "timings_ms": timings["stages_ms"]}
+    return data
+
+
+def parse_session_times(session):
+    """Returns a `sessions` row's (created_at, last_active) as timezone-aware datetimes."""
+    created_at = datetime.fromisoformat(session["created_at"])
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+
+    # Handle timestamp inconsistencies
+    try:
+        last_active = datetime.fromisoformat(session["last_active"])
+    except ValueError:
+        last_active = datetime.strptime(session["last_active"], "%Y-%m-%dT%H:%M:%S.%f%z")
+
+    if last_active.tzinfo is None:
+        last_active = last_active.replace(tzinfo=timezone.utc)
+    return created_at, last_active
+
+
+class _SessionLoggerBase:
+    """
+    Session cache, validation and row building shared by `SupabaseLogger` and
+    `AsyncSupabaseLogger`, so both serving paths apply the same rules; the
+    subclasses only differ in how they call Supabase.
+    """
+
+    def __init__(self, writer=None):
+        # Sessions validated recently: session_id -> {"created_at", "last_active_written"}
+        self.session_cache = TTLCache(
+            max_entries=int(os.getenv("SESSION_CACHE_SIZE", 10000)),
+            ttl=float(os.getenv("SESSION_CACHE_TTL", 300)),
+        )
+        # Minimum seconds between two `last_active` writes for the same session
+        self.last_active_write_interval = float(os.getenv("SESSION_LAST_ACTIVE_INTERVAL", 60))
+        self.writer = writer
+
+    def _prepare_interaction(self, user_id, session_id, prompt, response, source_pdf, section_reference, metadata,
+                             timings):
+        """Validates the ids and builds the row; returns it with whether the session must be checked first."""
+        validate_ids(user_id, session_id)
+        # The session existence check is skipped when the session was just
+        # validated, and with a background writer, which relies on the foreign key
+        check_session = not self.writer and session_id not in self.session_cache
+        data = build_interaction_row(
+            user_id, session_id, prompt, response, source_pdf, section_reference, metadata, timings
+        )
+        return data, check_session
+
+    @staticmethod
+    def _require_session(session_check, session_id):
+        if not session_check.data:
+            raise ValueError(f"Session ID {session_id} does not exist in the sessions table.")
+
+    def _cached_session(self, session_id, current_time):
+        """
+        Returns `(entry, expired)` for a session validated within the cache TTL;
+        a cached session past the 6-hour expiry is dropped and reported as expired.
+        """
+        cached = self.session_cache.get(session_id) if session_id else None
+        if cached and current_time - cached["created_at"] > SESSION_MAX_AGE:
+            log.debug("Cached session older than 6 hours; creating a new session.")
+            self.session_cache.pop(session_id)
+            return None, True
+        return cached, False
+
+    def _last_active_due(self, cached):
+        """Monotonic time of a `last_active` write due for a cached session, None while writes are coalesced."""
+        now = time.monotonic()
+        if now - cached["last_active_written"] < self.last_active_write_interval:
+            return None
+        return now
+
+    def _remember_session(self, session_id, created_at, last_active_written=None):
+        self.session_cache.set(session_id, {
+            "created_at": created_at,
+            "last_active_written": last_active_written or time.monotonic()
+        })
+
+    @staticmethod
+    def _last_active(current_time):
+        return {"last_active": current_time.isoformat(timespec="microseconds")}
+
+    @staticmethod
+    def _session_row(session_id, user_id, current_time):
+        return {
+            "session_id": session_id,
+            "user_id": user_id,
+            "last_active": current_time.isoformat(timespec="microseconds"),
+            "created_at": current_time.isoformat(timespec="microseconds")
+        }
+
+
+class SupabaseLogger(_SessionLoggerBase):
+    def __init__(self, supabase_client=None, async_mode=None):
         """
         Initialize the Supabase logger. Allows for dependency injection of a mocked client.
+
+        With `async_mode` (default: the SUPABASE_LOG_ASYNC environment variable),
+        `log_interaction` only validates and queues the row; a background
+        `InteractionWriter` bulk-inserts queued rows and spools them to disk
+        while Supabase is unreachable.
         """
+        super().__init__()
         if supabase_client:
             self.supabase = supabase_client
         else:
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_KEY")
-            if not url or not key:
-                raise ValueError("Supabase URL and API key must be set in environment variables.")
-            self.supabase: Client = create_client(url, key)
+            supabase_credentials()  # fail at startup, not on the first request
+            # Shared, pooled client (see app/services/clients.py); re-created after a fork
+            self.supabase: Client = LazyClient(registry, "supabase")
+
+        if async_mode is None:
+            async_mode = os.getenv("SUPABASE_LOG_ASYNC", "false").lower() == "true"
+
+        if async_mode:
+            self.writer = InteractionWriter(
+                insert_rows=self._insert_interactions,
+                spool_path=os.getenv("SUPABASE_LOG_SPOOL_PATH", "interaction_spool.sqlite3"),
+                max_queue_size=int(os.getenv("SUPABASE_LOG_QUEUE_SIZE", 1000)),
+                batch_size=int(os.getenv("SUPABASE_LOG_BATCH_SIZE", 50)),
+                flush_interval=float(os.getenv("SUPABASE_LOG_FLUSH_INTERVAL", 2.0)),
+            )
+
+    def _insert_interactions(self, rows):
+        """Bulk-inserts interaction rows in a single request (used by the background writer)."""
+        self.supabase.table("interactions").insert(rows).execute()
+
+    def flush(self):
+        """Flushes queued interactions when running in async mode."""
+        if self.writer:
+            self.writer.flush()
 
-    def log_interaction(self, user_id, session_id, prompt, response, source_pdf=None, section_reference=None, metadata=None):
+    def log_interaction(self, user_id, session_id, prompt, response, source_pdf=None, section_reference=None, metadata=None,
+                        timings=None):
         """
         Logs chatbot interaction to the Supabase database.
-        Adds question/answer timestamps and response latency.
+        Adds question/answer timestamps, response latency and stage durations
+        when the request's `timings` are passed.
+
+        In async mode the row is queued for the background writer instead, so
+        the session existence check and the insert happen off the request path.
         """
-        if not user_id or not isinstance(user_id, str) or user_id.strip() == "":
-            raise ValueError("Invalid user_id provided")
-        if not session_id or not isinstance(session_id, str) or session_id.strip() == "":
-            raise ValueError("Invalid session_id provided")
+        data, check_session = self._prepare_interaction(
+            user_id, session_id, prompt, response, source_pdf, section_reference, metadata, timings
+        )
 
-        # Ensure session_id exists
-        session_check = self.supabase.table("sessions").select("*").eq("session_id", session_id).execute()
-        if not session_check.data:
-            raise ValueError(f"Session ID {session_id} does not exist in the sessions table.")
+        if check_session:
+            session_check = self.supabase.table("sessions").select("*").eq("session_id", session_id).execute()
+            self._require_session(session_check, session_id)
 
-        # Capture timestamps
-        question_asked_at = datetime.now(timezone.utc)
-        
-        # Assume response was generated here (in real use, record before and after generation)
-        bot_answered_at = datetime.now(timezone.utc)
-        response_latency = bot_answered_at - question_asked_at
-
-        # Main payload
-        data = {
-            "user_id": user_id,
-            "session_id": session_id,
-            "timestamp": bot_answered_at.isoformat(timespec="microseconds"),
-            "prompt": prompt,
-            "response": response,
-            "source_pdf": source_pdf,
-            "section_reference": section_reference,
-            "metadata": metadata,
-            "is_compliant": True
-        }
-
-        # Optional new fields (won’t break existing functionality if columns are present)
-        try:
-            data["question_asked_at"] = question_asked_at.isoformat(timespec="microseconds")
-            data["bot_answered_at"] = bot_answered_at.isoformat(timespec="microseconds")
-            data["response_latency"] = str(response_latency)
-        except Exception as e:
-            print(f"[WARN] Failed to attach extra timing fields: {e}")
+        if self.writer:
+            self.writer.enqueue(data)
+            return
 
         try:
             result = self.supabase.table("interactions").insert(data).execute()
-            print("[DEBUG] Logged interaction successfully:", result.data)
+            log.debug("Logged interaction.", extra={"rows": len(result.data or [])})
         except Exception as e:
-            print(f"[ERROR] Error logging interaction to Supabase: {e}")
+            log.error("Error logging interaction to Supabase: %s", e)
             raise
 
     def get_or_create_session(self, user_id, session_id=None):
         """
         Retrieve or create a session in the `sessions` table.
+
+        Sessions validated within the cache TTL are answered from memory: the
+        6-hour expiry is checked against the cached `created_at` and `last_active`
+        is written at most once per `last_active_write_interval` seconds.
         """
         current_time = datetime.now(timezone.utc)
-        print("[DEBUG] Current time:", current_time)
+
+        cached, expired = self._cached_session(session_id, current_time)
+        if expired:
+            session_id = str(uuid.uuid4())
+            self._create_session(session_id, user_id, current_time)
+            return session_id
+        if cached:
+            self._touch_session(session_id, cached, current_time)
+            return session_id
     
         if session_id:
             # Check if the session exists
             result = self.supabase.table("sessions").select("*").eq("session_id", session_id).execute()
-            print("[DEBUG] Retrieved session data:", result.data)
     
             if result.data:
                 session = result.data[0]
                 try:
-                    created_at = datetime.fromisoformat(session["created_at"])
-                    if created_at.tzinfo is None:
-                        created_at = created_at.replace(tzinfo=timezone.utc)
-                    print("[DEBUG] Session created_at timestamp:", created_at)
-
-                    # Handle timestamp inconsistencies
-                    try:
-                        last_active = datetime.fromisoformat(session["last_active"])
-                    except ValueError:
-                        last_active = datetime.strptime(session["last_active"], "%Y-%m-%dT%H:%M:%S.%f%z")
-
-                    if last_active.tzinfo is None:
-                        last_active = last_active.replace(tzinfo=timezone.utc)
-                    print("[DEBUG] Last active timestamp:", last_active)
+                    created_at, last_active = parse_session_times(session)
 
                     # If the session is older than 6 hours, create a new session
-                    if current_time - created_at > timedelta(hours=6):
-                        print("[DEBUG] Session older than 6 hours. Creating new session.")
+                    if current_time - created_at > SESSION_MAX_AGE:
+                        log.debug("Session older than 6 hours; creating a new session.")
                         session_id = str(uuid.uuid4())
                         self._create_session(session_id, user_id, current_time)
                     else:
                         # Update the `last_active` timestamp
-                        print("[DEBUG] Updating last_active for existing session.")
-                        self.supabase.table("sessions").update({
-                            "last_active": current_time.isoformat(timespec="microseconds")
-                        }).eq("session_id", session_id).execute()
-                        print("[DEBUG] Updated last_active for session:", session_id)
+                        self.supabase.table("sessions").update(
+                            self._last_active(current_time)
+                        ).eq("session_id", session_id).execute()
+                        self._remember_session(session_id, created_at)
                 except Exception as e:
-                    print(f"[ERROR] Error parsing created_at or updating session: {e}")
+                    log.error("Error parsing created_at or updating session: %s", e)
                     raise
             else:
                 # If no session exists, create a new one
-                print("[DEBUG] No session found for provided session_id. Creating new session.")
+                log.debug("No session found for the provided session_id; creating a new session.")
                 session_id = str(uuid.uuid4())
                 self._create_session(session_id, user_id, current_time)
         else:
             # Create a new session if no session_id is provided
-            print("[DEBUG] No session_id provided. Creating new session.")
+            log.debug("No session_id provided; creating a new session.")
             session_id = str(uuid.uuid4())
             self._create_session(session_id, user_id, current_time)
     
-        print(f"[DEBUG]: Returning session_id={session_id} for user_id={user_id}")
+        log.debug("Using session %s.", session_id)
         return session_id
 
     def _create_session(self, session_id, user_id, current_time):
@@ -142,13 +279,122 @@ class SupabaseLogger:
         Helper method to create a new session in the `sessions` table.
         """
         try:
-            self.supabase.table("sessions").insert({
-                "session_id": session_id,
-                "user_id": user_id,
-                "last_active": current_time.isoformat(timespec="microseconds"),
-                "created_at": current_time.isoformat(timespec="microseconds")
-            }).execute()
-            print("[DEBUG] Created new session in Supabase.")
+            self.supabase.table("sessions").insert(self._session_row(session_id, user_id, current_time)).execute()
+        except Exception as e:
+            log.error("Error creating session in Supabase: %s", e)
+            raise
+        self._remember_session(session_id, current_time)
+
+    def _touch_session(self, session_id, cached, current_time):
+        """
+        Updates `last_active` for a cached session, coalescing writes so a chatty
+        session costs at most one update per `last_active_write_interval`.
+        """
+        now = self._last_active_due(cached)
+        if now is None:
+            return
+        self.supabase.table("sessions").update(self._last_active(current_time)).eq("session_id", session_id).execute()
+        self._remember_session(session_id, cached["created_at"], now)
+
+
+class AsyncSupabaseLogger(_SessionLoggerBase):
+    """
+    `SupabaseLogger` for the async serving path, using supabase's async client
+    (httpx.AsyncClient underneath) so waiting on Supabase never blocks the loop.
+
+    When a background `InteractionWriter` is passed (SUPABASE_LOG_ASYNC), rows
+    are queued to it instead of being inserted by the request.
+    """
+
+    def __init__(self, supabase_client=None, writer=None):
+        super().__init__(writer)
+        self.supabase = supabase_client
+
+    async def _client(self):
+        if self.supabase is None:
+            self.supabase = LazyClient(registry, "async_supabase")
+        return self.supabase
+
+    async def log_interaction(self, user_id, session_id, prompt, response, source_pdf=None, section_reference=None, metadata=None,
+                              timings=None):
+        """Async `SupabaseLogger.log_interaction`."""
+        data, check_session = self._prepare_interaction(
+            user_id, session_id, prompt, response, source_pdf, section_reference, metadata, timings
+        )
+
+        if check_session:
+            supabase = await self._client()
+            session_check = await supabase.table("sessions").select("*").eq("session_id", session_id).execute()
+            self._require_session(session_check, session_id)
+
+        if self.writer:
+            self.writer.enqueue(data)
+            return
+
+        try:
+            supabase = await self._client()
+            result = await supabase.table("interactions").insert(data).execute()
+            log.debug("Logged interaction.", extra={"rows": len(result.data or [])})
+        except Exception as e:
+            log.error("Error logging interaction to Supabase: %s", e)
+            raise
+
+    async def get_or_create_session(self, user_id, session_id=None):
+        """Async `SupabaseLogger.get_or_create_session`, with the same session cache rules."""
+        current_time = datetime.now(timezone.utc)
+
+        cached, expired = self._cached_session(session_id, current_time)
+        if expired:
+            session_id = str(uuid.uuid4())
+            await self._create_session(session_id, user_id, current_time)
+            return session_id
+        if cached:
+            await self._touch_session(session_id, cached, current_time)
+            return session_id
+
+        supabase = await self._client()
+        if session_id:
+            result = await supabase.table("sessions").select("*").eq("session_id", session_id).execute()
+            if result.data:
+                try:
+                    created_at, _ = parse_session_times(result.data[0])
+                    if current_time - created_at > SESSION_MAX_AGE:
+                        log.debug("Session older than 6 hours; creating a new session.")
+                        session_id = str(uuid.uuid4())
+                        await self._create_session(session_id, user_id, current_time)
+                    else:
+                        await supabase.table("sessions").update(
+                            self._last_active(current_time)
+                        ).eq("session_id", session_id).execute()
+                        self._remember_session(session_id, created_at)
+                except Exception as e:
+                    log.error("Error parsing created_at or updating session: %s", e)
+                    raise
+            else:
+                log.debug("No session found for the provided session_id; creating a new session.")
+                session_id = str(uuid.uuid4())
+                await self._create_session(session_id, user_id, current_time)
+        else:
+            log.debug("No session_id provided; creating a new session.")
+            session_id = str(uuid.uuid4())
+            await self._create_session(session_id, user_id, current_time)
+
+        log.debug("Using session %s.", session_id)
+        return session_id
+
+    async def _create_session(self, session_id, user_id, current_time):
+        supabase = await self._client()
+        try:
+            await supabase.table("sessions").insert(self._session_row(session_id, user_id, current_time)).execute()
         except Exception as e:
-            print(f"[ERROR] Error creating session in Supabase: {e}")
-            raise
\ No newline at end of file
+            log.error("Error creating session in Supabase: %s", e)
+            raise
+        self._remember_session(session_id, current_time)
+
+    async def _touch_session(self, session_id, cached, current_time):
+        now = self._last_active_due(cached)
+        if now is None:
+            return
+        supabase = await self._client()
+        await supabase.table("sessions").update(self._last_active(current_time)).eq("session_id", session_id).execute()
+        self._remember_session(session_id, cached["created_at"], now)
@@ -1,23 +1,59 @@
-from openai import OpenAI
+from app.services.clients import openai_client, async_openai_client
+from app.services.embedding_service import generate_embedding, agenerate_embedding, embed_text, aembed_text, embedder
+from app.services.moderation_service import ModerationService, load_classifier
+from app.services.deadline import bounded
 
 class ToxicityChecker:
     @staticmethod
-    def check_toxicity(content):
+    def check_toxicity(content, reply=False):
         """
-        Checks the content for toxicity using OpenAI's Moderation API.
+        Checks the content for toxicity. Repeated texts are answered from the
+        verdict cache and clear cases by the local pre-screen; the rest use
+        OpenAI's Moderation API (see `moderation_service`).
         Returns a tuple: (is_toxic, categories) where:
           - is_toxic: True if flagged as toxic
           - categories: List of categories flagged (e.g., hate, sexual, violence)
+        Pass `reply=True` for model replies, which must not enter the query embedding cache.
         """
-        try:
-            client = OpenAI()
-            response = client.moderations.create(
-                model="omni-moderation-latest",
-                input=content,
-            )
-            results = response.results[0]
-            categories = results.categories
-            return results.flagged, {category: value for category, value in categories.__dict__.items()}
-        except Exception as e:
-            print(f"Error checking toxicity: {e}")
-            return False, {}
+        return moderation.check(content, reply=reply)
+
+    @staticmethod
+    async def acheck_toxicity(content, reply=False):
+        """Async `check_toxicity` for the async serving path."""
+        return await moderation.acheck(content, reply=reply)
+
+    @staticmethod
+    def remote_check(content):
+        # Bounded by the request deadline; a timeout fails open like any other error
+        response = bounded(openai_client()).moderations.create(
+            model="omni-moderation-latest",
+            input=content,
+        )
+        return ToxicityChecker._verdict(response)
+
+    @staticmethod
+    async def aremote_check(content):
+        response = await bounded(async_openai_client()).moderations.create(
+            model="omni-moderation-latest",
+            input=content,
+        )
+        return ToxicityChecker._verdict(response)
+
+    @staticmethod
+    def _verdict(response):
+        results = response.results[0]
+        categories = results.categories
+        return results.flagged, {category: value for category, value in categories.__dict__.items()}
+
+
+moderation = ModerationService(
+    remote_check=ToxicityChecker.remote_check,
+    aremote_check=ToxicityChecker.aremote_check,
+    # The query's vector is shared with retrieval through the query embedding cache;
+    # replies are embedded without it so they never crowd out query vectors
+    embed=generate_embedding,
+    aembed=agenerate_embedding,
+    embed_reply=embed_text,
+    aembed_reply=aembed_text,
+    classifier=load_classifier(lambda texts: embedder.encode(texts)),
+)
@@ -0,0 +1,116 @@
+"""Synthetic corpus, PDFs and a model-free embedder for the benchmarks."""
+import hashlib
+import random
+import re
+import numpy as np
+
+TOPICS = [
+    "eligibility", "deadline", "budget", "travel", "equipment", "mentorship", "membership",
+    "references", "reporting", "publication", "ethics", "extension", "co-applicants", "salary",
+]
+WORDS = (
+    "grant research early career funding application panel review project proposal health tropical "
+    "medicine hygiene society member award outcome budget travel equipment training mentor institution "
+    "country eligibility deadline report publication ethics approval supervisor study fieldwork data"
+).split()
+
+
+class HashEmbedder:
+    """
+    Deterministic bag-of-words embedder (signed feature hashing), for runs
+    where the real model is not available. Texts sharing words get similar
+    vectors, and identical texts identical ones.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(text) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def faq_pairs(count, seed=0):
+    """(question, answer) pairs about the grants programme."""
+    rng = random.Random(seed)
+    pairs = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        question = f"What are the {topic} rules for application round {i}?"
+        pairs.append((question, " ".join(sentence(rng, 15) for _ in range(3))))
+    return pairs
+
+
+def detail_chunks(count, words_per_chunk=120, seed=1):
+    """Guidance-document text chunks."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_chunk)) for _ in range(count)]
+
+
+def queries(pairs, count, faq_ratio=0.5, seed=2):
+    """Load-test queries: FAQ questions verbatim (FAQ hits) mixed with free-text questions (details fallback)."""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        if rng.random() < faq_ratio:
+            result.append(rng.choice(pairs)[0])
+        else:
+            result.append(f"Could you explain {sentence(rng, 8).lower()[:-1]} for query {i}?")
+    return result
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """Builds a minimal text PDF (one Helvetica line per list item) that PyPDF2 can extract."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def document_pages(page_count, lines_per_page=60, words_per_line=12, seed=3):
+    rng = random.Random(seed)
+    return [
+        [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines_per_page)]
+        for _ in range(page_count)
+    ]
@@ -0,0 +1,416 @@
+"""
+Offline end-to-end benchmark.
+
+Serves the Flask app over HTTP against local stand-ins: an in-memory
+`qdrant_client` seeded with synthetic FAQ and details vectors, and
+`StubUpstream` for OpenAI (configurable latency, token streaming) and the
+Supabase REST API. A concurrent load generator drives `/query` and
+`/query/stream` (time to first token and total time per request); stage
+percentiles come from the timings each request logs to the Supabase stub.
+Microbenchmarks cover `chunk_text`, `extract_text_from_pdf` and embedding.
+
+    python -m benchmarks.run --requests 200 --concurrency 16 --output results.json
+    python -m benchmarks.run --compare baseline.json --fail-on-regression
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from benchmarks.fixtures import HashEmbedder, faq_pairs, detail_chunks, queries, make_pdf, document_pages
+from benchmarks.stubs import StubUpstream
+
+# A syntactically valid anon JWT; the stub does not check it
+STUB_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c2ln"
+FAQ_COLLECTION = "faq_vectors"
+DETAILS_COLLECTION = "details_vectors"
+PERCENTILES = (50, 95, 99)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    result = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    result["count"] = len(values)
+    return result
+
+
+def parse_interval(value):
+    """Seconds in a `str(timedelta)` value such as `0:00:01.250000`."""
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def configure_environment(stub, workdir):
+    """Points every upstream at the stubs and keeps state files out of the working tree."""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"{stub.url}/v1",
+        "SUPABASE_URL": stub.url,
+        "SUPABASE_KEY": STUB_SUPABASE_KEY,
+        "SEMANTIC_CACHE_MARKER_PATH": os.path.join(workdir, "semantic_cache.generation"),
+        "EMBEDDING_STORE_PATH": os.path.join(workdir, "embedding_store.sqlite3"),
+        "INGEST_JOB_DB_PATH": os.path.join(workdir, "ingestion_jobs.sqlite3"),
+        "CHAT_HISTORY_PATH": os.path.join(workdir, "chat_history.sqlite3"),
+        "SUPABASE_LOG_SPOOL_PATH": os.path.join(workdir, "interaction_spool.sqlite3"),
+    })
+
+
+def install_embedder(kind):
+    """Returns the embedder name; `hash` (or an unavailable model) uses `HashEmbedder`."""
+    from app.services import embedding_model
+
+    if kind == "model":
+        try:
+            embedding_model.get_embedder()
+            return embedding_model.EMBEDDING_MODEL_KEY
+        except Exception as e:
+            print(f"[WARN] Embedding model unavailable ({e}); using the hash embedder.", file=sys.stderr)
+    embedding_model._model = HashEmbedder()
+    return "hash"
+
+
+def install_qdrant():
+    """Registers an in-memory Qdrant as the shared client."""
+    from qdrant_client import QdrantClient
+    from app.services.clients import registry
+
+    memory_client = QdrantClient(location=":memory:")
+    registry.register("qdrant", lambda: memory_client)
+    registry.reset()
+    return memory_client
+
+
+def seed_qdrant(faq_count, details_count):
+    from qdrant_client.http import models
+    from app.services.embedding_service import embedder
+    from app.services.qdrant_service import client, create_qdrant_collection
+
+    pairs = faq_pairs(faq_count)
+    chunks = detail_chunks(details_count)
+    collections = {
+        FAQ_COLLECTION: [(q, {"question": q, "answer": a, "pdf_id": "faq.pdf", "source": "faq.pdf"}) for q, a in pairs],
+        DETAILS_COLLECTION: [(c, {"text": c, "pdf_id": "guidance.pdf", "source": "guidance.pdf"}) for c in chunks],
+    }
+    for name, items in collections.items():
+        vectors = embedder.encode([text for text, _ in items])
+        create_qdrant_collection(int(vectors.shape[1]), name)
+        for start in range(0, len(items), 256):
+            client.upsert(collection_name=name, points=[
+                models.PointStruct(id=str(uuid.uuid4()), vector=vectors[i].tolist(), payload=items[i][1])
+                for i in range(start, min(start + 256, len(items)))
+            ])
+    return pairs
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True).start()
+    return server
+
+
+def post_query(http, user_query, headers):
+    """One `/query` request: (status, session id to keep, None)."""
+    response = http.post("/query", json={"user_query": user_query}, headers=headers)
+    session_id = response.json().get("session_id") if response.status_code == 200 else None
+    return response.status_code, session_id, None
+
+
+def stream_query(http, user_query, headers):
+    """
+    One `/query/stream` request, read to the end: (status, session id to keep,
+    seconds to the first `token` event). An `error` event counts as a failure.
+    """
+    start = time.perf_counter()
+    status, session_id, first_token, event = None, None, None, None
+    with http.stream("POST", "/query/stream", json={"user_query": user_query}, headers=headers) as response:
+        status = response.status_code
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event == "error":
+                    status = "stream_error"
+            elif line.startswith("data: ") and event == "done":
+                session_id = json.loads(line[len("data: "):]).get("session_id")
+    return status, session_id, first_token
+
+
+def run_load(base_url, query_list, concurrency, turns_per_session, stream=False):
+    """
+    Sends every query to `/query` (or `/query/stream`) from `concurrency`
+    clients; returns per-request results and wall time.
+    """
+    import httpx
+
+    send = stream_query if stream else post_query
+    results = [None] * len(query_list)
+    counter = iter(range(len(query_list)))
+    counter_lock = threading.Lock()
+
+    def client_loop(client_number):
+        user_id = f"bench-user-{client_number}"
+        session_id, turns = str(uuid.uuid4()), 0
+        with httpx.Client(base_url=base_url, timeout=120) as http:
+            while True:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                if turns == turns_per_session:
+                    session_id, turns = str(uuid.uuid4()), 0
+                start = time.perf_counter()
+                try:
+                    status, new_session_id, first_token = send(
+                        http, query_list[index], {"X-User-ID": user_id, "X-Session-ID": session_id}
+                    )
+                    session_id = new_session_id or session_id
+                except Exception:
+                    status, first_token = "error", None
+                results[index] = {"status": status, "latency": time.perf_counter() - start, "ttft": first_token}
+                turns += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as pool:
+        list(pool.map(client_loop, range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def summarize_load(results, wall_time, interactions):
+    statuses = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    ok = [result["latency"] * 1000 for result in results if result["status"] == 200]
+    ttft = [result["ttft"] * 1000 for result in results if result["status"] == 200 and result["ttft"] is not None]
+
+    stages, server_latency = {}, []
+    for row in interactions:
+        if row.get("response_latency"):
+            server_latency.append(parse_interval(row["response_latency"]) * 1000)
+        for stage, ms in ((row.get("metadata") or {}).get("timings_ms") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    summary = {
+        "requests": len(results),
+        "statuses": statuses,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(len(ok) / wall_time, 2) if wall_time else 0.0,
+        "latency_ms": percentiles(ok),
+        "server_latency_ms": percentiles(server_latency),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+    if ttft:
+        # Time to first token, as the client saw it (streaming only)
+        summary["ttft_ms"] = percentiles(ttft)
+    return summary
+
+
+def wait_for_rows(stub, count, timeout=5.0):
+    """
+    Streamed interactions are logged once the response is closed, just after
+    the client has read it; waits until `count` rows have arrived.
+    """
+    deadline = time.monotonic() + timeout
+    while len(stub.rows("interactions")) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return stub.rows("interactions")
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "mean_ms": round(float(np.mean(timings)), 3),
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "min_ms": round(float(np.min(timings)), 3),
+    }
+
+
+def run_microbenchmarks(workdir, repeat):
+    from app.services.pdf_service import chunk_text, extract_text_from_pdf
+    from app.services.embedding_service import embedder
+
+    pages = document_pages(50)
+    text = " ".join(" ".join(lines) for lines in pages)
+    pdf_path = os.path.join(workdir, "benchmark.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(make_pdf(pages))
+    batch = detail_chunks(32, words_per_chunk=60)
+
+    return {
+        "chunk_text_36k_words": measure(lambda: chunk_text(text), repeat),
+        "extract_text_from_pdf_50_pages": measure(lambda: extract_text_from_pdf(pdf_path), max(1, repeat // 4)),
+        "embed_query": measure(lambda: embedder.encode(["What is the application deadline?"]), repeat),
+        "embed_batch_32": measure(lambda: embedder.encode(batch), max(1, repeat // 4)),
+    }
+
+
+def flatten(results):
+    """Comparable numbers, keyed by path (e.g. `load.stages_ms.llm.p95`)."""
+    flat = {}
+    for section in ("load", "stream"):
+        load = results.get(section, {})
+        if "throughput_rps" in load:
+            flat[f"{section}.throughput_rps"] = load["throughput_rps"]
+        for group in ("latency_ms", "ttft_ms", "server_latency_ms"):
+            for key, value in load.get(group, {}).items():
+                if key != "count":
+                    flat[f"{section}.{group}.{key}"] = value
+        for stage, values in load.get("stages_ms", {}).items():
+            for key, value in values.items():
+                if key != "count":
+                    flat[f"{section}.stages_ms.{stage}.{key}"] = value
+    for name, values in results.get("micro", {}).items():
+        flat[f"micro.{name}.mean_ms"] = values["mean_ms"]
+    return flat
+
+
+def compare(baseline, current, tolerance, min_delta_ms=1.0):
+    """
+    Prints old vs new values; returns the keys that regressed by more than
+    `tolerance`. Durations must also move by `min_delta_ms`, so jitter on
+    sub-millisecond stages is not reported.
+    """
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    print(f"\n{'metric':<50} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        change = (after - before) / before if before else 0.0
+        # Throughput regresses when it drops; every other number is a duration
+        if key.endswith("throughput_rps"):
+            worse = change < -tolerance
+        else:
+            worse = change > tolerance and after - before > min_delta_ms
+        if worse:
+            regressions.append(key)
+        print(f"{key:<50} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{'  <-- regression' if worse else ''}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Queries sent by the load generator.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--warmup", type=int, default=10, help="Queries sent before measuring.")
+    parser.add_argument("--mode", choices=["query", "stream", "both"], default="both",
+                        help="Drive `/query`, `/query/stream` or both (one after the other).")
+    parser.add_argument("--turns-per-session", type=int, default=3, help="Queries per chat session.")
+    parser.add_argument("--faq-ratio", type=float, default=0.5, help="Share of queries answered from the FAQ collection.")
+    parser.add_argument("--faq-points", type=int, default=500)
+    parser.add_argument("--details-points", type=int, default=5000)
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Stub LLM seconds to first token.")
+    parser.add_argument("--llm-token-delay", type=float, default=0.01, help="Stub LLM seconds between tokens.")
+    parser.add_argument("--moderation-latency", type=float, default=0.1)
+    parser.add_argument("--supabase-latency", type=float, default=0.03)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="`model` uses the configured embedding model when it is available locally.")
+    parser.add_argument("--micro-repeat", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression.")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Smallest duration increase counted as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's request logging on stdout.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = StubUpstream(
+        first_token_latency=args.llm_first_token,
+        token_delay=args.llm_token_delay,
+        moderation_latency=args.moderation_latency,
+        supabase_latency=args.supabase_latency,
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="chatbot-benchmark-")
+    configure_environment(stub, workdir)
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        embedder_name = install_embedder(args.embedder)
+        install_qdrant()
+        pairs = seed_qdrant(args.faq_points, args.details_points)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "embedder": embedder_name,
+            "config": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "compare", "fail_on_regression", "verbose")},
+        }
+    }
+
+    if not args.skip_load:
+        from app import create_app
+        from app.services.toxicity_checker_service import moderation
+
+        sections = {"query": [("load", False)], "stream": [("stream", True)],
+                    "both": [("load", False), ("stream", True)]}[args.mode]
+        with quiet:
+            server = serve(create_app())
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            logged = 0
+            for section, stream in sections:
+                warm_results, _ = run_load(base_url, queries(pairs, args.warmup, args.faq_ratio, seed=99),
+                                           min(args.concurrency, max(args.warmup, 1)), args.turns_per_session,
+                                           stream=stream)
+                logged += sum(1 for result in warm_results if result["status"] == 200)
+                warm_rows = len(wait_for_rows(stub, logged))
+                calls_before = dict(stub.counts)
+                load_results, wall_time = run_load(
+                    base_url, queries(pairs, args.requests, args.faq_ratio), args.concurrency,
+                    args.turns_per_session, stream=stream
+                )
+                logged = warm_rows + sum(1 for result in load_results if result["status"] == 200)
+                rows = wait_for_rows(stub, logged)[warm_rows:]
+                results[section] = summarize_load(load_results, wall_time, rows)
+                results[section]["upstream_calls"] = {
+                    name: count - calls_before.get(name, 0) for name, count in stub.counts.items()
+                }
+            server.shutdown()
+        results["moderation"] = moderation.stats()
+
+    if not args.skip_micro:
+        with quiet:
+            results["micro"] = run_microbenchmarks(workdir, args.micro_repeat)
+
+    stub.stop()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({key: value for key, value in results.items() if key != "meta"}, indent=2))
+    print(f"[INFO] Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"[WARN] {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}.")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
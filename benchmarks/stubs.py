@@ -0,0 +1,183 @@
+"""
+Local stand-ins for the OpenAI and Supabase HTTP APIs.
+
+`StubUpstream` serves both on one port:
+
+- `POST /v1/chat/completions`: fixed reply, after `first_token_latency`,
+  then one token per `token_delay` (streamed as SSE when requested, with a
+  final usage chunk when `stream_options.include_usage` is set)
+- `POST /v1/moderations`: never flags, after `moderation_latency`
+- `/rest/v1/<table>`: PostgREST-style select (`?col=eq.value`), insert and
+  update on in-memory tables, after `supabase_latency`
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+REPLY = (
+    "Early career researchers can apply for up to the stated amount. Applications are reviewed by the "
+    "panel and outcomes are announced after the deadline. Please check the guidance for eligibility."
+)
+
+
+class StubUpstream:
+    def __init__(self, first_token_latency=0.3, token_delay=0.01, moderation_latency=0.1,
+                 supabase_latency=0.03, reply=REPLY, host="127.0.0.1", port=0):
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+        self.moderation_latency = moderation_latency
+        self.supabase_latency = supabase_latency
+        self.tokens = [word + " " for word in reply.split()]
+        self.tables = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def rows(self, table):
+        with self._lock:
+            return list(self.tables.get(table, []))
+
+    def _usage(self, prompt):
+        prompt_tokens = max(1, len(json.dumps(prompt)) // 4)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(self.tokens),
+            "total_tokens": prompt_tokens + len(self.tokens),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"null") if length else None
+
+            def _json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._rest("GET")
+
+            def do_PATCH(self):
+                self._rest("PATCH")
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                if path.endswith("/chat/completions"):
+                    self._chat(self._body())
+                elif path.endswith("/moderations"):
+                    # Drain the body so the keep-alive connection stays in sync
+                    self._body()
+                    stub.count("moderations")
+                    time.sleep(stub.moderation_latency)
+                    self._json(200, {
+                        "id": f"modr-{uuid.uuid4().hex}",
+                        "model": "omni-moderation-latest",
+                        "results": [{"flagged": False, "categories": {"harassment": False, "hate": False},
+                                     "category_scores": {"harassment": 0.0, "hate": 0.0}}],
+                    })
+                else:
+                    self._rest("POST")
+
+            def _chat(self, request):
+                stub.count("chat_completions")
+                time.sleep(stub.first_token_latency)
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "stub")}
+                usage = stub._usage(request.get("messages"))
+
+                if not request.get("stream"):
+                    time.sleep(stub.token_delay * len(stub.tokens))
+                    self._json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                        "index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "".join(stub.tokens).strip()},
+                    }]})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(payload):
+                    data = f"data: {payload}\n\n".encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+
+                chunk = {**base, "object": "chat.completion.chunk"}
+                for i, token in enumerate(stub.tokens):
+                    if i:
+                        time.sleep(stub.token_delay)
+                    send(json.dumps({**chunk, "choices": [
+                        {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                    ]}))
+                send(json.dumps({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    send(json.dumps({**chunk, "choices": [], "usage": usage}))
+                send("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _rest(self, method):
+                parsed = urlparse(self.path)
+                if not parsed.path.startswith("/rest/v1/"):
+                    self._json(404, {"message": "not found"})
+                    return
+                table = parsed.path[len("/rest/v1/"):]
+                filters = {
+                    key: value[3:] for key, value in parse_qsl(parsed.query) if value.startswith("eq.")
+                }
+                body = self._body() if method in ("POST", "PATCH") else None
+                stub.count(f"{method} {table}")
+                time.sleep(stub.supabase_latency)
+
+                with stub._lock:
+                    rows = stub.tables.setdefault(table, [])
+                    matching = [row for row in rows if all(str(row.get(k)) == v for k, v in filters.items())]
+                    if method == "POST":
+                        new_rows = body if isinstance(body, list) else [body]
+                        rows.extend(new_rows)
+                        result = new_rows
+                    elif method == "PATCH":
+                        for row in matching:
+                            row.update(body)
+                        result = matching
+                    else:
+                        result = matching
+                self._json(201 if method == "POST" else 200, result)
+
+        return Handler
@@ -0,0 +1,10 @@
+import os
+from app.services import context_builder
+
+# Fills the bundled tiktoken cache (tiktoken_cache/) at build time, so app
+# workers load CONTEXT_TOKENIZER from disk instead of downloading it
+if __name__ == "__main__":
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.abspath(context_builder.BUNDLED_TOKENIZER_CACHE))
+    if context_builder.load_encoding() is None:
+        raise SystemExit(f"Could not fetch the '{context_builder.CONTEXT_TOKENIZER}' encoding.")
+    print(f"Cached '{context_builder.CONTEXT_TOKENIZER}' in {os.environ['TIKTOKEN_CACHE_DIR']}")
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
+from app.services.pdf_service import iter_pdf_pages, iter_words, iter_chunks, iter_qa_pairs
+from app.services.qdrant_service import sync_document_points
+from app.services.embedding_model import get_embedder
+
+# Load environment variables
+load_dotenv()
+
+
+def load_documents(source, mode, collection):
+    """
+    Returns the documents to ingest as dicts with `path`, `mode`, `collection` and `pdf_id`.
+
+    `source` is either a directory (every *.pdf in it, using `mode` and
+    `collection`) or a JSON / JSON-lines manifest whose entries may override
+    `mode`, `collection` and `pdf_id` per document.
+    """
+    if os.path.isdir(source):
+        entries = [
+            {"path": os.path.join(source, name)}
+            for name in sorted(os.listdir(source)) if name.lower().endswith(".pdf")
+        ]
+    else:
+        with open(source) as f:
+            content = f.read().strip()
+        entries = json.loads(content) if content.startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+        base_dir = os.path.dirname(os.path.abspath(source))
+        for entry in entries:
+            entry["path"] = os.path.join(base_dir, entry["path"])
+
+    documents = []
+    for entry in entries:
+        doc_mode = entry.get("mode", mode)
+        documents.append({
+            "path": entry["path"],
+            "mode": doc_mode,
+            "collection": entry.get("collection") or collection or default_collection(doc_mode),
+            # Same id the upload routes use, so CLI and HTTP ingestion stay idempotent together
+            "pdf_id": entry.get("pdf_id") or secure_filename(os.path.basename(entry["path"])),
+        })
+    return documents
+
+
+def default_collection(mode):
+    return os.getenv("FAQ_COLLECTION") if mode == "qa" else os.getenv("DETAILS_COLLECTION")
+
+
+def extract_document(document):
+    """
+    Extracts one PDF into (text to embed, payload, content) items. Runs in a worker process.
+
+    Returns:
+        tuple: (document, items, page count)
+    """
+    pages = []
+
+    def counted_pages():
+        for text in iter_pdf_pages(document["path"]):
+            pages.append(None)
+            yield text
+
+    if document["mode"] == "qa":
+        items = [
+            (question, {"question": question, "answer": answer}, f"{question}\n{answer}")
+            for question, answer in iter_qa_pairs(counted_pages())
+        ]
+    else:
+        items = [(chunk, {"text": chunk}, chunk) for chunk in iter_chunks(iter_words(counted_pages()))]
+    return document, items, len(pages)
+
+
+class MultiProcessEncoder:
+    """
+    Encodes with a SentenceTransformer multi-process pool, one encode call at a time.
+
+    Exposes the `encode(texts)` interface expected by `sync_document_points`;
+    the lock keeps concurrent upload threads from interleaving on the pool queues.
+    """
+
+    def __init__(self, model, processes, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        self.pool = model.start_multi_process_pool(target_devices=["cpu"] * processes) if processes > 1 else None
+        self._lock = threading.Lock()
+
+    def encode(self, texts):
+        with self._lock:
+            if self.pool is None:
+                return self.model.encode(texts, batch_size=self.batch_size)
+            return self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+
+
+def main():
+    """
+    Bulk-ingests a directory or manifest of PDFs into Qdrant.
+
+    Text is extracted on a process pool, chunks are encoded on a multi-process
+    SentenceTransformer pool and documents are uploaded concurrently, reusing the
+    incremental sync used by the upload routes.
+    """
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("source", help="Directory of PDFs, or a JSON / JSON-lines manifest.")
+    parser.add_argument("--mode", choices=["qa", "text"], default="text", help="How PDFs without a manifest mode are ingested.")
+    parser.add_argument("--collection", help="Target collection (default: FAQ_COLLECTION or DETAILS_COLLECTION by mode).")
+    parser.add_argument("--extract-workers", type=int, default=cpu_count, help="Processes extracting PDF text.")
+    parser.add_argument("--encode-processes", type=int, default=cpu_count, help="Processes encoding chunks.")
+    parser.add_argument("--upload-threads", type=int, default=4, help="Documents uploaded concurrently.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points embedded and upserted per batch.")
+    args = parser.parse_args()
+
+    documents = load_documents(args.source, args.mode, args.collection)
+    if not documents:
+        print("[INFO] No PDFs found.")
+        return
+    print(f"[INFO] Ingesting {len(documents)} PDFs...")
+
+    started = time.perf_counter()
+    totals = {"pages": 0, "chunks": 0, "upserted": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+    encoder = MultiProcessEncoder(get_embedder(), args.encode_processes, args.batch_size)
+
+    def upload(document, items):
+        return sync_document_points(
+            document["collection"], document["pdf_id"], items, encoder, batch_size=args.batch_size
+        )
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.extract_workers) as extract_pool, \
+                ThreadPoolExecutor(max_workers=args.upload_threads) as upload_pool:
+            extractions = [extract_pool.submit(extract_document, document) for document in documents]
+            uploads = {}
+            for future in as_completed(extractions):
+                try:
+                    document, items, page_count = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Extraction failed: {e}")
+                    totals["failed"] += 1
+                    continue
+                totals["pages"] += page_count
+                totals["chunks"] += len(items)
+                print(f"[INFO] Extracted {document['pdf_id']}: {page_count} pages, {len(items)} chunks.")
+                uploads[upload_pool.submit(upload, document, items)] = document
+
+            for future in as_completed(uploads):
+                document = uploads[future]
+                try:
+                    counts = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Upload of {document['pdf_id']} failed: {e}")
+                    totals["failed"] += 1
+                    continue
+                for key, value in counts.items():
+                    totals[key] += value
+                print(f"[SUCCESS] {document['pdf_id']} -> '{document['collection']}': {counts}")
+    finally:
+        encoder.close()
+
+    elapsed = time.perf_counter() - started
+    print("-" * 50)
+    print(f"Documents: {len(documents) - totals['failed']} ingested, {totals['failed']} failed")
+    print(f"Points: {totals['upserted']} upserted, {totals['unchanged']} unchanged, {totals['deleted']} deleted")
+    print(f"Elapsed: {elapsed:.1f}s")
+    print(f"Throughput: {totals['pages'] / elapsed:.1f} pages/s, "
+          f"{totals['chunks'] / elapsed:.1f} chunks/s, {totals['upserted'] / elapsed:.1f} points/s")
+
+
+if __name__ == "__main__":
+    main()
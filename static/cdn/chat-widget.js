@@ -469,18 +469,28 @@
   
     typingIndicator.style.display = 'flex';
   
-    // Simulate agent response
-    const botReply = await window.getLLMResponse(userMsg);
-  
-    typingIndicator.style.display = 'none';
-  
-    // Add bot message
-    const botMsgContainer = document.createElement('div');
-    botMsgContainer.className = 'chat-message bot';
-  
-    const botMessageContent = document.createElement('div');
-    botMessageContent.className = 'formatted-response';
-    botMessageContent.innerHTML = formatLLMResponse(botReply);
+    // Bot message is created on the first streamed token and updated in place
+    let botMessageContent = null;
+    function renderBotReply(text) {
+      if (!botMessageContent) {
+        typingIndicator.style.display = 'none';
+
+        const botMsgContainer = document.createElement('div');
+        botMsgContainer.className = 'chat-message bot';
+
+        botMessageContent = document.createElement('div');
+        botMessageContent.className = 'formatted-response';
+        botMsgContainer.appendChild(botMessageContent);
+        chatBody.appendChild(botMsgContainer);
+      }
+      botMessageContent.innerHTML = formatLLMResponse(text);
+      chatBody.scrollTop = chatBody.scrollHeight;
+    }
+
+    const botReply = await window.getLLMResponse(userMsg, renderBotReply);
+
+    // Render the final (moderated) answer
+    renderBotReply(botReply);
   
     const timestamp = document.createElement('div');
     timestamp.className = 'message-timestamp-bot';
@@ -491,8 +501,6 @@
       hour12: false,
     })}`;
   
-    botMsgContainer.appendChild(botMessageContent);
-    chatBody.appendChild(botMsgContainer);
     chatBody.appendChild(timestamp); // Append timestamp as a sibling element
     chatBody.scrollTop = chatBody.scrollHeight;
   }
@@ -513,13 +521,31 @@
     handleUserMessage(userMsg);
   });
 
-  window.getLLMResponse = async function(userMessage) {
+  function storeIds(data) {
+    // Update local storage with IDs if they're returned
+    if (data.user_id) localStorage.setItem('user_id', data.user_id);
+    if (data.session_id) localStorage.setItem('session_id', data.session_id);
+  }
+
+  // Parses one Server-Sent Events frame ("event: x\ndata: {...}") into {event, data}
+  function parseSSEFrame(frame) {
+    let event = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    });
+    if (!dataLines.length) return null;
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+  }
+
+  window.getLLMResponse = async function(userMessage, onToken) {
     try {
         let user_id = localStorage.getItem('user_id');
         let session_id = localStorage.getItem('session_id');
         
-        // Send user message to the backend dynamically using BASE_URL
-        const response = await fetch(`${BASE_URL}/query`, {
+        // Send user message to the streaming endpoint dynamically using BASE_URL
+        const response = await fetch(`${BASE_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -529,21 +555,52 @@
             body: JSON.stringify({ user_query: userMessage })
         });
 
-        // Parse the response from the Flask server
-        const data = await response.json();
-        
-        // Update local storage with IDs if they're returned
-        if (data.user_id) localStorage.setItem('user_id', data.user_id);
-        if (data.session_id) localStorage.setItem('session_id', data.session_id);
-
-        console.log('Server Response:', data);
-        
-        // Return the reply from the server
-        return data.answer;
+        // Validation errors, moderation refusals and empty results come back as plain JSON
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('text/event-stream') || !response.body) {
+            const data = await response.json();
+            storeIds(data);
+            console.log('Server Response:', data);
+            return data.answer || data.error;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = parseSSEFrame(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                if (!frame) continue;
+
+                if (frame.event === 'meta') {
+                    storeIds(frame.data);
+                    console.log('Server Response:', frame.data);
+                } else if (frame.event === 'token') {
+                    answer += frame.data.delta;
+                    if (onToken) onToken(answer);
+                } else if (frame.event === 'done') {
+                    storeIds(frame.data);
+                    answer = frame.data.answer;
+                } else if (frame.event === 'error') {
+                    console.error('Streaming error:', frame.data.error);
+                    return "An error occurred while fetching a response.";
+                }
+            }
+        }
+
+        return answer;
     } catch (err) {
         console.error('Error calling backend API:', err);
         return "An error occurred while fetching a response.";
     }
 };
 
-})();
+})();
\ No newline at end of file
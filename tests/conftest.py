@@ -1,3 +1,9 @@
+import os
+
+# Tests mock the embedder; loading (or downloading) the real model at every
+# create_app() would only slow them down
+os.environ.setdefault("EMBEDDING_WARMUP", "false")
+
 import pytest
 from app import create_app
 from app.services.supabase_logging import SupabaseLogger
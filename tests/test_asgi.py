@@ -0,0 +1,77 @@
+import asyncio
+import httpx
+from unittest.mock import AsyncMock, MagicMock
+from app.asgi import create_asgi_app
+
+
+def post(app, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=create_asgi_app(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def mock_async_pipeline(mocker, toxic=False):
+    mocker.patch("app.asgi.ToxicityChecker.acheck_toxicity", AsyncMock(return_value=(toxic, {})))
+    mocker.patch("app.asgi.agenerate_embedding", AsyncMock(return_value=[0.1, 0.2, 0.3]))
+    search = mocker.patch("app.asgi.asearch_with_fallback", AsyncMock(return_value=(
+        [MagicMock(payload={"question": "What is Python?", "answer": "Python is a programming language."}, score=0.95)],
+        "faq_vectors"
+    )))
+    mock_logger = mocker.patch("app.asgi.async_logger")
+    mock_logger.get_or_create_session = AsyncMock(return_value="5678")
+    mock_logger.log_interaction = AsyncMock()
+    return search, mock_logger
+
+
+def test_async_query_endpoint(app, mocker):
+    _, mock_logger = mock_async_pipeline(mocker)
+    mocker.patch("app.asgi.aget_llm_response", AsyncMock(return_value="Python is a language."))
+
+    response = post(app, "/query", json={"user_query": "Test query"},
+                    headers={"X-User-ID": "1234", "X-Session-ID": "async-5678"})
+
+    assert response.status_code == 200
+    assert response.json()["answer"] == "Python is a language."
+    assert response.json()["source"] == "faq_vectors"
+    mock_logger.log_interaction.assert_awaited_once()
+
+
+def test_async_query_stream_endpoint(app, mocker):
+    _, mock_logger = mock_async_pipeline(mocker)
+
+    async def tokens(**kwargs):
+        for delta in ["Python ", "is a language."]:
+            yield delta
+    mocker.patch("app.asgi.astream_llm_response", tokens)
+
+    response = post(app, "/query/stream", json={"user_query": "Test query"},
+                    headers={"X-User-ID": "1234", "X-Session-ID": "async-stream-5678"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/event-stream"
+    events = [frame.split("\n")[0] for frame in response.text.strip().split("\n\n")]
+    assert events == ["event: meta", "event: token", "event: token", "event: done"]
+    assert mock_logger.log_interaction.call_args.kwargs["response"] == "Python is a language."
+
+
+def test_async_query_flagged_input(app, mocker):
+    search, _ = mock_async_pipeline(mocker, toxic=True)
+    mock_llm = mocker.patch("app.asgi.aget_llm_response", AsyncMock())
+
+    response = post(app, "/query", json={"user_query": "Bad query"})
+
+    assert "inappropriate" in response.json()["answer"]
+    mock_llm.assert_not_called()
+
+
+def test_other_routes_served_by_flask(app):
+    response = post(app, "/query", content=b"not json", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+    async def run():
+        transport = httpx.ASGITransport(app=create_asgi_app(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/qdrant-pdf/jobs/missing")
+    assert asyncio.run(run()).status_code == 404
@@ -0,0 +1,44 @@
+import openai
+from benchmarks.fixtures import make_pdf
+from benchmarks.run import compare, parse_interval
+from benchmarks.stubs import StubUpstream
+from app.services.pdf_service import extract_text_from_pdf
+
+
+def test_stub_streams_tokens_and_usage():
+    stub = StubUpstream(first_token_latency=0, token_delay=0, reply="one two three").start()
+    try:
+        client = openai.OpenAI(base_url=f"{stub.url}/v1", api_key="sk-test", max_retries=0)
+        chunks = list(client.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "hi"}],
+            stream=True, stream_options={"include_usage": True}
+        ))
+        client.moderations.create(model="omni-moderation-latest", input="hi")
+        reply = client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+    finally:
+        stub.stop()
+
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == "one two three "
+    assert chunks[-1].usage.completion_tokens == 3
+    assert reply.choices[0].message.content == "one two three"
+    assert stub.counts == {"chat_completions": 2, "moderations": 1}
+
+
+def test_synthetic_pdf_round_trips(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf([["Grant guidance", "Apply by (March)"], ["Second page"]]))
+
+    text = extract_text_from_pdf(str(path))
+    assert "Apply by (March)" in text and "Second page" in text
+
+
+def test_compare_flags_regressions_beyond_tolerance_and_noise_floor():
+    baseline = {"load": {"throughput_rps": 10.0, "stages_ms": {"llm": {"p95": 500.0}, "context": {"p95": 0.1}}}}
+    current = {"load": {"throughput_rps": 8.0, "stages_ms": {"llm": {"p95": 520.0}, "context": {"p95": 0.3}}}}
+
+    assert compare(baseline, current, tolerance=0.1) == ["load.throughput_rps"]
+
+    baseline["stream"] = {"ttft_ms": {"p95": 300.0, "count": 10}}
+    current["stream"] = {"ttft_ms": {"p95": 400.0, "count": 10}}
+    assert compare(baseline, current, tolerance=0.1) == ["load.throughput_rps", "stream.ttft_ms.p95"]
+    assert parse_interval("0:00:01.250000") == 1.25
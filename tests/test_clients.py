@@ -0,0 +1,106 @@
+import httpx
+from app.services import clients
+from app.services.clients import ClientRegistry, RetryPolicy, RetryTransport
+
+
+def flaky_transport(statuses):
+    """MockTransport answering with `statuses` in turn, recording each call."""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+    return httpx.MockTransport(handler), calls
+
+
+def test_retry_transport_retries_idempotent_requests():
+    transport, calls = flaky_transport([503, 502, 200])
+    client = httpx.Client(transport=RetryTransport(transport, RetryPolicy(max_retries=2, backoff=0)))
+
+    assert client.get("http://upstream/").status_code == 200
+    assert len(calls) == 3
+
+
+def test_retry_transport_gives_up_and_spares_non_idempotent_requests():
+    transport, calls = flaky_transport([503])
+    client = httpx.Client(transport=RetryTransport(transport, RetryPolicy(max_retries=2, backoff=0)))
+
+    assert client.get("http://upstream/").status_code == 503
+    assert len(calls) == 3
+
+    calls.clear()
+    assert client.post("http://upstream/", json={}).status_code == 503
+    assert calls == ["POST"]
+
+
+def test_retry_transport_retries_connect_errors_for_any_method():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.method)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(201)
+
+    client = httpx.Client(transport=RetryTransport(httpx.MockTransport(handler), RetryPolicy(backoff=0)))
+    assert client.post("http://upstream/", json={}).status_code == 201
+    assert attempts == ["POST", "POST"]
+
+
+def test_qdrant_policy_spares_collection_admin_and_deletes():
+    policy = clients.QdrantRetryPolicy(backoff=0)
+    timeout = httpx.ReadTimeout("slow")
+
+    def retried(method, path):
+        return policy.retry_error(httpx.Request(method, f"http://qdrant:6333{path}"), timeout, 0)
+
+    assert retried("POST", "/collections/faq_vectors/points/search")
+    assert retried("POST", "/collections/faq_vectors/points/scroll")
+    assert retried("PUT", "/collections/faq_vectors/points?wait=true")
+    assert not retried("PUT", "/collections/faq_vectors")
+    assert not retried("PUT", "/collections/faq_vectors/index")
+    assert not retried("POST", "/collections/faq_vectors/points/delete")
+
+
+def test_registry_reuses_clients_and_rebuilds_after_fork(mocker):
+    registry = ClientRegistry()
+    registry.register("upstream", object)
+
+    first = registry.get("upstream")
+    assert registry.get("upstream") is first
+
+    # Same registry seen from a forked child
+    mocker.patch("app.services.clients.os.getpid", return_value=registry._pid + 1)
+    assert registry.get("upstream") is not first
+
+
+def test_supabase_client_uses_pooled_retrying_session(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "http://localhost:1")
+    monkeypatch.setenv("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c2ln")
+
+    session = clients._supabase().postgrest.session
+    assert isinstance(session._transport, RetryTransport)
+    assert session.timeout.connect == clients.HTTP_CONNECT_TIMEOUT
+
+
+def test_qdrant_middleware_closes_responses_it_retries():
+    import asyncio
+    policy = clients.QdrantRetryPolicy(max_retries=1, backoff=0)
+    request = httpx.Request("POST", "http://qdrant/collections/faq/points/search")
+
+    def streamed(status):
+        # Unread, like the responses qdrant_client's transport returns
+        return httpx.Response(status, request=request, stream=httpx.ByteStream(b"{}"))
+
+    first, second = streamed(503), streamed(200)
+    responses = iter([first, second])
+    assert clients.qdrant_retry_middleware(policy)(request, lambda request: next(responses)) is second
+    assert first.is_closed and not second.is_closed
+
+    async def call_next(request):
+        return next(responses)
+
+    first, second = streamed(503), streamed(200)
+    responses = iter([first, second])
+    assert asyncio.run(clients.async_qdrant_retry_middleware(policy)(request, call_next)) is second
+    assert first.is_closed and not second.is_closed
@@ -0,0 +1,87 @@
+from unittest.mock import MagicMock
+from app.services.context_builder import (
+    build_context, count_tokens, drop_near_duplicates, merge_overlapping, pack_passages
+)
+from app.services.pdf_service import chunk_text
+
+def hit(payload, score):
+    return MagicMock(payload=payload, score=score)
+
+def test_neighbouring_chunks_merge_back_into_the_source_text():
+    text = " ".join(f"word{i}" for i in range(900))
+    chunks = chunk_text(text)
+    passages = [
+        {"pdf_id": "guide.pdf", "text": chunks[1], "score": 0.9},
+        {"pdf_id": "guide.pdf", "text": chunks[0], "score": 0.7},
+        {"pdf_id": "other.pdf", "text": chunks[2], "score": 0.8},
+    ]
+
+    merged = merge_overlapping(passages)
+
+    assert len(merged) == 2
+    guide = next(p for p in merged if p["pdf_id"] == "guide.pdf")
+    assert guide["text"] == " ".join(text.split()[:900])
+    assert guide["score"] == 0.9
+
+def test_near_duplicates_keep_the_best_score():
+    passages = [
+        {"pdf_id": "a.pdf", "text": "Applicants must be within ten years of their PhD award.", "score": 0.7},
+        {"pdf_id": "b.pdf", "text": "Applicants must be within ten years of their PhD award", "score": 0.9},
+        {"pdf_id": "c.pdf", "text": "Grants of up to 5000 GBP are available.", "score": 0.8},
+    ]
+
+    kept = drop_near_duplicates(passages)
+
+    assert [p["pdf_id"] for p in kept] == ["b.pdf", "c.pdf"]
+
+def test_packing_respects_the_budget_in_relevance_order():
+    passages = [
+        {"text": "low " * 40, "score": 0.1},
+        {"text": "high " * 40, "score": 0.9},
+        {"text": "mid " * 40, "score": 0.5},
+    ]
+    budget = count_tokens("high " * 40) + count_tokens("\n\n") + count_tokens("mid " * 40)
+
+    packed = pack_passages(passages, budget)
+
+    assert packed == ["high " * 40, "mid " * 40]
+    assert pack_passages(passages[:1], 5) and count_tokens(pack_passages(passages[:1], 5)[0]) <= 5
+
+def test_build_context_drops_scores_and_reports_savings():
+    hits = [
+        hit({"pdf_id": "faq.pdf", "question": "Who can apply?", "answer": "Early-career researchers."}, 0.93),
+        hit({"pdf_id": "faq2.pdf", "question": "Who can apply?", "answer": "Early-career researchers."}, 0.91),
+    ]
+    baseline = "\n\n".join(
+        f"Question: {h.payload['question']}\nAnswer: {h.payload['answer']}\nScore: {h.score}" for h in hits
+    )
+
+    context, stats = build_context(hits, baseline=baseline)
+
+    assert context == "Question: Who can apply?\nAnswer: Early-career researchers."
+    assert stats["packed"] == 1
+    assert stats["tokens_saved"] > 0
+
+def test_default_budget_keeps_every_distinct_passage():
+    hits = [
+        hit({"pdf_id": "a.pdf", "text": "alpha " * 600}, 0.9),
+        hit({"pdf_id": "b.pdf", "text": "beta " * 600}, 0.8),
+        hit({"pdf_id": "c.pdf", "text": "gamma " * 600}, 0.7),
+    ]
+
+    context, stats = build_context(hits)
+
+    assert stats["packed"] == 3
+    assert context.index("alpha") < context.index("beta") < context.index("gamma")
+
+def test_token_counts_never_wait_for_the_tokenizer(mocker):
+    from app.services import context_builder
+    mocker.patch.object(context_builder, "_encoding_loaded", False)
+    mocker.patch.object(context_builder, "_warmup_started", False)
+    thread = mocker.patch("app.services.context_builder.threading.Thread")
+
+    # A load in progress holds the lock; counting falls back to the estimate
+    with context_builder._encoding_lock:
+        assert count_tokens("x" * 40) == 10
+    thread.assert_called_once()
+    assert thread.call_args.kwargs["target"] is context_builder.load_encoding
@@ -0,0 +1,109 @@
+import threading
+import time
+from unittest.mock import MagicMock
+import pytest
+from app.services import deadline
+from app.services.deadline import Deadline, DeadlineExceeded, bounded, deadline_scope
+
+
+FAQ_HIT = MagicMock(payload={"question": "When is the deadline?", "answer": "The 1st of March."}, score=0.95)
+DETAILS_HIT = MagicMock(payload={"text": "Applications close in spring."}, score=0.5)
+
+
+@pytest.fixture
+def query_mocks(mocker, monkeypatch):
+    monkeypatch.setattr(deadline, "QUERY_DEADLINE", 10)
+    moderation = mocker.patch("app.routes.query.ToxicityChecker.check_toxicity", return_value=(False, {}))
+    mocker.patch("app.routes.query.generate_embedding", return_value=[0.1, 0.2, 0.3])
+    search = mocker.patch("app.routes.query.search_with_fallback", return_value=([FAQ_HIT], "faq_vectors"))
+    llm = mocker.patch("app.routes.query.get_llm_response", return_value="Generated answer.")
+    logger = mocker.patch("app.routes.query.logger")
+    logger.get_or_create_session.return_value = "5678"
+    return {"moderation": moderation, "search": search, "llm": llm, "logger": logger}
+
+
+def post_query(client):
+    return client.post(
+        "/query", json={"user_query": "When do applications close?"},
+        headers={"X-User-ID": "1234", "X-Session-ID": "5678"}
+    )
+
+
+def test_llm_overrun_answers_with_the_top_faq_answer(client, query_mocks, mocker):
+    mocker.patch("app.routes.query.DEADLINE_LLM_RESERVE", 60)
+
+    response = post_query(client)
+
+    assert response.status_code == 200
+    assert response.json["answer"] == "The 1st of March." and response.json["degraded"] is True
+    query_mocks["llm"].assert_not_called()
+    # Only the query was moderated; the FAQ answer is curated
+    assert query_mocks["moderation"].call_count == 1
+    metadata = query_mocks["logger"].log_interaction.call_args.kwargs["metadata"]
+    assert metadata["degraded"] == "faq_answer"
+    # Context tokens sent and saved are logged with every retrieval
+    assert metadata["context"]["packed"] == 1 and metadata["context"]["tokens_saved"] > 0
+
+
+def test_llm_timeout_without_faq_answer_fails_with_error_code(client, query_mocks):
+    query_mocks["search"].return_value = ([DETAILS_HIT], "details_vectors")
+    query_mocks["llm"].side_effect = DeadlineExceeded("llm")
+
+    response = post_query(client)
+
+    assert response.status_code == 504
+    assert response.json["error_code"] == "LLM_TIMEOUT"
+
+
+def test_slow_retrieval_fails_fast(client, query_mocks, monkeypatch):
+    monkeypatch.setattr(deadline, "QUERY_DEADLINE", 0.2)
+    query_mocks["search"].side_effect = lambda *args, **kwargs: time.sleep(1) or ([FAQ_HIT], "faq_vectors")
+
+    started = time.perf_counter()
+    response = post_query(client)
+
+    assert time.perf_counter() - started < 0.8
+    assert response.status_code == 504
+    assert response.json["error_code"] == "RETRIEVAL_TIMEOUT"
+
+
+def test_late_session_upkeep_and_logging_leave_the_request_path(client, query_mocks, mocker):
+    mocker.patch("app.routes.query.DEADLINE_SYNC_RESERVE", 60)
+    logged = threading.Event()
+    query_mocks["logger"].get_or_create_session.side_effect = lambda **kwargs: time.sleep(0.3) or "new-session"
+    query_mocks["logger"].log_interaction.side_effect = lambda **kwargs: logged.set()
+
+    started = time.perf_counter()
+    response = post_query(client)
+
+    assert time.perf_counter() - started < 0.3
+    assert response.status_code == 200 and response.json["session_id"] == "5678"
+    # Logged in the background, with the session upkeep finally settled on
+    assert logged.wait(2)
+    assert query_mocks["logger"].log_interaction.call_args.kwargs["session_id"] == "new-session"
+
+
+def test_deadlines_are_off_by_default(client, mocker):
+    mocker.patch("app.routes.query.ToxicityChecker.check_toxicity", return_value=(False, {}))
+    mocker.patch("app.routes.query.generate_embedding", return_value=[0.1, 0.2, 0.3])
+    mocker.patch("app.routes.query.search_with_fallback", return_value=([FAQ_HIT], "faq_vectors"))
+    llm = mocker.patch("app.routes.query.get_llm_response", return_value="Generated answer.")
+    mocker.patch("app.routes.query.logger").get_or_create_session.return_value = "5678"
+    mocker.patch("app.routes.query.DEADLINE_LLM_RESERVE", 60)
+
+    response = post_query(client)
+
+    assert response.json["answer"] == "Generated answer." and response.json["degraded"] is False
+    llm.assert_called_once()
+
+
+def test_bounded_client_times_out_with_the_deadline():
+    client = MagicMock()
+    assert bounded(client) is client
+
+    with deadline_scope(5):
+        bounded(client, reserve=1)
+    options = client.with_options.call_args.kwargs
+    assert options["max_retries"] == 0 and 3.9 < options["timeout"] <= 4
+
+    assert Deadline(0).expired() and DeadlineExceeded("retrieval").error_code == "RETRIEVAL_TIMEOUT"
@@ -0,0 +1,57 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.services.embedding_batcher import MicroBatcher
+
+def test_concurrent_requests_share_a_forward_pass():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(text))] for text in texts])
+
+    batcher = MicroBatcher(encode, window_ms=50, max_batch_size=32)
+    texts = [f"query {'x' * i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(lambda text: batcher.encode(text, timeout=5), texts))
+
+    # Every caller gets the vector for its own text
+    assert [vector[0] for vector in vectors] == [float(len(text)) for text in texts]
+    assert len(calls) < len(texts)
+    assert sum(len(call) for call in calls) == len(texts)
+
+def test_batches_are_capped_at_max_size():
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        return [[0.0]] * len(texts)
+
+    batcher = MicroBatcher(encode, window_ms=50, max_batch_size=3)
+    futures = [batcher.submit(f"query {i}") for i in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert max(calls) <= 3
+
+def test_errors_and_timeouts_reach_the_caller():
+    release = threading.Event()
+
+    def encode(texts):
+        if "boom" in texts:
+            raise RuntimeError("encode failed")
+        release.wait(timeout=5)
+        return [[0.0]] * len(texts)
+
+    batcher = MicroBatcher(encode, window_ms=0)
+    with pytest.raises(RuntimeError, match="encode failed"):
+        batcher.encode("boom", timeout=5)
+
+    # The forward pass is stuck, so the caller gives up after its own timeout
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        batcher.encode("slow", timeout=0.05)
+    assert time.monotonic() - start < 1
+    release.set()
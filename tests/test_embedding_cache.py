@@ -0,0 +1,66 @@
+import numpy as np
+from unittest.mock import MagicMock
+from app.services.embedding_cache import EmbeddingStore, encode_with_store, normalize_query
+
+def fake_embedder():
+    embedder = MagicMock()
+    embedder.encode.side_effect = lambda texts: np.array([[len(text), 1.0, 0.5] for text in texts], dtype=np.float32)
+    return embedder
+
+def test_only_new_texts_are_encoded(tmp_path):
+    store = EmbeddingStore(path=str(tmp_path / "store.sqlite3"))
+    embedder = fake_embedder()
+
+    first = encode_with_store(["chunk one", "chunk two"], embedder, model_name="test-model", store=store)
+    second = encode_with_store(["chunk one", "chunk two", "chunk three!"], embedder, model_name="test-model", store=store)
+
+    # The second call only encodes the chunk it has not seen before
+    assert embedder.encode.call_args_list[1].args[0] == ["chunk three!"]
+    np.testing.assert_array_equal(second[:2], first)
+    assert second.shape == (3, 3)
+    assert second.dtype == np.float32
+
+def test_store_is_keyed_by_model(tmp_path):
+    store = EmbeddingStore(path=str(tmp_path / "store.sqlite3"))
+    embedder = fake_embedder()
+
+    encode_with_store(["chunk one"], embedder, model_name="model-a", store=store)
+    encode_with_store(["chunk one"], embedder, model_name="model-b", store=store)
+
+    assert embedder.encode.call_count == 2
+
+def test_float16_store_round_trips(tmp_path):
+    store = EmbeddingStore(path=str(tmp_path / "store.sqlite3"), dtype="float16")
+    embedder = fake_embedder()
+
+    fresh = encode_with_store(["chunk one"], embedder, model_name="test-model", store=store)
+    cached = encode_with_store(["chunk one"], embedder, model_name="test-model", store=store)
+
+    np.testing.assert_array_equal(fresh, cached)
+
+def test_normalize_query():
+    assert normalize_query("  Is employment   REQUIRED? ") == "is employment required?"
+
+def test_concurrent_calls_for_one_query_encode_it_once(mocker):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services import embedding_service
+    from app.services.cache_utils import TTLCache
+    mocker.patch.object(embedding_service, "query_embedding_cache", TTLCache())
+    started, release = threading.Event(), threading.Event()
+
+    def slow_embed(text):
+        started.set()
+        release.wait(5)
+        return np.array([0.1, 0.2])
+
+    embed = mocker.patch.object(embedding_service, "embed_text", side_effect=slow_embed)
+
+    # e.g. the moderation pre-screen and retrieval embedding the same query
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(embedding_service.generate_embedding, "Who can apply?")
+        started.wait(5)
+        second = pool.submit(embedding_service.generate_embedding, "who can  apply?")
+        release.set()
+        assert first.result() == second.result() == [0.1, 0.2]
+    embed.assert_called_once()
@@ -0,0 +1,45 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from app.services import embedding_model
+from app.services.embedding_model import LazyEmbedder
+
+def test_model_is_loaded_once_on_first_use(mocker):
+    mocker.patch.object(embedding_model, "_model", None)
+    model = MagicMock()
+    model.encode.return_value = [[0.1, 0.2, 0.3]]
+    load_model = mocker.patch.object(embedding_model, "load_model", return_value=model)
+
+    embedder = LazyEmbedder()
+    load_model.assert_not_called()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: embedder.encode(["query"]), range(16)))
+
+    load_model.assert_called_once()
+    assert results[0] == [[0.1, 0.2, 0.3]]
+    assert embedder.get_sentence_embedding_dimension is model.get_sentence_embedding_dimension
+
+def test_create_app_warms_the_model_in_the_background(mocker):
+    mocker.patch.object(embedding_model, "_model", None)
+    mocker.patch.object(embedding_model, "EMBEDDING_WARMUP", True)
+    loaded = threading.Event()
+    load_model = mocker.patch.object(embedding_model, "load_model", side_effect=lambda: loaded.wait(5) or MagicMock())
+
+    from app import create_app
+    create_app()
+
+    # create_app returns before the model is loaded; requests wait for it
+    assert embedding_model.is_warming()
+    loaded.set()
+    embedding_model.wait_for_warmup()
+    load_model.assert_called_once()
+    assert not embedding_model.is_warming() and embedding_model._model is not None
+
+def test_onnx_backend_falls_back_to_torch_without_its_extra(mocker):
+    mocker.patch.object(embedding_model, "find_spec", return_value=None)
+    log = mocker.patch.object(embedding_model, "log")
+
+    assert embedding_model.resolve_backend("onnx") == "torch"
+    assert "requirements-onnx.txt" in log.error.call_args[0][0]
+    assert embedding_model.resolve_backend("torch") == "torch"
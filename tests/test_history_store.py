@@ -0,0 +1,75 @@
+import time
+from app.services.history_store import InMemoryHistoryStore, SQLiteHistoryStore
+
+def test_memory_store_keeps_turns_as_list():
+    store = InMemoryHistoryStore()
+    store.append("session-1", "What grants are available?", "The Early Career Grants.")
+    store.append("session-1", "Who can apply?", "Early-career researchers.")
+
+    turns = store.get("session-1")
+    assert [turn["user"] for turn in turns] == ["What grants are available?", "Who can apply?"]
+    assert turns[1]["assistant"] == "Early-career researchers."
+
+def test_stores_keep_every_turn_by_default(tmp_path):
+    for store in (InMemoryHistoryStore(), SQLiteHistoryStore(path=str(tmp_path / "history.sqlite3"))):
+        for i in range(30):
+            store.append("session-1", f"question {i}", "answer")
+        assert len(store.get("session-1")) == 30
+        assert store.stats()["trimmed_turns"] == 0
+
+def test_memory_store_trims_turns_and_evicts_lru_sessions():
+    store = InMemoryHistoryStore(max_sessions=2, max_turns=2)
+    for i in range(3):
+        store.append("session-1", f"question {i}", "answer")
+    store.append("session-2", "question", "answer")
+    store.get("session-1")  # session-1 is now the most recently used
+    store.append("session-3", "question", "answer")
+
+    assert [turn["user"] for turn in store.get("session-1")] == ["question 1", "question 2"]
+    assert store.get("session-2") == []
+    stats = store.stats()
+    assert stats["trimmed_turns"] == 1
+    assert stats["evicted_sessions"] == 1
+
+def test_memory_store_respects_byte_cap_and_ttl():
+    store = InMemoryHistoryStore(max_bytes=30, ttl=0.05)
+    store.append("session-1", "a" * 10, "b" * 10)
+    store.append("session-2", "c" * 10, "d" * 10)
+
+    # Both sessions together exceed 30 bytes, so the older one is evicted
+    assert store.get("session-1") == []
+    assert store.stats()["bytes"] == 20
+
+    time.sleep(0.06)
+    assert store.get("session-2") == []
+    assert store.stats()["expired_sessions"] == 1
+
+def test_memory_store_trims_a_single_session_over_the_byte_cap():
+    store = InMemoryHistoryStore(max_bytes=50)
+    for i in range(5):
+        store.append("session-1", f"question {i}", "a" * 10)
+
+    assert [turn["user"] for turn in store.get("session-1")] == ["question 3", "question 4"]
+    assert store.stats()["bytes"] <= 50
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    worker_a = SQLiteHistoryStore(path=path, max_turns=2)
+    worker_b = SQLiteHistoryStore(path=path, max_turns=2)
+
+    worker_a.append("session-1", "question 0", "answer")
+    worker_b.append("session-1", "question 1", "answer")
+    worker_a.append("session-1", "question 2", "answer")
+
+    assert [turn["user"] for turn in worker_b.get("session-1")] == ["question 1", "question 2"]
+    assert worker_b.stats()["sessions"] == 1
+
+def test_sqlite_store_cleanup_evicts_over_byte_cap(tmp_path):
+    store = SQLiteHistoryStore(path=str(tmp_path / "history.sqlite3"), max_bytes=30)
+    store.append("session-1", "a" * 10, "b" * 10)
+    store.append("session-2", "c" * 10, "d" * 10)
+    store.cleanup()
+
+    assert store.get("session-1") == []
+    assert len(store.get("session-2")) == 1
+    assert store.stats()["evicted_sessions"] == 1
@@ -0,0 +1,107 @@
+import io
+from app.services import ingestion_jobs
+from app.services.ingestion_jobs import IngestionJobStore, run_ingestion_job
+
+def test_run_ingestion_job_records_progress(tmp_path, mocker):
+    store = IngestionJobStore(path=str(tmp_path / "jobs.sqlite3"))
+    mocker.patch.object(ingestion_jobs, "_job_store", store)
+    upload = tmp_path / "guide.pdf"
+    upload.write_bytes(b"%PDF")
+    mocker.patch("app.services.pdf_service.iter_pdf_pages", return_value=iter(["one two ", "three"]))
+
+    def fake_upload(chunks, pdf_id, collection_name, embedder, progress=None):
+        assert list(chunks) == ["one two three"]
+        progress("upserting", {"upserted": 1, "unchanged": 0, "deleted": 0})
+        return {"upserted": 1, "unchanged": 0, "deleted": 2}
+
+    mocker.patch("app.services.qdrant_service.upload_chunks_to_qdrant", side_effect=fake_upload)
+
+    job_id = store.create("text", "guide.pdf", str(upload), "guide.pdf", "details_vectors")
+    assert store.get(job_id)["status"] == "queued"
+    run_ingestion_job(job_id)
+
+    job = store.get(job_id)
+    assert job["status"] == "succeeded"
+    assert job["stage"] == "done"
+    assert job["pages_processed"] == 2
+    assert (job["points_upserted"], job["points_deleted"]) == (1, 2)
+    assert job["elapsed"] >= 0
+    assert not upload.exists()
+
+def test_run_ingestion_job_records_errors(tmp_path, mocker, mock_qdrant):
+    mock_qdrant.scroll.return_value = ([], None)
+    store = IngestionJobStore(path=str(tmp_path / "jobs.sqlite3"))
+    mocker.patch.object(ingestion_jobs, "_job_store", store)
+    mocker.patch("app.services.pdf_service.iter_pdf_pages", side_effect=ValueError("not a PDF"))
+
+    job_id = store.create("qa", "faq.pdf", str(tmp_path / "faq.pdf"), "faq.pdf", "faq_vectors")
+    run_ingestion_job(job_id)
+
+    job = store.get(job_id)
+    assert (job["status"], job["stage"], job["error"]) == ("failed", "failed", "not a PDF")
+
+def test_upload_returns_job_id_and_status(client, tmp_path, mocker):
+    store = IngestionJobStore(path=str(tmp_path / "jobs.sqlite3"))
+    mocker.patch.object(ingestion_jobs, "_job_store", store)
+    mocker.patch("app.routes.qdrant_routes.UPLOAD_FOLDER", str(tmp_path))
+    submit = mocker.patch(
+        "app.routes.qdrant_routes.job_runner.submit",
+        side_effect=lambda kind, filename, filepath, pdf_id, collection: store.create(
+            kind, filename, filepath, pdf_id, collection
+        )
+    )
+
+    response = client.post(
+        "/qdrant-pdf/upload/text",
+        data={"file": (io.BytesIO(b"%PDF"), "guide.pdf"), "collection_name": "details_vectors"},
+        content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 202
+    assert response.json["status_url"] == f"/qdrant-pdf/jobs/{response.json['job_id']}"
+    assert submit.call_args.args[0] == "text"
+    status = client.get(response.json["status_url"])
+    assert status.status_code == 200
+    assert status.json["status"] == "queued"
+    assert status.json["pdf_id"] == "guide.pdf"
+    assert client.get("/qdrant-pdf/jobs/unknown").status_code == 404
+
+def test_one_active_job_per_document(tmp_path):
+    import pytest
+    from app.services.ingestion_jobs import DocumentBusy
+    store = IngestionJobStore(path=str(tmp_path / "jobs.sqlite3"))
+
+    first = store.create("text", "guide.pdf", "uploads/a.pdf", "guide.pdf", "details_vectors")
+    with pytest.raises(DocumentBusy) as busy:
+        store.create("text", "guide.pdf", "uploads/b.pdf", "guide.pdf", "details_vectors")
+    assert busy.value.job_id == first
+
+    store.update(first, status="succeeded")
+    assert store.create("text", "guide.pdf", "uploads/b.pdf", "guide.pdf", "details_vectors") != first
+
+def test_jobs_of_dead_processes_are_failed_on_open(tmp_path, mocker):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = IngestionJobStore(path=path)
+    job_id = store.create("qa", "faq.pdf", "uploads/faq.pdf", "faq.pdf", "faq_vectors")
+    mocker.patch.object(ingestion_jobs, "_process_alive", return_value=False)
+
+    job = IngestionJobStore(path=path).get(job_id)
+    assert (job["status"], job["stage"]) == ("failed", "failed")
+    assert "Interrupted" in job["error"]
+
+def test_crashed_job_is_failed_and_its_upload_removed(tmp_path, mocker):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+    store = IngestionJobStore(path=str(tmp_path / "jobs.sqlite3"))
+    mocker.patch.object(ingestion_jobs, "_job_store", store)
+    upload = tmp_path / "1234_guide.pdf"
+    upload.write_bytes(b"%PDF")
+
+    crashed = Future()
+    runner = ingestion_jobs.IngestionJobRunner()
+    mocker.patch.object(runner, "_get_executor", return_value=mocker.Mock(submit=lambda *args: crashed))
+    job_id = runner.submit("text", "guide.pdf", str(upload), "guide.pdf", "details_vectors")
+    crashed.set_exception(BrokenProcessPool("job process died"))
+
+    assert store.get(job_id)["status"] == "failed"
+    assert not upload.exists()
@@ -44,4 +44,33 @@ def test_llm_response(query, expected_keywords):
 
     assert all(keyword in response for keyword in expected_keywords), (
         f"Failed for query: {query}\nResponse: {response}"
-    )
\ No newline at end of file
+    )
+def test_messages_keep_static_prefix_first():
+    from app.services.llm_service import build_messages, SYSTEM_PROMPT
+    history = [{"user": "What grants are available?", "assistant": "The Early Career Grants."}]
+
+    messages = build_messages("Who can apply?", "Early-career researchers.", history)
+
+    assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"] == "What grants are available?"
+    assert messages[-1]["content"] == "Context:\nEarly-career researchers.\n\nQuestion: Who can apply?"
+
+def test_llm_usage_is_recorded(mocker):
+    from unittest.mock import MagicMock
+    from app.services import llm_service
+    response = MagicMock()
+    response.choices[0].message.content = " Early-career researchers. "
+    response.usage.prompt_tokens = 1200
+    response.usage.prompt_tokens_details.cached_tokens = 1024
+    response.usage.completion_tokens = 12
+    mocker.patch.object(llm_service.openai_client.chat.completions, "create", return_value=response)
+    calls_before = llm_service.llm_usage.calls
+
+    usage = {}
+    reply = llm_service.get_llm_response("Who can apply?", "context", [], usage=usage)
+
+    assert reply == "Early-career researchers."
+    assert (usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"]) == (1200, 1024, 12)
+    assert usage["latency"] >= 0
+    assert llm_service.llm_usage.calls == calls_before + 1
@@ -0,0 +1,60 @@
+import numpy as np
+from unittest.mock import MagicMock
+from app.services.local_index import LocalVectorIndex, LocalIndexManager
+
+def make_points(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return [MagicMock(id=i, vector=vectors[i].tolist(), payload={"text": f"chunk {i}"}) for i in range(count)], vectors
+
+def test_local_index_matches_brute_force_cosine():
+    points, vectors = make_points(50)
+    index = LocalVectorIndex("details_vectors", [p.id for p in points], vectors, [p.payload for p in points])
+    query = np.random.default_rng(1).normal(size=8)
+
+    results = index.search(query, limit=3)
+
+    expected = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+    assert [r.id for r in results] == list(np.argsort(-expected)[:3])
+    assert np.allclose([r.score for r in results], np.sort(expected)[::-1][:3], atol=1e-5)
+    assert results[0].payload == {"text": f"chunk {results[0].id}"}
+
+def test_local_index_float16_keeps_ranking():
+    points, vectors = make_points(50)
+    ids, payloads = [p.id for p in points], [p.payload for p in points]
+    query = np.random.default_rng(2).normal(size=8)
+
+    full = LocalVectorIndex("faq_vectors", ids, vectors, payloads).search(query, limit=5)
+    half = LocalVectorIndex("faq_vectors", ids, vectors, payloads, dtype="float16").search(query, limit=5)
+    assert [r.id for r in half] == [r.id for r in full]
+
+def test_manager_loads_via_scroll_and_respects_size_limit(tmp_path):
+    points, _ = make_points(5)
+    client = MagicMock()
+    client.count.return_value.count = len(points)
+    client.scroll.side_effect = [(points[:3], 3), (points[3:], None)]
+    manager = LocalIndexManager(enabled=True, max_points=10, generation_path=str(tmp_path / "marker"))
+
+    assert manager.load(client, "faq_vectors") is not None
+    results = manager.search(client, "faq_vectors", points[4].vector, 1)
+    assert results[0].id == 4
+    client.search.assert_not_called()
+
+    client.count.return_value.count = 11
+    assert manager.load(client, "details_vectors") is None
+    assert manager.search(client, "details_vectors", points[0].vector, 1) is None
+    assert manager.stats()["collections"] == {"faq_vectors": 5, "details_vectors": "remote"}
+
+def test_manager_drops_mirrors_when_collections_change(tmp_path):
+    points, _ = make_points(3)
+    client = MagicMock()
+    client.count.return_value.count = len(points)
+    client.scroll.return_value = (points, None)
+    marker = tmp_path / "marker"
+    manager = LocalIndexManager(enabled=True, generation_path=str(marker), check_interval=0)
+    manager.load(client, "faq_vectors")
+
+    marker.write_text("ingested")
+    manager._load_in_background = MagicMock()
+    assert manager.search(client, "faq_vectors", points[0].vector, 1) is None
+    manager._load_in_background.assert_called_with(client, "faq_vectors")
@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.services import pipeline_service
+from app.services.metrics import span, request_timer
+from app.services.supabase_logging import build_interaction_row
+
+
+def test_spans_are_recorded_on_the_request_timer_across_pipeline_threads():
+    def stage():
+        with span("embedding"):
+            time.sleep(0.01)
+
+    with request_timer("query") as timer:
+        with span("moderation_input"):
+            pipeline_service.submit(stage).result()
+
+    # The pipeline thread saw the request's timer; a plain thread pool does not
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(stage).result()
+
+    assert set(timer.stages) == {"moderation_input", "embedding"}
+    assert timer.stages["moderation_input"] >= timer.stages["embedding"] >= 0.01
+
+
+def test_interaction_row_carries_true_latency_and_stage_durations():
+    with request_timer("query") as timer:
+        with span("llm"):
+            time.sleep(0.02)
+        timings = timer.timings()
+
+    row = build_interaction_row("user-1", "session-1", "Hi?", "Hello!", metadata={"ip": "127.0.0.1"}, timings=timings)
+
+    assert row["response_latency"].startswith("0:00:00.0")
+    assert row["bot_answered_at"] > row["question_asked_at"]
+    assert row["metadata"]["ip"] == "127.0.0.1"
+    assert row["metadata"]["timings_ms"]["llm"] >= 20
+
+    # Without timings, no timing fields are invented
+    assert "response_latency" not in build_interaction_row("user-1", "session-1", "Hi?", "Hello!")
+
+
+def test_metrics_endpoint(client, mocker):
+    assert client.get("/metrics").status_code == 404
+    mocker.patch("app.routes.metrics.METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    with span("embedding"):
+        pass
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'chatbot_stage_seconds_bucket{le="0.001",stage="embedding"}' in body
+    assert 'chatbot_cache_hits_total{cache="answer_cache"}' in body
+    assert 'chatbot_llm_tokens_total{kind="prompt"}' in body
+
+
+def test_debug_stats_need_the_metrics_token(client, mocker):
+    assert client.get("/debug").status_code == 404
+    mocker.patch("app.routes.metrics.METRICS_TOKEN", "scrape-secret")
+    assert client.get("/debug").status_code == 401
+
+    response = client.get("/debug", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "moderation" in response.json
+
+
+def test_every_request_is_observed_once(client):
+    from prometheus_client import REGISTRY
+
+    def observed(route):
+        return REGISTRY.get_sample_value("chatbot_request_seconds_count", {"route": route}) or 0
+
+    before = observed("query"), observed("query_stream")
+    # Rejected before any answer is produced
+    assert client.post("/query", json={}).status_code == 400
+    assert client.post("/query/stream", json={}).status_code == 400
+
+    assert observed("query") == before[0] + 1
+    assert observed("query_stream") == before[1] + 1
+
+    # A timer finished by the handler is not observed again on exit
+    with request_timer("query") as timer:
+        timer.timings()
+    assert observed("query") == before[0] + 2
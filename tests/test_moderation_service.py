@@ -0,0 +1,134 @@
+import asyncio
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from app.services.moderation_service import ModerationService, PrototypeClassifier
+
+
+class FixedClassifier:
+    """Scores every text with the probability given for it."""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, vector):
+        return self.scores[vector], "harassment"
+
+
+def make_service(scores, policy="balanced", remote_verdict=(False, {})):
+    remote = MagicMock(return_value=remote_verdict)
+    service = ModerationService(
+        remote_check=remote, embed=lambda text: text, classifier=FixedClassifier(scores), policy=policy
+    )
+    return service, remote
+
+
+def test_clear_cases_are_decided_locally():
+    service, remote = make_service({"hello": 0.01, "insult": 0.99, "unsure": 0.5})
+
+    assert service.check("hello") == (False, {})
+    assert service.check("insult")[0] is True
+    assert service.check("unsure") == (False, {})
+
+    # Only the uncertain text reached the moderation API
+    remote.assert_called_once_with("unsure")
+    stats = service.stats()
+    assert (stats["local_benign"], stats["local_flagged"], stats["remote"]) == (1, 1, 1)
+
+
+def test_strict_and_remote_policies_send_more_to_the_api():
+    strict, strict_remote = make_service({"hello": 0.05, "insult": 0.99}, policy="strict")
+    strict.check("hello")
+    strict.check("insult")
+    # 0.05 is not clearly benign under `strict`, and flags are always confirmed remotely
+    assert strict_remote.call_count == 2
+
+    remote_only, api = make_service({"hello": 0.0}, policy="remote")
+    remote_only.check("hello")
+    api.assert_called_once()
+
+    with pytest.raises(ValueError):
+        make_service({}, policy="paranoid")
+
+
+def test_verdicts_are_cached_and_errors_are_not():
+    service, remote = make_service({"unsure": 0.5}, remote_verdict=(True, {"hate": True}))
+
+    assert service.check("unsure") == (True, {"hate": True})
+    assert service.check("unsure") == (True, {"hate": True})
+    assert remote.call_count == 1
+    assert service.stats()["cached"] == 1
+
+    remote.side_effect = RuntimeError("moderation API down")
+    # Fails open, as before, and is retried next time
+    assert service.check("other unsure") == (False, {})
+    assert service.check("other unsure") == (False, {})
+    assert service.stats()["remote_errors"] == 2
+
+
+def test_prescreen_failure_falls_back_to_remote():
+    remote = MagicMock(return_value=(False, {}))
+    embed = MagicMock(side_effect=OSError("model unavailable"))
+    service = ModerationService(remote_check=remote, embed=embed, classifier=FixedClassifier({}), policy="balanced")
+
+    service.check("first")
+    service.check("second")
+
+    # The pre-screen is switched off after failing instead of retrying on every call
+    assert embed.call_count == 1
+    assert remote.call_count == 2
+
+
+def test_async_check_uses_async_callables():
+    async def aremote(content):
+        return False, {}
+
+    async def aembed(content):
+        return content
+
+    service = ModerationService(
+        remote_check=None, embed=None, aremote_check=aremote, aembed=aembed,
+        classifier=FixedClassifier({"hello": 0.01, "unsure": 0.5}), policy="balanced"
+    )
+    assert asyncio.run(service.acheck("hello")) == (False, {})
+    assert asyncio.run(service.acheck("unsure")) == (False, {})
+    assert service.stats()["local_benign"] == 1 and service.stats()["remote"] == 1
+
+
+def test_prototype_classifier_scores_by_nearest_example():
+    vectors = {"nice": [1.0, 0.0], "mean": [0.0, 1.0]}
+    classifier = PrototypeClassifier(
+        lambda texts: np.array([vectors[text] for text in texts]),
+        benign=["nice"], toxic={"harassment": ["mean"]}
+    )
+
+    benign_probability, _ = classifier.score([0.9, 0.1])
+    toxic_probability, category = classifier.score([0.1, 0.9])
+    assert benign_probability < 0.01
+    assert toxic_probability > 0.99 and category == "harassment"
+
+
+def test_remote_policy_is_the_default():
+    remote = MagicMock(return_value=(False, {}))
+    embed = MagicMock()
+    service = ModerationService(remote_check=remote, embed=embed, classifier=FixedClassifier({}))
+
+    service.check("how to kill mosquito larvae")
+
+    assert service.policy == "remote"
+    embed.assert_not_called()
+    remote.assert_called_once()
+
+
+def test_replies_use_their_own_embedder():
+    query_embed, reply_embed = MagicMock(side_effect=lambda text: text), MagicMock(side_effect=lambda text: text)
+    service = ModerationService(
+        remote_check=MagicMock(return_value=(False, {})), embed=query_embed, embed_reply=reply_embed,
+        classifier=FixedClassifier({"question": 0.01, "answer": 0.01}), policy="balanced"
+    )
+
+    service.check("question")
+    service.check("answer", reply=True)
+
+    query_embed.assert_called_once_with("question")
+    reply_embed.assert_called_once_with("answer")
@@ -0,0 +1,63 @@
+import random
+import threading
+import pytest
+from app.services.pdf_service import chunk_text, iter_chunks, iter_words, iter_lines, iter_qa_pairs, batched, prefetch
+
+PAGES = [
+    "Who can apply?\nEarly-career research",
+    "ers in global health.\nDo I need to be employed?\nNo. Applicants ",
+    "",
+    "   may be unaffiliated.\n",
+    "What is the deadline?\nSee the website",
+]
+
+def test_words_and_lines_match_concatenated_text():
+    text = "".join(PAGES)
+    assert list(iter_words(PAGES)) == text.split()
+    assert list(iter_lines(PAGES)) == text.split("\n")
+
+def test_qa_pairs_span_page_boundaries():
+    assert list(iter_qa_pairs(PAGES)) == [
+        ("Who can apply?", "Early-career researchers in global health."),
+        ("Do I need to be employed?", "No. Applicants    may be unaffiliated."),
+        ("What is the deadline?", "See the website"),
+    ]
+
+@pytest.mark.parametrize("max_length, overlap", [(500, 100), (10, 3), (5, 4), (7, 0)])
+def test_streamed_chunks_match_chunk_text(max_length, overlap):
+    rng = random.Random(max_length)
+    for word_count in [0, 1, max_length - 1, max_length, max_length + 1, 3 * max_length + 2, 1234]:
+        words = [f"w{i}" for i in range(word_count)]
+        # Split the text into pages at arbitrary points, including mid-word
+        text = " ".join(words)
+        cuts = sorted(rng.sample(range(len(text) + 1), min(5, len(text) + 1)))
+        pages = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+        assert list(iter_chunks(iter_words(pages), max_length, overlap)) == chunk_text(text, max_length, overlap)
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_prefetch_bounds_the_producer():
+    produced = []
+    release = threading.Event()
+
+    def pages():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    stream = prefetch(pages(), max_buffered=4)
+    assert next(stream) == 0
+    # The producer stops once the buffer is full instead of reading ahead
+    release.wait(timeout=0.3)
+    assert len(produced) <= 6
+    assert list(stream) == list(range(1, 100))
+
+def test_prefetch_reraises_producer_errors():
+    def pages():
+        yield "page 1"
+        raise ValueError("corrupt page")
+
+    with pytest.raises(ValueError, match="corrupt page"):
+        list(prefetch(pages()))
@@ -1,3 +1,4 @@
+import numpy as np
 from unittest.mock import MagicMock
 from app.services.qdrant_service import list_collections, search_with_fallback
 
@@ -61,4 +62,125 @@ def test_search_with_fallback(mock_qdrant):
     assert source == "details_vectors"
     assert len(results) == 1
     assert results[0].payload["text"] == "Fallback to details text."
-    assert results[0].score == 0.85
\ No newline at end of file
+    assert results[0].score == 0.85
+
+def test_search_with_fallback_concurrent_matches_sequential(mock_qdrant):
+    faq_hit = [MagicMock(payload={"question": "What is Python?", "answer": "A language."}, score=0.9)]
+    faq_miss = [MagicMock(payload={"question": "What is Python?", "answer": "A language."}, score=0.5)]
+    details = [MagicMock(payload={"text": "Details result text."}, score=0.85)]
+    query_vector = [0.1, 0.2, 0.3]
+
+    for faq_results in (faq_hit, faq_miss):
+        mock_qdrant.search.side_effect = lambda collection_name, **kwargs: (
+            faq_results if collection_name == "FAQ_vectors" else details
+        )
+        sequential = search_with_fallback(query_vector, "FAQ_vectors", "details_vectors", mode="sequential")
+        concurrent = search_with_fallback(query_vector, "FAQ_vectors", "details_vectors", mode="concurrent")
+        assert concurrent == sequential
+
+    # On a fallback both searches were issued up front
+    collections = [call.kwargs["collection_name"] for call in mock_qdrant.search.call_args_list[-2:]]
+    assert sorted(collections) == ["FAQ_vectors", "details_vectors"]
+
+def test_upload_chunks_only_syncs_changed_points(mock_qdrant, mocker):
+    from app.services.qdrant_service import upload_chunks_to_qdrant, document_point_id
+
+    mocker.patch("app.services.qdrant_service.answer_cache")
+    encode = mocker.patch(
+        "app.services.qdrant_service.encode_with_store",
+        side_effect=lambda texts, embedder: np.ones((len(texts), 3), dtype=np.float32)
+    )
+
+    # The collection already holds one unchanged chunk and one chunk that was edited away
+    unchanged_id = document_point_id("guide.pdf", "unchanged chunk")
+    stale_id = document_point_id("guide.pdf", "old chunk")
+    mock_qdrant.collection_exists.return_value = True
+    mock_qdrant.scroll.return_value = ([MagicMock(id=unchanged_id), MagicMock(id=stale_id)], None)
+
+    counts = upload_chunks_to_qdrant(["unchanged chunk", "new chunk"], "guide.pdf", "details_vectors", MagicMock())
+
+    assert counts == {"upserted": 1, "deleted": 1, "unchanged": 1}
+    # Only the new chunk is embedded and upserted, under its deterministic id
+    encode.assert_called_once()
+    assert encode.call_args.args[0] == ["new chunk"]
+    points = mock_qdrant.upsert.call_args.kwargs["points"]
+    assert [point.id for point in points] == [document_point_id("guide.pdf", "new chunk")]
+    assert points[0].payload["pdf_id"] == "guide.pdf"
+    # The collection is never dropped; stale points of this document are deleted by filter
+    mock_qdrant.delete_collection.assert_not_called()
+    mock_qdrant.create_collection.assert_not_called()
+    selector = mock_qdrant.delete.call_args.kwargs["points_selector"]
+    assert selector.filter.must[1].has_id == [stale_id]
+
+
+def test_upload_qa_is_idempotent(mock_qdrant, mocker):
+    from app.services.qdrant_service import upload_qa_to_qdrant, document_point_id
+
+    mocker.patch("app.services.qdrant_service.answer_cache")
+    encode = mocker.patch("app.services.qdrant_service.encode_with_store")
+    qa_pairs = [("Who can apply?", "Early-career researchers.")]
+    mock_qdrant.collection_exists.return_value = True
+    mock_qdrant.scroll.return_value = (
+        [MagicMock(id=document_point_id("faq.pdf", "Who can apply?\nEarly-career researchers."))], None
+    )
+
+    counts = upload_qa_to_qdrant(qa_pairs, "faq.pdf", "faq_vectors", MagicMock())
+
+    assert counts == {"upserted": 0, "deleted": 0, "unchanged": 1}
+    encode.assert_not_called()
+    mock_qdrant.upsert.assert_not_called()
+    mock_qdrant.delete.assert_not_called()
+
+def test_collection_profiles_configure_creation_and_search(mock_qdrant, mocker):
+    from app.services import qdrant_service
+    from app.services.collection_profiles import PROFILES
+    mocker.patch.object(qdrant_service, "get_profile", return_value=PROFILES["low_memory"])
+    mock_qdrant.collection_exists.return_value = False
+
+    qdrant_service.ensure_qdrant_collection(384, "details_vectors")
+
+    kwargs = mock_qdrant.create_collection.call_args.kwargs
+    assert kwargs["vectors_config"].on_disk is True
+    assert kwargs["quantization_config"].scalar.type == "int8"
+    assert kwargs["on_disk_payload"] is True
+    assert kwargs["hnsw_config"].m == 16
+    indexed = [call.kwargs["field_name"] for call in mock_qdrant.create_payload_index.call_args_list]
+    assert indexed == ["pdf_id", "source"]
+
+    qdrant_service.search_collection("details_vectors", [0.1, 0.2], 3)
+    search_params = mock_qdrant.search.call_args.kwargs["search_params"]
+    assert search_params.hnsw_ef == 64
+    assert search_params.quantization.rescore is True
+
+def test_apply_collection_profile_only_updates_differences(mock_qdrant, mocker):
+    from app.services import qdrant_service
+    from app.services.collection_profiles import PROFILES
+    mocker.patch.object(qdrant_service, "get_profile", return_value=PROFILES["low_latency"])
+    config = mock_qdrant.get_collection.return_value.config
+    config.hnsw_config.m = 32
+    config.hnsw_config.ef_construct = 100
+    config.params.vectors.on_disk = None
+    config.params.on_disk_payload = False
+
+    assert qdrant_service.apply_collection_profile("faq_vectors") == ["hnsw_config"]
+    assert mock_qdrant.update_collection.call_args.kwargs["hnsw_config"].ef_construct == 200
+
+def test_ensure_collection_survives_concurrent_creators(mocker):
+    from concurrent.futures import ThreadPoolExecutor
+    from qdrant_client import QdrantClient
+    from app.services import qdrant_service
+    mocker.patch.object(qdrant_service, "client", QdrantClient(location=":memory:"))
+    mocker.patch.object(qdrant_service, "_profiled_collections", set())
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        created = list(pool.map(lambda _: qdrant_service.ensure_qdrant_collection(8, "race_vectors"), range(8)))
+    assert created.count(True) == 1
+
+def test_ensure_collection_uses_one_created_by_another_process(mock_qdrant, mocker):
+    from app.services import qdrant_service
+    apply_profile = mocker.patch.object(qdrant_service, "apply_collection_profile")
+    mock_qdrant.collection_exists.side_effect = [False, True]
+    mock_qdrant.create_collection.side_effect = ValueError("Collection race_vectors already exists")
+
+    assert qdrant_service.ensure_qdrant_collection(8, "race_vectors") is False
+    apply_profile.assert_called_once_with("race_vectors")
@@ -36,4 +36,59 @@ def test_query_endpoint(client, mock_supabase, mock_qdrant):
     # Assertions
     assert response.status_code == 200
     assert "Question: What is Python?\nAnswer: Python is a programming language.\nScore: 0.95" in response.json["context"]
-    assert response.json["source"] == "faq_vectors"
\ No newline at end of file
+    assert response.json["source"] == "faq_vectors"
+
+def test_query_stream_endpoint(client, mocker):
+    # Mock every remote dependency of the streaming route
+    mocker.patch("app.routes.query.ToxicityChecker.check_toxicity", return_value=(False, {}))
+    mocker.patch("app.routes.query.generate_embedding", return_value=[0.1, 0.2, 0.3])
+    mocker.patch("app.routes.query.search_with_fallback", return_value=(
+        [MagicMock(payload={"question": "What is Python?", "answer": "Python is a programming language."}, score=0.95)],
+        "faq_vectors"
+    ))
+    mocker.patch("app.routes.query.stream_llm_response", return_value=iter(["Python ", "is a language."]))
+    mock_logger = mocker.patch("app.routes.query.logger")
+    mock_logger.get_or_create_session.return_value = "5678"
+
+    response = client.post(
+        "/query/stream",
+        json={"user_query": "Test query"},
+        headers={"X-User-ID": "1234", "X-Session-ID": "5678"}
+    )
+    body = response.get_data(as_text=True)
+    response.close()
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    # Metadata arrives before the first token, the final answer last
+    events = [frame.split("\n")[0] for frame in body.strip().split("\n\n")]
+    assert events == ["event: meta", "event: token", "event: token", "event: done"]
+    assert '"source": "faq_vectors"' in body
+    assert '"answer": "Python is a language."' in body
+
+    # Logging happens after the stream has been consumed and closed
+    mock_logger.log_interaction.assert_called_once()
+    assert mock_logger.log_interaction.call_args.kwargs["response"] == "Python is a language."
+    assert "llm" in mock_logger.log_interaction.call_args.kwargs["timings"]["stages_ms"]
+
+
+def test_query_flagged_input_cancels_pipeline(client, mocker):
+    # Moderation flags the query; nothing downstream of retrieval may run
+    mocker.patch("app.routes.query.ToxicityChecker.check_toxicity", return_value=(True, {"hate": True}))
+    mocker.patch("app.routes.query.generate_embedding", return_value=[0.1, 0.2, 0.3])
+    mocker.patch("app.routes.query.search_with_fallback")
+    mock_llm = mocker.patch("app.routes.query.get_llm_response")
+    mock_logger = mocker.patch("app.routes.query.logger")
+
+    response = client.post(
+        "/query",
+        json={"user_query": "Test query"},
+        headers={"X-User-ID": "1234", "X-Session-ID": "5678"}
+    )
+
+    assert response.status_code == 200
+    assert response.json["answer"] == "Your query contains inappropriate content and cannot be processed."
+    mock_llm.assert_not_called()
+    mock_logger.get_or_create_session.assert_not_called()
+    mock_logger.log_interaction.assert_not_called()
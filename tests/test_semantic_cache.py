@@ -0,0 +1,37 @@
+from app.services.semantic_cache import SemanticAnswerCache
+
+ENTRY = {"answer": "No, employment is not required.", "context": ["Text: ..."], "source": "faq_vectors"}
+
+def test_lookup_hits_above_threshold(tmp_path):
+    cache = SemanticAnswerCache(threshold=0.95, generation_path=str(tmp_path / "marker"))
+    cache.store([1.0, 0.0, 0.0], ENTRY)
+
+    hit = cache.lookup([0.99, 0.05, 0.0])
+    assert hit["answer"] == ENTRY["answer"]
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_oldest_entry_evicted_when_full(tmp_path):
+    cache = SemanticAnswerCache(max_entries=2, generation_path=str(tmp_path / "marker"))
+    cache.store([1.0, 0.0, 0.0], {**ENTRY, "answer": "first"})
+    cache.store([0.0, 1.0, 0.0], {**ENTRY, "answer": "second"})
+    cache.store([0.0, 0.0, 1.0], {**ENTRY, "answer": "third"})
+
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    assert cache.lookup([0.0, 0.0, 1.0])["answer"] == "third"
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = SemanticAnswerCache(ttl=0, generation_path=str(tmp_path / "marker"))
+    cache.store([1.0, 0.0, 0.0], ENTRY)
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+
+def test_invalidate_reaches_other_workers(tmp_path):
+    marker = str(tmp_path / "marker")
+    worker_a = SemanticAnswerCache(generation_path=marker)
+    worker_b = SemanticAnswerCache(generation_path=marker)
+    worker_b.store([1.0, 0.0, 0.0], ENTRY)
+
+    # An ingestion in worker A invalidates the cache in worker B too
+    worker_a.invalidate()
+    assert worker_b.lookup([1.0, 0.0, 0.0]) is None
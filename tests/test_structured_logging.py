@@ -0,0 +1,86 @@
+import io
+import json
+import logging
+import queue
+from logging.handlers import QueueListener
+from app.services.structured_logging import (
+    NonBlockingQueueHandler, RequestContextFilter, JsonFormatter, RequestContext, request_context,
+    use_request_context
+)
+
+
+def json_logger(name, max_field_chars=40):
+    """Logger writing JSON lines to a buffer through the queue handler."""
+    log_queue = queue.Queue(100)
+    handler = NonBlockingQueueHandler(log_queue, max_field_chars=max_field_chars)
+    handler.addFilter(RequestContextFilter())
+    output = io.StringIO()
+    stream_handler = logging.StreamHandler(output)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, stream_handler)
+
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger, listener, output
+
+
+def records(listener, output):
+    listener.start()
+    listener.stop()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_records_are_json_with_request_id_and_truncated_fields():
+    logger, listener, output = json_logger("test.structured.json")
+
+    with request_context("req-1"):
+        logger.info("Answer was %s", "x" * 100, extra={"counts": {"upserted": 3}, "reply": "y" * 100})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("Failed", exc_info=True)
+
+    first, second = records(listener, output)
+    assert first["level"] == "INFO" and first["request_id"] == "req-1"
+    assert first["msg"].endswith("... [111 chars]") and len(first["msg"]) < 70
+    assert first["counts"] == {"upserted": 3}
+    assert first["reply"].startswith("y" * 40)
+    assert "request_id" not in second and "ValueError: boom" in second["exc"]
+
+
+def test_debug_records_follow_the_request_sample():
+    logger, listener, output = json_logger("test.structured.sample")
+
+    with use_request_context(RequestContext("skipped", sampled=False)):
+        logger.debug("dropped")
+        logger.warning("kept")
+    with use_request_context(RequestContext("sampled", sampled=True)):
+        logger.debug("kept too")
+
+    assert [record["msg"] for record in records(listener, output)] == ["kept", "kept too"]
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    logger = logging.getLogger("test.structured.full")
+    logger.handlers = [handler]
+    logger.propagate = False
+
+    for _ in range(3):
+        logger.warning("burst")
+    assert handler.dropped == 2
+
+
+def test_flask_requests_get_a_request_id(monkeypatch):
+    from app import create_app
+
+    client = create_app().test_client()
+    assert client.get("/debug", headers={"X-Request-ID": "abc123"}).headers["X-Request-ID"] == "abc123"
+    assert len(client.get("/debug").headers["X-Request-ID"]) == 32
+
+    # Ids that could forge log lines or bloat headers are replaced
+    for unsafe in ['abc", "level": "ERROR', "a b", "x" * 65]:
+        request_id = client.get("/debug", headers={"X-Request-ID": unsafe}).headers["X-Request-ID"]
+        assert request_id != unsafe and len(request_id) == 32
@@ -1,3 +1,4 @@
+import time
 from app.services.supabase_logging import SupabaseLogger
 from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, ANY
@@ -145,4 +146,133 @@ def test_log_interaction_invalid_input(mock_supabase):
             prompt="Hello?",
             response="Hi!"
         )
-    print("[DEBUG] Test passed: Invalid input handled successfully.")
\ No newline at end of file
+    print("[DEBUG] Test passed: Invalid input handled successfully.")
+
+def test_log_interaction_async_mode_batches_rows(mock_supabase, monkeypatch, tmp_path):
+    monkeypatch.setenv("SUPABASE_LOG_SPOOL_PATH", str(tmp_path / "spool.sqlite3"))
+    monkeypatch.setenv("SUPABASE_LOG_FLUSH_INTERVAL", "60")
+    logger = SupabaseLogger(supabase_client=mock_supabase, async_mode=True)
+
+    for prompt in ["Hello?", "Anyone there?"]:
+        logger.log_interaction(user_id="user-123", session_id="session-456", prompt=prompt, response="Hi!")
+
+    # Nothing touches Supabase on the request path
+    mock_supabase.table.return_value.select.assert_not_called()
+    mock_supabase.table.return_value.insert.assert_not_called()
+
+    logger.flush()
+
+    # Both rows go out in a single bulk insert
+    mock_supabase.table.return_value.insert.assert_called_once()
+    rows = mock_supabase.table.return_value.insert.call_args.args[0]
+    assert [row["prompt"] for row in rows] == ["Hello?", "Anyone there?"]
+    logger.writer.close()
+
+
+def test_log_interaction_async_mode_spools_when_unreachable(mock_supabase, monkeypatch, tmp_path):
+    monkeypatch.setenv("SUPABASE_LOG_SPOOL_PATH", str(tmp_path / "spool.sqlite3"))
+    monkeypatch.setenv("SUPABASE_LOG_FLUSH_INTERVAL", "60")
+    logger = SupabaseLogger(supabase_client=mock_supabase, async_mode=True)
+    insert = mock_supabase.table.return_value.insert
+
+    # Supabase is down: the row is kept on disk instead of being lost
+    insert.side_effect = Exception("connection refused")
+    logger.log_interaction(user_id="user-123", session_id="session-456", prompt="Hello?", response="Hi!")
+    logger.flush()
+    assert insert.call_count == 1
+
+    # Supabase is back: the next flush replays the spooled row
+    insert.side_effect = None
+    insert.reset_mock()
+    logger.log_interaction(user_id="user-123", session_id="session-456", prompt="Still there?", response="Yes!")
+    logger.flush()
+
+    inserted = [row["prompt"] for call in insert.call_args_list for row in call.args[0]]
+    assert inserted == ["Still there?", "Hello?"]
+    logger.writer.close()
+
+
+def test_spool_rows_are_replayed_by_one_worker_only(tmp_path, mocker):
+    import sqlite3
+    from app.services import interaction_writer
+    from app.services.interaction_writer import InteractionWriter
+    path = str(tmp_path / "spool.sqlite3")
+    inserted = []
+    workers = [InteractionWriter(insert_rows=inserted.extend, spool_path=path, flush_interval=60) for _ in range(2)]
+    workers[0]._spool([{"prompt": "Hello?"}, {"prompt": "Anyone there?"}])
+
+    # A claim held by another live worker is respected; a dead worker's claim is released
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE spool SET claimed_by = 999999, claimed_at = ?", (time.time(),))
+    mocker.patch.object(interaction_writer, "_process_alive", return_value=True)
+    workers[1].flush()
+    assert inserted == []
+
+    mocker.patch.object(interaction_writer, "_process_alive", return_value=False)
+    workers[1].flush()
+    workers[0].flush()
+    assert [row["prompt"] for row in inserted] == ["Hello?", "Anyone there?"]
+    for worker in workers:
+        worker.close()
+
+
+def test_cached_session_skips_supabase_round_trips(mock_supabase):
+    logger = SupabaseLogger(supabase_client=mock_supabase)
+
+    active_time = (datetime.now(timezone.utc) - timedelta(minutes=10)).isoformat()
+    mock_response = MagicMock()
+    mock_response.data = [{"session_id": "active-session", "last_active": active_time, "created_at": active_time}]
+    mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value = mock_response
+
+    # First message validates the session against Supabase
+    logger.get_or_create_session(user_id="user-123", session_id="active-session")
+    assert mock_supabase.table.return_value.select.call_count == 1
+    assert mock_supabase.table.return_value.update.call_count == 1
+
+    # Follow-up messages are answered from the cache
+    for _ in range(3):
+        assert logger.get_or_create_session(user_id="user-123", session_id="active-session") == "active-session"
+    logger.log_interaction(user_id="user-123", session_id="active-session", prompt="Hello?", response="Hi!")
+
+    assert mock_supabase.table.return_value.select.call_count == 1
+    assert mock_supabase.table.return_value.update.call_count == 1
+    mock_supabase.table.return_value.insert.assert_called_once()
+
+
+def test_cached_session_expires_after_six_hours(mock_supabase):
+    logger = SupabaseLogger(supabase_client=mock_supabase)
+    logger.session_cache.set("old-session", {
+        "created_at": datetime.now(timezone.utc) - timedelta(hours=6, minutes=1),
+        "last_active_written": 0
+    })
+
+    session_id = logger.get_or_create_session(user_id="user-123", session_id="old-session")
+
+    assert session_id != "old-session"
+    mock_supabase.table.return_value.insert.assert_called_once()
+
+
+def test_async_logger_checks_sessions_like_the_sync_logger():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from app.services.supabase_logging import AsyncSupabaseLogger
+    client = MagicMock()
+    execute = AsyncMock(return_value=MagicMock(data=[]))
+    client.table.return_value.select.return_value.eq.return_value.execute = execute
+    client.table.return_value.insert.return_value.execute = AsyncMock(return_value=MagicMock(data=[{}]))
+    logger = AsyncSupabaseLogger(supabase_client=client)
+
+    async def run():
+        # Unknown, uncached session: rejected before anything is inserted
+        with pytest.raises(ValueError, match="does not exist"):
+            await logger.log_interaction(user_id="user-123", session_id="missing", prompt="Hello?", response="Hi!")
+        client.table.return_value.insert.assert_not_called()
+
+        # A session created by this worker is cached and needs no check
+        session_id = await logger.get_or_create_session(user_id="user-123")
+        execute.reset_mock()
+        await logger.log_interaction(user_id="user-123", session_id=session_id, prompt="Hello?", response="Hi!")
+        execute.assert_not_called()
+        assert client.table.return_value.insert.call_count == 2
+
+    asyncio.run(run())